@@ -1,8 +1,13 @@
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from core import local_db
+from core.session_cache import session_cache
+from core.tracing import tracer
+from typing import Optional
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 security = HTTPBearer(auto_error=False)
 
 async def get_current_user(auth: HTTPAuthorizationCredentials = Security(security)):
@@ -10,22 +15,71 @@ async def get_current_user(auth: HTTPAuthorizationCredentials = Security(securit
     FastAPI dependency to get the current user from the session token.
     Supports both Desktop (Local DB) and Environment-fallbacks.
     """
+    return _user_for_token(auth.credentials if auth else None)
+
+
+async def get_stream_user(token: Optional[str] = None, auth: HTTPAuthorizationCredentials = Security(security)):
+    """
+    get_current_user for push endpoints: EventSource cannot send headers, so
+    the session token may also come as a `token` query parameter.
+    """
+    return _user_for_token(auth.credentials if auth and auth.credentials else token)
+
+
+def _user_for_token(token: Optional[str]) -> dict:
     if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
-        if not auth or not auth.credentials:
-            print("[AUTH] FAILED: No Bearer token provided.")
+        if not token:
+            logger.debug("Auth failed: no Bearer token provided.")
             raise HTTPException(status_code=401, detail="Authentication required. Please login.")
             
-        token_prefix = auth.credentials[:8]
-        print(f"[AUTH] Resolving session for token: {token_prefix}...")
-        session = local_db.get_session(auth.credentials)
+        token_prefix = token[:8]
+        logger.debug("Resolving session for token: %s...", token_prefix)
+        session = session_cache.get(token)
         
         if not session:
-            print(f"[AUTH] FAILED: Invalid or expired session token: {token_prefix}...")
+            logger.info("Auth failed: invalid or expired session token %s...", token_prefix)
             raise HTTPException(status_code=401, detail="Invalid or expired session. Please login again.")
         
         user_id = session["user_id"]
-        print(f"[AUTH] SUCCESS: Resolved UserID: {user_id}")
+        logger.debug("Resolved user %s", user_id)
+        tracer.set_root(user_id=user_id)  # the request's trace is now this user's
         return {"id": user_id}
         
     # Restricted mode for non-desktop environments
     raise HTTPException(status_code=403, detail="API access limited to local desktop instances.")
+
+
+class RequestContext:
+    """
+    Per-request view of the caller's workspace and bots. Each is resolved at
+    most once per request (through the shared core.registry cache), so a
+    handler and the helpers it calls don't repeat the lookups.
+    """
+
+    def __init__(self, user: dict):
+        self.user = user
+        self.user_id = user["id"]
+        self._workspace_id = None
+        self._bots = None
+
+    @property
+    def workspace_id(self) -> str:
+        if self._workspace_id is None:
+            from core.bot_manager import _get_active_workspace_id
+            self._workspace_id = _get_active_workspace_id(user_id=self.user_id)
+        return self._workspace_id
+
+    @property
+    def bots(self) -> dict:
+        if self._bots is None:
+            from core import bot_manager
+            self._bots = bot_manager.get_bots(user_id=self.user_id)
+        return self._bots
+
+    def get_bot(self, bot_id: str):
+        return self.bots.get(bot_id)
+
+
+async def get_request_context(user: dict = Depends(get_current_user)) -> RequestContext:
+    """FastAPI dependency: the current user plus lazily resolved workspace/bot data."""
+    return RequestContext(user)
@@ -18,13 +18,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Request Tracing ---
+# Root span per API call; nested spans (prompt assembly, RAG, completions,
+# tools, DB writes) attach to it. See core/tracing.py and /api/debug/traces.
+from core.tracing import tracer
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    path = request.url.path
+    if not path.startswith("/api/") or path.startswith(("/api/stream", "/api/debug")):
+        return await call_next(request)
+    with tracer.span(f"{request.method} {path}", root=True, method=request.method, path=path) as sp:
+        response = await call_next(request)
+        if sp is not None:
+            sp.set("status_code", response.status_code)
+            response.headers["X-Trace-Id"] = sp.trace_id
+        return response
+
+# --- Background services ---
+@app.on_event("startup")
+async def restore_background_work():
+    """Re-arm scheduled tasks and the delay timers of flow runs parked when the app last stopped."""
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
+        from core.flow_runner import flow_runner
+        from core.task_scheduler import task_scheduler
+        flow_runner.restore_parked()
+        task_scheduler.start()
+
 # --- Health Check ---
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
 # --- Include API Routers ---
-from api.routes import auth, bots, settings, remote, chat, channels, account, tools, templates, favorites, documents, history, knowledge, analytics, scheduler, reports, flows, integrations, macros, marketplace, flow_templates, swarm, activity, webhooks, bot_portable, memory_search, scheduler_routes, vision_chat, dashboard_home, rag_chat, notifications as notif_routes, pinned_prompts, chat_export, theme, vault, onboarding, bot_router, wallet
+from api.routes import auth, bots, settings, remote, chat, channels, account, tools, templates, favorites, documents, history, knowledge, analytics, scheduler, reports, flows, integrations, macros, marketplace, flow_templates, swarm, activity, webhooks, bot_portable, memory_search, scheduler_routes, vision_chat, dashboard_home, rag_chat, notifications as notif_routes, pinned_prompts, chat_export, theme, vault, onboarding, bot_router, wallet, stream, debug
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(bots.router, prefix="/api/bots", tags=["Bot Management"])
@@ -65,6 +92,8 @@ app.include_router(vault.router, prefix="/api", tags=["Local Vault"])
 app.include_router(onboarding.router, prefix="/api", tags=["Onboarding"])
 app.include_router(bot_router.router, prefix="/api", tags=["Bot Router"])
 app.include_router(wallet.router, prefix="/api/wallet", tags=["Wallet"])
+app.include_router(stream.router, prefix="/api", tags=["Event Stream"])
+app.include_router(debug.router, prefix="/api/debug", tags=["Debug"])
 
 # --- Serve Frontend SPA ---
 # Mount the static directory for CSS/JS assets
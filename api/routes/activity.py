@@ -7,3 +7,9 @@ router = APIRouter()
 async def get_activity(limit: int = 50):
     """Return recent system activity events."""
     return {"events": activity_feed.get_recent(limit)}
+
+@router.get("/activity/bus")
+async def get_bus_metrics():
+    """Per-topic EventBus metrics: publish rate, drops, handler latency and queue depth."""
+    from core.bus import bus
+    return bus.get_metrics()
@@ -55,4 +55,7 @@ async def import_bot(request: Request):
     )
     conn.commit()
 
+    from core.registry import registry
+    registry.invalidate("import_bot", bots_only=True)
+
     return {"status": "imported", "bot_id": new_id, "name": body["name"]}
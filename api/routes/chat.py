@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+import json
 import os
+import uuid
 
 # from core.llm_engine import WolfEngine
 from core import bot_manager
-from api.deps import get_current_user
+from core.tracing import span
+from api.deps import get_current_user, get_request_context, RequestContext
+from api.routes.stream import sse_pump
 
 router = APIRouter()
 
@@ -25,54 +29,60 @@ class WarRoomRequest(BaseModel):
     sub_bot_ids: List[str]
     messages: List[ChatMessage]
     chat_id: Optional[str] = None
+    max_parallel: int = 4            # sub-agents working at the same time
+    agent_timeout: float = 180.0     # seconds each sub-agent task may take
 
 @router.post("/send")
-async def send_message(req: ChatRequest, user: dict = Depends(get_current_user)):
+async def send_message(req: ChatRequest, ctx: RequestContext = Depends(get_request_context)):
     """Send a chat message, get AI response with tool support"""
     if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
         raise HTTPException(status_code=403, detail="Route restricted to Desktop environment.")
     
+    user = ctx.user
     try:
-        bots = bot_manager.get_bots(user_id=user["id"])
-        if req.bot_id not in bots:
+        bot = ctx.get_bot(req.bot_id)
+        if bot is None:
              raise HTTPException(status_code=404, detail="Bot not found.")
-
-        bot = bots[req.bot_id]
         
         # Convert pydantic messages to dicts
         messages = [m.dict() for m in req.messages]
         
-        # Determine the final system prompt with document context
-        system_prompt = bot["prompt"]
-        if req.doc_id:
-            from core import local_db
-            doc_content = local_db.get_document_content(req.doc_id)
-            if doc_content:
-                system_prompt = f"The user has uploaded a document for context.\n\n<document_context>\n{doc_content}\n</document_context>\n\n" + system_prompt
-        
-        # --- PHASE 13: Knowledge Base (RAG) Auto-Context Injection ---
-        try:
-            from core import local_db as _db
-            from core.rag_engine import search_chunks, format_context_for_prompt
+        with span("chat.prompt_assembly", bot_id=req.bot_id, doc_id=req.doc_id):
+            # Determine the final system prompt with document context
+            system_prompt = bot["prompt"]
+            if req.doc_id:
+                from core import local_db
+                doc_content = local_db.get_document_content(req.doc_id)
+                if doc_content:
+                    system_prompt = f"The user has uploaded a document for context.\n\n<document_context>\n{doc_content}\n</document_context>\n\n" + system_prompt
             
-            # Get the user's latest message as the search query
-            user_query = ""
-            for m in reversed(messages):
-                if m.get("role") == "user":
-                    user_query = m.get("content", "")
-                    break
-            
-            if user_query:
-                all_chunks = _db.get_knowledge_chunks_for_bot(req.bot_id)
-                if all_chunks:
-                    relevant = search_chunks(user_query, all_chunks, top_k=5)
-                    if relevant:
-                        kb_context = format_context_for_prompt(relevant)
-                        if kb_context:
-                            system_prompt = system_prompt + "\n\n" + kb_context
-        except Exception as kb_err:
-            import logging
-            logging.getLogger(__name__).warning(f"KB injection failed: {kb_err}")
+            # --- PHASE 13: Knowledge Base (RAG) Auto-Context Injection ---
+            try:
+                from core import local_db as _db
+                from core.rag_engine import search_chunks, format_context_for_prompt
+                
+                # Get the user's latest message as the search query
+                user_query = ""
+                for m in reversed(messages):
+                    if m.get("role") == "user":
+                        user_query = m.get("content", "")
+                        break
+                
+                if user_query:
+                    with span("rag.search", bot_id=req.bot_id) as rag_span:
+                        all_chunks = _db.get_knowledge_chunks_for_bot(req.bot_id)
+                        if all_chunks:
+                            relevant = search_chunks(user_query, all_chunks, top_k=5)
+                            if rag_span:
+                                rag_span.set("chunks_scanned", len(all_chunks))
+                                rag_span.set("chunks_matched", len(relevant))
+                            if relevant:
+                                kb_context = format_context_for_prompt(relevant)
+                                if kb_context:
+                                    system_prompt = system_prompt + "\n\n" + kb_context
+            except Exception as kb_err:
+                import logging
+                logging.getLogger(__name__).warning(f"KB injection failed: {kb_err}")
         
         # Initialize the engine with the bot's model and fallbacks
         from core.llm_engine import WolfEngine
@@ -115,7 +125,7 @@ async def send_message(req: ChatRequest, user: dict = Depends(get_current_user))
         # --- PHASE 11: Auto-save Chat History ---
         from core import local_db
         import json
-        ws_id = bot_manager._get_active_workspace_id(user_id=user["id"])
+        ws_id = ctx.workspace_id
         
         # The title is just the first user message (truncated if needed)
         title = "New Chat"
@@ -158,7 +168,9 @@ async def send_warroom_message(req: WarRoomRequest, user: dict = Depends(get_cur
         orchestrator = MultiAgentOrchestrator(
             manager_bot_id=req.manager_bot_id,
             sub_bot_ids=req.sub_bot_ids,
-            user_id=user["id"]
+            user_id=user["id"],
+            max_parallel=req.max_parallel,
+            agent_timeout=req.agent_timeout
         )
         
         # Get the latest user prompt
@@ -181,6 +193,63 @@ async def send_warroom_message(req: WarRoomRequest, user: dict = Depends(get_cur
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Live War Room runs: run_id -> {"user_id", "cancel"}. Cancelling sets the
+# run's event, which the orchestrator and every in-flight LLM call observe.
+_warroom_runs: Dict[str, dict] = {}
+
+
+@router.post("/warroom/stream")
+async def stream_warroom(req: WarRoomRequest, request: Request, user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events version of /warroom/send: status, message, error and
+    token events are pushed as they happen, then a final 'done' event. The
+    first 'started' event carries the run_id for /warroom/{run_id}/cancel;
+    closing the connection cancels the run too.
+    """
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
+        raise HTTPException(status_code=403, detail="Route restricted to Desktop environment.")
+
+    from core.orchestrator import MultiAgentOrchestrator
+    try:
+        orchestrator = MultiAgentOrchestrator(
+            manager_bot_id=req.manager_bot_id,
+            sub_bot_ids=req.sub_bot_ids,
+            user_id=user["id"],
+            max_parallel=req.max_parallel,
+            agent_timeout=req.agent_timeout
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    messages = [m.dict() for m in req.messages]
+    user_prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+    run_id = uuid.uuid4().hex
+
+    def run(push, cancel):
+        _warroom_runs[run_id] = {"user_id": user["id"], "cancel": cancel}
+        push({"type": "started", "run_id": run_id})
+        try:
+            orchestrator.run_war_room(user_prompt, messages[:-1], on_event=push, cancel_event=cancel)
+        except Exception as e:
+            push({"type": "error", "bot_name": "System", "content": str(e)})
+        finally:
+            _warroom_runs.pop(run_id, None)
+        push({"type": "done", "run_id": run_id, "cancelled": cancel.is_set()})
+
+    return sse_pump(run, request, lambda e: e["task_id"] if e["type"] == "token" else None,
+                    thread_name=f"WarRoom-{run_id[:8]}")
+
+
+@router.post("/warroom/{run_id}/cancel")
+async def cancel_warroom(run_id: str, user: dict = Depends(get_current_user)):
+    """Stop a streaming War Room run and its outstanding sub-agent calls."""
+    run = _warroom_runs.get(run_id)
+    if not run or run["user_id"] != user["id"]:
+        raise HTTPException(status_code=404, detail="War Room run not found")
+    run["cancel"].set()
+    return {"status": "success", "cancelled": True}
+
 
 @router.get("/bots")
 async def list_chat_bots(user: dict = Depends(get_current_user)):
@@ -0,0 +1,21 @@
+"""
+Debug routes — in-process traces for finding where request time goes.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from core.tracing import tracer
+from api.deps import get_current_user
+
+router = APIRouter()
+
+@router.get("/traces")
+async def list_traces(limit: int = 20, min_ms: float = 0, order: str = "slowest", user: dict = Depends(get_current_user)):
+    """The caller's recent finished traces; slowest first unless order=recent."""
+    return {"traces": tracer.recent(limit=limit, slowest=(order != "recent"), min_ms=min_ms, user_id=user["id"])}
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, user: dict = Depends(get_current_user)):
+    """Full span list for one of the caller's traces."""
+    trace = tracer.get(trace_id, user_id=user["id"])
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have rotated out of the buffer).")
+    return trace
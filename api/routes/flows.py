@@ -8,7 +8,7 @@ from pydantic import BaseModel
 from typing import Optional
 from core import local_db
 from core.bot_manager import _get_active_workspace_id
-from core.flow_engine import FlowEngine, BLOCK_CATALOG
+from core.flow_engine import BLOCK_CATALOG
 from api.deps import get_current_user
 from fastapi import Depends
 
@@ -35,8 +35,36 @@ async def get_block_catalog():
     return {"blocks": BLOCK_CATALOG}
 
 
+class FlowValidateRequest(BaseModel):
+    flow_data: str
+
+
+@router.post("/validate")
+async def validate_flow(body: FlowValidateRequest, user: dict = Depends(get_current_user)):
+    """Check a flow definition without saving it: errors, template warnings and execution levels."""
+    try:
+        return _validate(body.flow_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def get_flow_cache_stats(user: dict = Depends(get_current_user)):
+    """Entries and hit counts of the shared flow step cache, per block type."""
+    return {"cache": local_db.get_flow_step_cache_stats()}
+
+
 # ─────────── FLOW CRUD ───────────
 
+def _validate(flow_json: str) -> dict:
+    """
+    Compile the flow (warming the plan cache) and report problems. Saving
+    never fails on these so drafts can be kept; running an invalid flow does.
+    """
+    from core.flow_compiler import compile_flow_json
+    return compile_flow_json(flow_json).summary()
+
+
 @router.get("")
 @router.get("/")
 async def list_flows(user: dict = Depends(get_current_user)):
@@ -59,7 +87,8 @@ async def create_flow(body: FlowCreate, user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="flow_data must be valid JSON")
     
     flow_id = local_db.save_flow(ws_id, body.name, body.description, body.flow_data)
-    return {"id": flow_id, "name": body.name, "description": body.description, "flow_data": body.flow_data, "message": "Flow created"}
+    return {"id": flow_id, "name": body.name, "description": body.description, "flow_data": body.flow_data,
+            "message": "Flow created", "validation": _validate(body.flow_data)}
 
 
 @router.get("/{flow_id}")
@@ -97,7 +126,7 @@ async def update_flow(flow_id: str, body: FlowUpdate, user: dict = Depends(get_c
         flow_data=flow_data,
         flow_id=flow_id
     )
-    return {"message": "Flow updated"}
+    return {"message": "Flow updated", "validation": _validate(flow_data)}
 
 
 @router.delete("/{flow_id}")
@@ -135,23 +164,108 @@ async def generate_magic_flow(body: MagicFlowRequest, user: dict = Depends(get_c
         
 # ─────────── FLOW EXECUTION ───────────
 
-@router.post("/{flow_id}/run")
+@router.post("/{flow_id}/run", status_code=202)
 async def run_flow(flow_id: str, user: dict = Depends(get_current_user)):
-    """Execute a flow and return the results."""
+    """Queue a flow run and return its run_id immediately. Poll GET /flows/runs/{run_id} for progress."""
+    from core.flow_runner import flow_runner, QueueFullError
     ws_id = _get_active_workspace_id(user_id=user["id"])
     flow = local_db.get_flow(flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     
+    from core.flow_compiler import compile_flow_json
     try:
-        flow_data = json.loads(flow["flow_data"])
-    except json.JSONDecodeError:
+        plan = compile_flow_json(flow["flow_data"])
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid flow data")
     
-    if not flow_data.get("nodes"):
+    if not plan.nodes:
         raise HTTPException(status_code=400, detail="Flow has no nodes to execute")
+    if not plan.valid:
+        raise HTTPException(status_code=422, detail="Flow is invalid: " + "; ".join(plan.errors))
     
-    engine = FlowEngine(flow_data)
-    result = engine.execute()
-    
-    return result
+    try:
+        run_id = flow_runner.submit(flow_id, ws_id, flow["flow_data"])
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"run_id": run_id, "status": "queued", "position": flow_runner.queue_position(run_id)}
+
+
+@router.get("/queue/metrics")
+async def get_flow_queue_metrics(user: dict = Depends(get_current_user)):
+    """Queue depth, running runs per workspace and outcome counters of the flow runner."""
+    from core.flow_runner import flow_runner
+    return flow_runner.get_metrics()
+
+
+# ─────────── RUN HISTORY ───────────
+
+def _get_owned_run(run_id: str, user_id: str) -> dict:
+    run = local_db.get_flow_run(run_id)
+    if not run or run["workspace_id"] != _get_active_workspace_id(user_id=user_id):
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.get("/{flow_id}/runs")
+async def list_flow_runs(flow_id: str, limit: int = 20, before: Optional[int] = None,
+                         user: dict = Depends(get_current_user)):
+    """Run history for a flow, newest first. Pass `next_cursor` back as `before` for the next page."""
+    from core import flow_runs
+    limit = max(1, min(limit, 100))
+    runs = local_db.get_flow_runs(flow_id, limit=limit, before=before)
+    for run in runs:
+        run["status"] = flow_runs.effective_status(run)
+    next_cursor = runs[-1]["cursor"] if len(runs) == limit else None
+    return {"runs": runs, "next_cursor": next_cursor}
+
+
+@router.get("/runs/{run_id}")
+async def get_flow_run(run_id: str, user: dict = Depends(get_current_user)):
+    """A single run's status. Includes the queue position while queued and the full result once finished."""
+    from core import flow_runs
+    from core.flow_runner import flow_runner
+    run = _get_owned_run(run_id, user["id"])
+    run.pop("flow_data", None)
+    run["status"] = flow_runs.effective_status(run)
+    if run["status"] == "queued":
+        run["position"] = flow_runner.queue_position(run_id)
+    result = flow_runner.get_result(run_id)
+    if result and run["status"] not in ("queued", "running"):
+        run["result"] = result
+    return run
+
+
+@router.get("/runs/{run_id}/steps")
+async def get_flow_run_steps(run_id: str, limit: int = 100, after: Optional[int] = None,
+                             status: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """Step outputs of a run in completion order. Pass `next_cursor` back as `after` for the next page."""
+    _get_owned_run(run_id, user["id"])
+    limit = max(1, min(limit, 500))
+    steps = local_db.get_flow_steps(run_id, limit=limit, after=after, status=status)
+    next_cursor = steps[-1]["cursor"] if len(steps) == limit else None
+    return {"steps": steps, "next_cursor": next_cursor}
+
+
+@router.post("/runs/{run_id}/resume", status_code=202)
+async def resume_flow_run(run_id: str, user: dict = Depends(get_current_user)):
+    """Queue a resume of a failed or interrupted run; steps that already succeeded are not re-executed."""
+    from core.flow_runner import flow_runner, QueueFullError
+    run = _get_owned_run(run_id, user["id"])
+    try:
+        flow_runner.submit_resume(run)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"run_id": run_id, "status": "queued", "position": flow_runner.queue_position(run_id)}
+
+
+@router.post("/runs/{run_id}/cancel")
+async def cancel_flow_run(run_id: str, user: dict = Depends(get_current_user)):
+    """Cancel a queued run, or stop a running one from starting further steps."""
+    from core.flow_runner import flow_runner
+    _get_owned_run(run_id, user["id"])
+    if not flow_runner.cancel(run_id):
+        raise HTTPException(status_code=409, detail="Run is not queued or running.")
+    return {"run_id": run_id, "message": "Cancellation requested"}
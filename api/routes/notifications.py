@@ -1,33 +1,34 @@
 """
 Phase 14 — Notification Center API Routes
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from core.notifications import notifications
+from api.deps import get_current_user
 
 router = APIRouter()
 
 @router.get("/notifications")
-async def get_notifications(limit: int = 50):
+async def get_notifications(limit: int = 50, user: dict = Depends(get_current_user)):
     return {
-        "unread_count": notifications.get_unread_count(),
-        "notifications": notifications.get_all(limit)
+        "unread_count": notifications.get_unread_count(user["id"]),
+        "notifications": notifications.get_all(limit, user_id=user["id"])
     }
 
 @router.get("/notifications/count")
-async def get_unread_count():
-    return {"unread_count": notifications.get_unread_count()}
+async def get_unread_count(user: dict = Depends(get_current_user)):
+    return {"unread_count": notifications.get_unread_count(user["id"])}
 
 @router.post("/notifications/read-all")
-async def mark_all_read():
-    notifications.mark_all_read()
+async def mark_all_read(user: dict = Depends(get_current_user)):
+    notifications.mark_all_read(user["id"])
     return {"status": "all_read"}
 
 @router.post("/notifications/{notif_id}/read")
-async def mark_read(notif_id: int):
-    notifications.mark_read(notif_id)
+async def mark_read(notif_id: int, user: dict = Depends(get_current_user)):
+    notifications.mark_read(notif_id, user_id=user["id"])
     return {"status": "read"}
 
 @router.delete("/notifications")
-async def clear_notifications():
-    notifications.clear()
+async def clear_notifications(user: dict = Depends(get_current_user)):
+    notifications.clear(user["id"])
     return {"status": "cleared"}
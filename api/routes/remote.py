@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Union
 import os
 
+from api.deps import get_current_user
 from core import local_db
 from core.bot_manager import _get_active_workspace_id
 
@@ -18,6 +19,7 @@ class SSHConfigRequest(BaseModel):
     user: str = "ubuntu"
     password: Optional[str] = ""
     key_content: Optional[str] = ""
+    group: Optional[str] = ""
 
 class SSHTestRequest(BaseModel):
     host: str
@@ -26,6 +28,12 @@ class SSHTestRequest(BaseModel):
     password: Optional[str] = ""
     key_content: Optional[str] = ""
 
+class FanoutRequest(BaseModel):
+    command: str
+    hosts: Union[List[str], str, None] = "all"   # names, hosts, ids or groups; "all" = every server
+    max_parallel: int = 16
+    timeout: float = 60                          # per-host, seconds
+
 @router.get("/servers")
 async def get_ssh_servers():
     """Load all saved SSH configurations for the current workspace"""
@@ -44,6 +52,7 @@ async def get_ssh_servers():
                 "host": s.get("host", ""),
                 "port": s.get("port", "22"),
                 "user": s.get("user", "ubuntu"),
+                "group": s.get("group", ""),
                 "has_password": bool(s.get("password", "")),
                 "has_key": bool(s.get("key_content", ""))
             })
@@ -72,7 +81,8 @@ async def save_ssh_server(req: SSHConfigRequest):
             "port": req.port,
             "user": req.user,
             "password": req.password or "",
-            "key_content": req.key_content or ""
+            "key_content": req.key_content or "",
+            "group": (req.group or "").strip()
         }
         
         # Preserve old password/keys if not provided in update
@@ -167,3 +177,69 @@ async def test_ssh_connection(req: SSHTestRequest):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Connection failed: {e}")
+
+
+@router.get("/pool")
+async def get_ssh_pool_metrics(user: dict = Depends(get_current_user)):
+    """Pooled SSH connections used by the remote command tool."""
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
+        raise HTTPException(status_code=403, detail="Route restricted to Desktop environment.")
+    from core.ssh_pool import ssh_pool
+    return ssh_pool.get_metrics()
+
+
+def _fanout_servers(req: FanoutRequest, user_id: str) -> list:
+    from core.ssh_fanout import select_servers
+    servers = local_db.get_workspace_ssh(_get_active_workspace_id(user_id=user_id))
+    if not servers:
+        raise HTTPException(status_code=400, detail="No saved servers.")
+    try:
+        return select_servers(servers, req.hosts)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+
+@router.post("/fanout")
+def run_fanout(req: FanoutRequest, user: dict = Depends(get_current_user)):
+    """Run a command on a group of saved servers concurrently and return per-host results."""
+    # Plain `def`: FastAPI runs it in its threadpool while the hosts run.
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
+        raise HTTPException(status_code=403, detail="Route restricted to Desktop environment.")
+    from core.ssh_fanout import fan_out
+    servers = _fanout_servers(req, user["id"])
+    try:
+        return {"status": "success",
+                **fan_out(req.command, servers, max_parallel=req.max_parallel, timeout=req.timeout)}
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+
+@router.post("/fanout/stream")
+async def stream_fanout(req: FanoutRequest, request: Request, user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events version of /fanout: host_started, output and host_done
+    events per host as they happen, then 'done' with the aggregated result
+    (stdout/stderr omitted; they were streamed). Closing the connection stops
+    the hosts that are still running.
+    """
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
+        raise HTTPException(status_code=403, detail="Route restricted to Desktop environment.")
+    from core.ssh_fanout import fan_out
+
+    servers = _fanout_servers(req, user["id"])
+    if not req.command.strip():
+        raise HTTPException(status_code=400, detail="Command is required.")
+
+    def run(push, cancel):
+        try:
+            result = fan_out(req.command, servers, max_parallel=req.max_parallel, timeout=req.timeout,
+                             on_event=push, cancel_event=cancel)
+            for host in result["hosts"]:
+                host.pop("stdout", None)
+                host.pop("stderr", None)
+            push({"type": "done", **result})
+        except Exception as e:
+            push({"type": "error", "content": str(e)})
+
+    return sse_pump(run, request, lambda e: (e["host"], e["stream"]) if e["type"] == "output" else None,
+                    thread_name="SSHFanout")
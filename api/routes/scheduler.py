@@ -5,13 +5,14 @@ Create, manage, and execute recurring AI tasks.
 """
 
 import os
-import threading
 import logging
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
 from core import local_db
 from core.bot_manager import _get_active_workspace_id
+from core.task_executor import task_executor, QueueFullError
+from core.task_scheduler import task_scheduler, validate_task, DEFAULT_KEEP_DAYS, DEFAULT_KEEP_RESULTS
 
 from api.deps import get_current_user
 
@@ -27,6 +28,12 @@ class CreateTaskRequest(BaseModel):
     prompt: str
     schedule_type: str = "interval"  # "interval" or "cron"
     schedule_value: str = "60"       # minutes for interval, cron expression for cron
+    timezone: Optional[str] = None   # IANA name for cron schedules; system local time when empty
+    misfire_policy: str = "skip"     # "skip" or "catch_up" for runs missed while the app was closed
+    max_instances: int = 1           # runs of this task allowed at the same time
+    coalesce: bool = True            # merge fires that arrive while a run is already waiting
+    keep_results: Optional[int] = None  # results kept per task (default 200)
+    keep_days: Optional[int] = None     # days results are kept (default 30)
 
 
 class UpdateTaskRequest(BaseModel):
@@ -35,6 +42,36 @@ class UpdateTaskRequest(BaseModel):
     schedule_type: Optional[str] = None
     schedule_value: Optional[str] = None
     is_active: Optional[int] = None
+    timezone: Optional[str] = None
+    misfire_policy: Optional[str] = None
+    max_instances: Optional[int] = None
+    coalesce: Optional[bool] = None
+    keep_results: Optional[int] = None
+    keep_days: Optional[int] = None
+
+
+def _to_cron_expr(schedule_type: str, schedule_value: str) -> str:
+    if schedule_type == "interval":
+        if not str(schedule_value).strip().isdigit():
+            raise ValueError("Interval must be a whole number of minutes.")
+        return f"every_{int(schedule_value)}m"
+    if schedule_type == "cron":
+        return schedule_value
+    raise ValueError("schedule_type must be 'interval' or 'cron'.")
+
+
+def _task_view(task: dict) -> dict:
+    """Expose the stored cron_expr/enabled fields in the shape the UI uses."""
+    expr = task.get("cron_expr") or ""
+    is_interval = expr.startswith("every_") and expr.endswith("m")
+    return {
+        **task,
+        "bot_id": task.get("action_id") if task.get("action_type") == "bot" else None,
+        "schedule_type": "interval" if is_interval else "cron",
+        "schedule_value": expr[6:-1] if is_interval else expr,
+        "is_active": task.get("enabled", 0),
+        "next_run": task_scheduler.next_run(task["id"]) or task.get("next_run"),
+    }
 
 
 # ─────────── CRUD ───────────
@@ -44,21 +81,30 @@ async def create_task(req: CreateTaskRequest, user: dict = Depends(get_current_u
     """Create a new scheduled task."""
     if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
         raise HTTPException(status_code=403, detail="Restricted to Desktop.")
+    try:
+        cron_expr = _to_cron_expr(req.schedule_type, req.schedule_value)
+        validate_task(cron_expr, req.timezone, req.misfire_policy, max_instances=req.max_instances,
+                      keep_results=req.keep_results, keep_days=req.keep_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         ws_id = _get_active_workspace_id(user_id=user["id"])
         task_id = local_db.create_scheduled_task(
             ws_id=ws_id,
-            bot_id=req.bot_id,
             name=req.name,
+            cron_expr=cron_expr,
+            action_type="bot",
+            action_id=req.bot_id,
             prompt=req.prompt,
-            schedule_type=req.schedule_type,
-            schedule_value=req.schedule_value
+            timezone=req.timezone,
+            misfire_policy=req.misfire_policy,
+            max_instances=req.max_instances,
+            coalesce=req.coalesce,
+            keep_results=req.keep_results,
+            keep_days=req.keep_days
         )
-        
-        # Register with the scheduler if it's running
-        _register_task_with_scheduler(task_id)
-        
-        return {"status": "success", "task_id": task_id, "message": f"✅ Task '{req.name}' created."}
+        return {"status": "success", "task_id": task_id, "next_run": task_scheduler.next_run(task_id),
+                "message": f"✅ Task '{req.name}' created."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -69,20 +115,49 @@ async def list_tasks(user: dict = Depends(get_current_user)):
     try:
         ws_id = _get_active_workspace_id(user_id=user["id"])
         tasks = local_db.get_scheduled_tasks(ws_id)
-        return {"status": "success", "tasks": tasks}
+        return {"status": "success", "tasks": [_task_view(t) for t in tasks]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/status")
+async def scheduler_status(user: dict = Depends(get_current_user)):
+    """Scheduler counters, the next due fire time and execution queue metrics."""
+    return {"status": "success", "scheduler": task_scheduler.get_metrics(),
+            "executor": task_executor.get_metrics()}
+
+
 @router.put("/tasks/{task_id}")
 async def update_task(task_id: str, req: UpdateTaskRequest, user: dict = Depends(get_current_user)):
     """Update a scheduled task."""
+    task = local_db.get_scheduled_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    fields = {k: v for k, v in req.dict().items() if v is not None}
+    updates = {}
+    try:
+        if "schedule_value" in fields or "schedule_type" in fields:
+            current = _task_view(task)
+            updates["cron_expr"] = _to_cron_expr(fields.get("schedule_type", current["schedule_type"]),
+                                                 fields.get("schedule_value", current["schedule_value"]))
+        for key in ("name", "prompt", "timezone", "misfire_policy", "max_instances", "keep_results", "keep_days"):
+            if key in fields:
+                updates[key] = fields[key]
+        if "coalesce" in fields:
+            updates["coalesce"] = 1 if fields["coalesce"] else 0
+        if "is_active" in fields:
+            updates["enabled"] = 1 if fields["is_active"] else 0
+        validate_task(updates.get("cron_expr", task["cron_expr"]),
+                      updates.get("timezone", task.get("timezone")),
+                      updates.get("misfire_policy", task.get("misfire_policy") or "skip"),
+                      max_instances=updates.get("max_instances", task.get("max_instances") or 1),
+                      keep_results=updates.get("keep_results"), keep_days=updates.get("keep_days"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        updates = {k: v for k, v in req.dict().items() if v is not None}
         if updates:
             local_db.update_scheduled_task(task_id, **updates)
-            _register_task_with_scheduler(task_id)  # re-register with new config
-        return {"status": "success", "message": "Task updated."}
+        return {"status": "success", "message": "Task updated.", "next_run": task_scheduler.next_run(task_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -91,7 +166,6 @@ async def update_task(task_id: str, req: UpdateTaskRequest, user: dict = Depends
 async def delete_task(task_id: str, user: dict = Depends(get_current_user)):
     """Delete a scheduled task."""
     try:
-        _unregister_task(task_id)
         local_db.delete_scheduled_task(task_id)
         return {"status": "success", "message": "Task deleted."}
     except Exception as e:
@@ -100,178 +174,44 @@ async def delete_task(task_id: str, user: dict = Depends(get_current_user)):
 
 @router.post("/tasks/{task_id}/run")
 async def run_task_now(task_id: str, user: dict = Depends(get_current_user)):
-    """Manually trigger a task immediately."""
+    """Queue a task to run immediately (subject to the executor's concurrency limits)."""
+    task = local_db.get_scheduled_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found.")
     try:
-        task = local_db.get_scheduled_task(task_id)
-        if not task:
-            raise HTTPException(status_code=404, detail="Task not found.")
-        
-        # Execute in a background thread to not block
-        t = threading.Thread(target=_execute_task, args=(task,), daemon=True)
-        t.start()
-        
-        return {"status": "success", "message": f"Task '{task['name']}' triggered."}
-    except HTTPException:
-        raise
+        queued = task_scheduler.run_now(task_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not queued:
+        return {"status": "success", "message": f"Task '{task['name']}' is already waiting to run."}
+    return {"status": "success", "message": f"Task '{task['name']}' triggered."}
 
 
 @router.get("/tasks/{task_id}/results")
-async def get_task_results(task_id: str, user: dict = Depends(get_current_user)):
-    """Get execution history for a task."""
+async def get_task_results(task_id: str, limit: int = 20, before: Optional[int] = None,
+                           user: dict = Depends(get_current_user)):
+    """Execution history for a task, newest first. Pass `next_cursor` back as `before` for the next page."""
+    limit = max(1, min(limit, 100))
     try:
-        results = local_db.get_task_results(task_id)
-        return {"status": "success", "results": results}
+        results = local_db.get_task_results(task_id, limit=limit, before=before)
+        next_cursor = results[-1]["cursor"] if len(results) == limit else None
+        return {"status": "success", "results": results, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ─────────── SCHEDULER ENGINE ───────────
-
-_scheduler = None
-
-def _get_scheduler():
-    """Lazy-init the APScheduler instance."""
-    global _scheduler
-    if _scheduler is None:
-        try:
-            from apscheduler.schedulers.background import BackgroundScheduler
-            _scheduler = BackgroundScheduler()
-            _scheduler.start()
-            logger.info("APScheduler started.")
-            
-            # Load and register all active tasks in a background thread
-            def _load_all_tasks():
-                try:
-                    from core.config import get_current_user_id
-                    uid = get_current_user_id()
-                    ws_id = _get_active_workspace_id(user_id=uid)
-                    tasks = local_db.get_scheduled_tasks(ws_id)
-                    for task in tasks:
-                        if task.get('is_active'):
-                            _register_task_with_scheduler(task['id'])
-                except:
-                    pass
-            
-            import threading
-            threading.Thread(target=_load_all_tasks, daemon=True).start()
-                
-        except ImportError:
-            logger.warning("apscheduler not installed. Scheduled tasks will only work with manual trigger.")
-            return None
-    return _scheduler
-
-
-def _register_task_with_scheduler(task_id: str):
-    """Register or update a task in the scheduler."""
-    sched = _get_scheduler()
-    if not sched:
-        return
-    
+@router.get("/tasks/{task_id}/results/summary")
+async def get_task_results_summary(task_id: str, user: dict = Depends(get_current_user)):
+    """Storage stats of retained results plus per-day counts of runs removed by compaction."""
     task = local_db.get_scheduled_task(task_id)
     if not task:
-        return
-    
-    job_id = f"wolfclaw_task_{task_id}"
-    
-    # Remove existing job if any
-    try:
-        sched.remove_job(job_id)
-    except:
-        pass
-    
-    if not task.get('is_active'):
-        return
-    
-    try:
-        if task['schedule_type'] == 'interval':
-            minutes = int(task['schedule_value'])
-            sched.add_job(
-                _execute_task,
-                'interval',
-                minutes=minutes,
-                id=job_id,
-                args=[task],
-                replace_existing=True
-            )
-            logger.info(f"Registered task '{task['name']}' to run every {minutes} minutes.")
-        elif task['schedule_type'] == 'cron':
-            # Parse cron expression: minute hour day_of_month month day_of_week
-            parts = task['schedule_value'].split()
-            if len(parts) >= 5:
-                sched.add_job(
-                    _execute_task,
-                    'cron',
-                    minute=parts[0],
-                    hour=parts[1],
-                    day=parts[2],
-                    month=parts[3],
-                    day_of_week=parts[4],
-                    id=job_id,
-                    args=[task],
-                    replace_existing=True
-                )
-                logger.info(f"Registered cron task '{task['name']}' with schedule {task['schedule_value']}.")
-    except Exception as e:
-        logger.error(f"Failed to register task {task_id}: {e}")
-
-
-def _unregister_task(task_id: str):
-    """Remove a task from the scheduler."""
-    sched = _get_scheduler()
-    if not sched:
-        return
-    try:
-        sched.remove_job(f"wolfclaw_task_{task_id}")
-    except:
-        pass
-
-
-def _execute_task(task: dict):
-    """Execute a scheduled task by sending the prompt to the bot's AI model."""
-    try:
-        from core.llm_engine import WolfEngine
-        from core import bot_manager
-        
-        from core.config import get_current_user_id
-        uid = get_current_user_id()
-        bots = bot_manager.get_bots(user_id=uid)
-        bot_id = task['bot_id']
-        
-        if bot_id not in bots:
-            local_db.save_task_result(task['id'], f"❌ Bot {bot_id} not found.")
-            return
-        
-        bot = bots[bot_id]
-        engine = WolfEngine(
-            bot['model'], 
-            fallback_models=bot.get('fallback_models', []),
-            user_id=uid
-        )
-        
-        messages = [{"role": "user", "content": task['prompt']}]
-        response = engine.chat(
-            messages=messages,
-            system_prompt=bot['prompt'],
-            bot_id=bot_id
-        )
-        
-        reply = response.choices[0].message.content or "(No response)"
-        local_db.save_task_result(task['id'], reply)
-        logger.info(f"Task '{task['name']}' executed successfully.")
-        
-    except Exception as e:
-        error_msg = f"❌ Execution failed: {str(e)}"
-        try:
-            local_db.save_task_result(task['id'], error_msg)
-        except:
-            pass
-        logger.error(f"Task execution error: {e}")
-
-
-# Auto-start scheduler on import
-# try:
-#     _get_scheduler()
-# except:
-#     pass
+        raise HTTPException(status_code=404, detail="Task not found.")
+    return {
+        "status": "success",
+        "retained": local_db.get_task_result_stats(task_id),
+        "keep_results": task.get("keep_results") or DEFAULT_KEEP_RESULTS,
+        "keep_days": task.get("keep_days") or DEFAULT_KEEP_DAYS,
+        "compacted": local_db.get_task_result_summaries(task_id),
+    }
@@ -1,10 +1,11 @@
 """
 Scheduler Routes — CRUD API for managing scheduled/recurring tasks.
 """
-import uuid
+from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from core.local_db import _get_connection
+from core import local_db
+from core.task_scheduler import task_scheduler, validate_task
 
 router = APIRouter()
 
@@ -14,38 +15,43 @@ class ScheduledTaskCreate(BaseModel):
     action_type: str = "flow"
     action_id: str
     ws_id: str = "local"
+    prompt: Optional[str] = None
+    timezone: Optional[str] = None
+    misfire_policy: str = "skip"
+    max_instances: int = 1
+    coalesce: bool = True
+    keep_results: Optional[int] = None
+    keep_days: Optional[int] = None
 
 @router.post("/scheduled-tasks")
 async def create_scheduled_task(req: ScheduledTaskCreate):
-    task_id = str(uuid.uuid4())
-    conn = _get_connection()
-    conn.execute(
-        "INSERT INTO scheduled_tasks (id, ws_id, name, cron_expr, action_type, action_id) VALUES (?, ?, ?, ?, ?, ?)",
-        (task_id, req.ws_id, req.name, req.cron_expr, req.action_type, req.action_id)
+    try:
+        validate_task(req.cron_expr, req.timezone, req.misfire_policy, req.action_type, req.max_instances,
+                      req.keep_results, req.keep_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    task_id = local_db.create_scheduled_task(
+        req.ws_id, req.name, req.cron_expr, req.action_type, req.action_id,
+        prompt=req.prompt, timezone=req.timezone, misfire_policy=req.misfire_policy,
+        max_instances=req.max_instances, coalesce=req.coalesce,
+        keep_results=req.keep_results, keep_days=req.keep_days
     )
-    conn.commit()
-    return {"id": task_id, "name": req.name, "status": "created"}
+    return {"id": task_id, "name": req.name, "status": "created", "next_run": task_scheduler.next_run(task_id)}
 
 @router.get("/scheduled-tasks")
 async def list_scheduled_tasks():
-    conn = _get_connection()
-    rows = conn.execute("SELECT * FROM scheduled_tasks ORDER BY created_at DESC").fetchall()
-    return {"tasks": [dict(r) for r in rows]}
+    return {"tasks": local_db.get_scheduled_tasks()}
 
 @router.delete("/scheduled-tasks/{task_id}")
 async def delete_scheduled_task(task_id: str):
-    conn = _get_connection()
-    conn.execute("DELETE FROM scheduled_tasks WHERE id = ?", (task_id,))
-    conn.commit()
+    local_db.delete_scheduled_task(task_id)
     return {"status": "deleted"}
 
 @router.put("/scheduled-tasks/{task_id}/toggle")
 async def toggle_scheduled_task(task_id: str):
-    conn = _get_connection()
-    row = conn.execute("SELECT enabled FROM scheduled_tasks WHERE id = ?", (task_id,)).fetchone()
-    if not row:
+    task = local_db.get_scheduled_task(task_id)
+    if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    new_state = 0 if row["enabled"] else 1
-    conn.execute("UPDATE scheduled_tasks SET enabled = ? WHERE id = ?", (new_state, task_id))
-    conn.commit()
+    new_state = 0 if task["enabled"] else 1
+    local_db.update_scheduled_task(task_id, enabled=new_state)
     return {"status": "toggled", "enabled": bool(new_state)}
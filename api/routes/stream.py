@@ -0,0 +1,221 @@
+"""
+Server-Sent Events push channel for the dashboard.
+
+Streams EventBus traffic (activity feed, notifications, flow events...) as
+it happens. Clients resume with the standard `Last-Event-ID` header or a
+`since` query param; bursts are coalesced into a single write.
+
+The stream needs a session (header or `token` query param, since
+EventSource cannot send headers), carries only STREAM_TOPICS, and drops
+events addressed to another user or workspace.
+
+`sse_pump` is the shared pump for routes that stream one worker's events
+(War Room runs, SSH fan-out) with the same coalescing and keep-alives.
+"""
+import asyncio
+import json
+import threading
+from typing import Callable, Hashable, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from api.deps import get_stream_user
+from core.bus import topic_matches
+from core.event_stream import event_stream
+
+router = APIRouter()
+
+COALESCE_WINDOW = 0.1    # seconds to gather a burst into one write
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments on an idle stream
+
+# The only topics a client may subscribe to; everything else stays server-side.
+STREAM_TOPICS = ("notification.*", "activity.*", "flow.run.*", "tool.output.*")
+# Topics whose events may carry no owner; they go to every signed-in user.
+SHARED_TOPICS = ("activity.*",)
+
+
+def _format(entry: dict) -> str:
+    payload = json.dumps({"topic": entry["topic"], "ts": entry["ts"], "data": entry["data"]}, default=str)
+    return f"id: {entry['seq']}\nevent: {entry['topic']}\ndata: {payload}\n\n"
+
+
+def merge_chunks(batch: List[Optional[dict]], merge_key: Callable[[dict], Optional[Hashable]]) -> list:
+    """Join consecutive events with the same non-None merge_key into one, concatenating their content."""
+    merged = []
+    for event in batch:
+        prev = merged[-1] if merged else None
+        key = merge_key(event) if event is not None else None
+        if key is not None and prev is not None and merge_key(prev) == key:
+            merged[-1] = dict(prev, content=prev["content"] + event["content"])
+        else:
+            merged.append(event)
+    return merged
+
+
+def sse_pump(run: Callable[[Callable[[dict], None], threading.Event], None], request: Request,
+             merge_key: Callable[[dict], Optional[Hashable]], thread_name: str = "SSEPump") -> StreamingResponse:
+    """
+    Stream a worker's events as SSE. `run(push, cancel)` runs on its own
+    thread once the client starts reading and calls push(event) for each
+    event dict; the event's "type" becomes the SSE event name. A burst of
+    events with the same non-None `merge_key` (e.g. one agent's tokens) is
+    coalesced into one frame. The stream ends when `run` returns; if the
+    client goes away first, `cancel` is set.
+    """
+    cancel = threading.Event()
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def push(event):
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        except RuntimeError:  # event loop already closed
+            cancel.set()
+
+    def work():
+        try:
+            run(push, cancel)
+        finally:
+            push(None)
+
+    async def generate():
+        seq = 0
+        finished = False
+        threading.Thread(target=work, name=thread_name, daemon=True).start()
+        try:
+            while not finished:
+                try:
+                    first = await asyncio.wait_for(events.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+
+                batch = [first]
+                if first is not None and merge_key(first) is not None:
+                    await asyncio.sleep(COALESCE_WINDOW)
+                while not events.empty():
+                    batch.append(events.get_nowait())
+
+                frames = []
+                for event in merge_chunks(batch, merge_key):
+                    if event is None:
+                        finished = True
+                        break
+                    seq += 1
+                    frames.append(f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n")
+                yield "".join(frames)
+        finally:
+            if not finished:
+                cancel.set()  # client went away mid-run: stop the worker
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _allowed_pattern(pattern: str) -> bool:
+    # A requested pattern must lie inside one of STREAM_TOPICS ('flow.run.step' or 'flow.run.*').
+    return any(topic_matches(a, pattern) for a in STREAM_TOPICS)
+
+
+def _wanted(entry: dict, patterns: list) -> bool:
+    return any(topic_matches(p, entry["topic"]) for p in patterns)
+
+
+def _visible(entry: dict, user_id: str, workspace_id: Optional[str]) -> bool:
+    """Owner check: user_id (or '' = broadcast) and workspace_id on the event or its meta must match."""
+    data = entry["data"] if isinstance(entry["data"], dict) else {}
+    scopes = [data] + ([data["meta"]] if isinstance(data.get("meta"), dict) else [])
+    owned = False
+    for scope in scopes:
+        if "user_id" in scope:
+            owned = True
+            if scope["user_id"] not in ("", user_id):
+                return False
+        if "workspace_id" in scope:
+            owned = True
+            if scope["workspace_id"] != workspace_id:
+                return False
+    return owned or any(topic_matches(p, entry["topic"]) for p in SHARED_TOPICS)
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    topics: str = "",
+    since: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+    user: dict = Depends(get_stream_user),
+):
+    """
+    Push stream of bus events. `topics` is a comma-separated list of patterns
+    ('activity.*,notification.*') within STREAM_TOPICS; empty means all of them.
+    """
+    patterns = [t.strip() for t in topics.split(",") if t.strip()] or list(STREAM_TOPICS)
+    rejected = [p for p in patterns if not _allowed_pattern(p)]
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"Topics not available on the stream: {', '.join(rejected)}")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    from core.bot_manager import _get_active_workspace_id
+    user_id = user["id"]
+    workspace_id = _get_active_workspace_id(user_id=user_id)
+
+    listener = event_stream.register()
+
+    async def generate():
+        last_sent = since or 0
+
+        def frames(entries):
+            nonlocal last_sent
+            out = []
+            for e in entries:
+                # The live queue and the replay backlog can overlap right after connect.
+                if e["seq"] <= last_sent:
+                    continue
+                last_sent = e["seq"]
+                if _wanted(e, patterns) and _visible(e, user_id, workspace_id):
+                    out.append(_format(e))
+            return "".join(out)
+
+        try:
+            # Tell the client where the stream starts so it can resume later.
+            yield f"retry: 3000\nid: {event_stream.last_seq}\nevent: hello\ndata: {{}}\n\n"
+            if since is not None:
+                backlog, gap = event_stream.since(since)
+                if gap:
+                    yield "event: resync\ndata: {}\n\n"
+                chunk = frames(backlog)
+                if chunk:
+                    yield chunk
+
+            while not await request.is_disconnected():
+                try:
+                    first = await asyncio.wait_for(listener.queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                batch = [first]
+                await asyncio.sleep(COALESCE_WINDOW)
+                while not listener.queue.empty():
+                    batch.append(listener.queue.get_nowait())
+
+                if listener.lagged:
+                    listener.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+                chunk = frames(batch)
+                if chunk:
+                    yield chunk
+        finally:
+            event_stream.unregister(listener)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
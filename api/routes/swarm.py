@@ -1,31 +1,48 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from auth.supabase_client import get_current_user
 from core.swarm import swarm
 
 router = APIRouter()
 
+class SwarmWorker(BaseModel):
+    bot_id: str
+    model: Optional[str] = None          # overrides the bot's model for this swarm
+    tools: Optional[List[str]] = None    # tool names the worker may call; [] = none
+
 class SwarmRequest(BaseModel):
     task: str
     manager_bot_id: str
     worker_bot_ids: List[str]
+    workers: Optional[List[SwarmWorker]] = None
+    max_parallel: int = 4
+    max_tokens: Optional[int] = None     # token budget for the whole swarm
+    max_cost: Optional[float] = None     # estimated USD budget for the whole swarm
 
 @router.post("/execute")
-async def execute_swarm(req: SwarmRequest):
+def execute_swarm(req: SwarmRequest):
+    # Plain `def`: FastAPI runs it in its threadpool while the workers' LLM calls block.
     user = get_current_user()
     ws_id = user["id"] if user else "local_workspace"
-    
+
     if not req.task or not req.manager_bot_id or not req.worker_bot_ids:
         raise HTTPException(status_code=400, detail="Missing required swarm parameters.")
-        
+
     try:
         result = swarm.run_swarm(
             task=req.task,
             manager_bot_id=req.manager_bot_id,
             worker_bot_ids=req.worker_bot_ids,
-            workspace_id=ws_id
+            workspace_id=ws_id,
+            workers=[w.dict() for w in req.workers or []],
+            max_parallel=req.max_parallel,
+            max_tokens=req.max_tokens,
+            max_cost=req.max_cost,
+            user_id=user["id"] if user else None
         )
         return result
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
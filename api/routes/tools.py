@@ -1,8 +1,9 @@
 """Direct Tool Execution API — Run Wolfclaw tools from the GUI without the LLM."""
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any
+from api.deps import get_current_user
 
 router = APIRouter()
 
@@ -12,14 +13,29 @@ class ToolRequest(BaseModel):
 
 
 @router.post("/execute")
-async def execute_tool_direct(req: ToolRequest):
+async def execute_tool_direct(req: ToolRequest, user: dict = Depends(get_current_user)):
     """Execute a single tool by name, returning the result."""
     if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
         raise HTTPException(status_code=403, detail="Tool execution restricted to Desktop environment.")
 
     try:
+        from core.output_capture import owned_by
         from core.tools import execute_tool
-        result = execute_tool(req.tool_name, req.arguments)
+        with owned_by(user["id"]):
+            result = execute_tool(req.tool_name, req.arguments)
         return {"status": "success", "tool": req.tool_name, "result": str(result)}
     except Exception as e:
         return {"status": "error", "tool": req.tool_name, "result": str(e)}
+
+
+@router.get("/output/{output_id}")
+async def get_tool_output(output_id: str, offset: int = 0, length: int = 8000,
+                          user: dict = Depends(get_current_user)):
+    """Page through the full output of a terminal/SSH command whose tool reply was truncated."""
+    if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
+        raise HTTPException(status_code=403, detail="Tool execution restricted to Desktop environment.")
+    from core.output_capture import read_output
+    try:
+        return {"status": "success", **read_output(output_id, offset, length)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Output not found or expired.")
@@ -90,10 +90,7 @@ def logout_user():
     if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
         from core import local_db
         # We don't have the session_id easily here, so we clear all for this env/user or most recent
-        conn = local_db._get_connection()
-        conn.execute("DELETE FROM sessions") # Brutal logout for local
-        conn.commit()
-        conn.close()
+        local_db.delete_all_sessions() # Brutal logout for local
 
     if os.environ.get("WOLFCLAW_ENVIRONMENT") != "desktop":
         client = get_supabase_client()
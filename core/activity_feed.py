@@ -4,6 +4,7 @@ and publishes them through the EventBus.
 """
 import logging
 import threading
+from itertools import islice
 from datetime import datetime, timezone
 from collections import deque
 from typing import List, Dict
@@ -41,11 +42,20 @@ class ActivityFeed:
         }
         with self._lock:
             self._events.appendleft(entry)
+        self._publish(entry)
+
+    def _publish(self, entry: Dict):
+        """Forward the entry to push clients (see core.event_stream)."""
+        try:
+            from core.bus import bus
+            bus.publish("activity.logged", entry)
+        except Exception as e:
+            logger.debug(f"ActivityFeed could not publish entry: {e}")
 
     def get_recent(self, limit: int = 50) -> List[Dict]:
         """Return the most recent events."""
         with self._lock:
-            return list(self._events)[:limit]
+            return list(islice(self._events, limit))
 
 # Singleton
 activity_feed = ActivityFeed()
@@ -1,8 +1,11 @@
 import os
 import json
+import logging
 from datetime import datetime
 from core.config import get_supabase, get_current_user_id
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_USER_MD = """# USER PROFILE
 ## Personal Info
 Name: [Your Name]
@@ -35,49 +38,40 @@ def _get_active_workspace_id(user_id: str = None) -> str:
     """Gets the user's active workspace ID. Creates one if none exists."""
     webhook_ws = os.environ.get("WOLFCLAW_WEBHOOK_WORKSPACE_ID")
     if webhook_ws:
-        print(f"[WORKSPACE] Using webhook override WorkspaceID: {webhook_ws}")
+        logger.debug("Using webhook override workspace: %s", webhook_ws)
         return webhook_ws
         
     if not user_id:
         user_id = get_current_user_id()
     
     if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
-        from core import local_db
-        print(f"[WORKSPACE] Fetching workspaces for UserID: {user_id} (Desktop)")
-        workspaces = local_db.get_workspaces_for_user(user_id)
-        if workspaces:
-            ws_id = workspaces[0]["id"]
-            print(f"[WORKSPACE] Found existing workspace: {ws_id}")
-            return ws_id
-            
-        ws_id = local_db.create_workspace(user_id, "Default Workspace")
-        print(f"[WORKSPACE] Created new default workspace: {ws_id}")
-        return ws_id
+        from core.registry import registry
+        return registry.workspace_id(user_id)
     
     # If using SaaS mode but not authenticated, return a dummy workspace to prevent RLS crash
     if user_id == "00000000-0000-0000-0000-000000000000":
-        print("[WORKSPACE] SaaS Mode: Authentication missing. Using DummyID.")
+        logger.debug("SaaS mode: authentication missing, using dummy workspace.")
         return "00000000-0000-0000-0000-000000000000"
 
     supabase = get_supabase()
     # Check if a workspace exists
     try:
-        print(f"[WORKSPACE] Fetching workspaces for UserID: {user_id} (Supabase)")
+        logger.debug("Fetching workspaces for user %s (Supabase)", user_id)
         resp = supabase.table("workspaces").select("id").eq("user_id", user_id).execute()
         if resp.data and len(resp.data) > 0:
             ws_id = resp.data[0]["id"]
-            print(f"[WORKSPACE] Found Supabase workspace: {ws_id}")
+            logger.debug("Found Supabase workspace: %s", ws_id)
             return ws_id
             
         # Create default workspace
-        print(f"[WORKSPACE] Workspace not found. Creating default for UserID: {user_id}")
+        logger.info(f"Workspace not found, creating default for user {user_id}")
         insert_resp = supabase.table("workspaces").insert({"user_id": user_id, "name": "Default Workspace"}).execute()
         if insert_resp.data:
             ws_id = insert_resp.data[0]["id"]
-            print(f"[WORKSPACE] Created Supabase workspace: {ws_id}")
+            logger.info(f"Created Supabase workspace: {ws_id}")
             return ws_id
     except Exception as e:
-        print(f"[WORKSPACE] ERROR fetching workspace: {e}")
+        logger.error(f"Error fetching workspace: {e}")
         return "00000000-0000-0000-0000-000000000000"
     
     return "00000000-0000-0000-0000-000000000000"
@@ -114,8 +108,8 @@ def get_bots(user_id: str = None):
         workspace_id = _get_active_workspace_id(user_id)
         
         if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
-            from core import local_db
-            local_bots = local_db.get_bots_for_workspace(workspace_id)
+            from core.registry import registry
+            local_bots = registry.bots(workspace_id)
             for b_id, b_data in local_bots.items():
                 b_data["status"] = "stopped"
                 b_data["pid"] = None
@@ -140,7 +134,7 @@ def get_bots(user_id: str = None):
                 }
         return bots_dict
     except Exception as e:
-        print(f"Error fetching bots: {e}")
+        logger.error(f"Error fetching bots: {e}")
         return {}
 
 def update_bot_status(bot_id: str, status: str, pid: int = None):
@@ -157,10 +151,9 @@ def save_bot_token(bot_id: str, token: str):
 def read_workspace_file(bot_id: str, filename: str, user_id: str = None) -> str:
     """Read a file from a bot's Supabase profile or Local DB."""
     if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
-        from core import local_db
+        from core.registry import registry
         workspace_id = _get_active_workspace_id(user_id)
-        bots = local_db.get_bots_for_workspace(workspace_id)
-        bot = bots.get(bot_id)
+        bot = registry.bot(workspace_id, bot_id)
         if bot:
             if filename == "SOUL.md": return bot.get("prompt", "")
             if filename == "USER.md": return bot.get("user_context", "")
@@ -201,19 +194,19 @@ def write_workspace_file(bot_id: str, filename: str, content: str, user_id: str
     try:
         supabase.table("bots").update(update_data).eq("id", bot_id).execute()
     except Exception as e:
-        print(f"Error saving {filename} to Supabase: {e}")
+        logger.error(f"Error saving {filename} to Supabase: {e}")
 
 def load_chat_history(bot_id: str) -> list:
     """Load persisted chat history for a bot from Supabase."""
     supabase = get_supabase()
     # In Phase 1, we map history.json to the chat_history table (if created)
     # Since we didn't add chat_history to the schema yet, we return empty to prevent crashes
-    print("load_chat_history: Pending Chat History Table Migration")
+    logger.debug("load_chat_history: Pending Chat History Table Migration")
     return []
 
 def save_chat_history(bot_id: str, messages: list):
     """Persist chat history for a bot to Supabase."""
-    print("save_chat_history: Pending Chat History Table Migration")
+    logger.debug("save_chat_history: Pending Chat History Table Migration")
 
 def delete_bot(bot_id: str, user_id: str = None):
     """Delete a bot from the registry."""
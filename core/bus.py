@@ -1,38 +1,262 @@
-import json
 import logging
+import threading
+import time
+from collections import defaultdict, deque
 from typing import Callable, Dict, List
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+# Overflow policies for a subscriber whose queue is full
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+SAMPLE = "sample"
+OVERFLOW_POLICIES = (DROP_OLDEST, BLOCK, SAMPLE)
+
+RATE_WINDOW = 60  # seconds covered by publish_rate_per_sec, one counter per second
+
+
+def topic_matches(pattern: str, event_type: str) -> bool:
+    """
+    Subscription patterns:
+      '*'          -> every event
+      'flow.*'     -> any topic starting with 'flow.'
+      'flow_'      -> exact topic only (prefixes must end with '*')
+    """
+    if pattern == "*":
+        return True
+    if pattern.endswith("*"):
+        return event_type.startswith(pattern[:-1])
+    return pattern == event_type
+
+
+class _TopicStats:
+    """Per-topic counters. Mutated only while holding the bus stats lock."""
+
+    def __init__(self):
+        self.published = 0
+        self.dropped = 0
+        self.handled = 0
+        self.failed = 0
+        self.handler_time_total = 0.0
+        self.handler_time_max = 0.0
+        # Publishes per second over the last RATE_WINDOW seconds: slot i counts second bucket_secs[i].
+        self.bucket_counts = [0] * RATE_WINDOW
+        self.bucket_secs = [-1] * RATE_WINDOW
+
+    def count_publish(self, now: float):
+        sec = int(now)
+        i = sec % RATE_WINDOW
+        if self.bucket_secs[i] != sec:
+            self.bucket_secs[i] = sec
+            self.bucket_counts[i] = 0
+        self.bucket_counts[i] += 1
+
+    def snapshot(self) -> Dict:
+        now = int(time.monotonic())
+        in_window = sum(count for sec, count in zip(self.bucket_secs, self.bucket_counts) if 0 <= now - sec < RATE_WINDOW)
+        return {
+            "published": self.published,
+            "dropped": self.dropped,
+            "handled": self.handled,
+            "failed": self.failed,
+            "publish_rate_per_sec": round(in_window / RATE_WINDOW, 3),
+            "avg_handler_ms": round(self.handler_time_total / self.handled * 1000, 3) if self.handled else 0.0,
+            "max_handler_ms": round(self.handler_time_max * 1000, 3),
+        }
+
+
+class Subscription:
+    """
+    A single subscriber: a bounded queue drained by its own dispatcher thread,
+    so a slow callback never runs on (or stalls) the publisher's thread.
+    """
+
+    def __init__(self, bus: "EventBus", pattern: str, callback: Callable, max_queue: int,
+                 overflow: str, sample_every: int, with_topic: bool):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.bus = bus
+        self.pattern = pattern
+        self.callback = callback
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.with_topic = with_topic
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._overflow_seen = 0
+        self._active = True
+        self._idle = True
+        self._thread = threading.Thread(target=self._run, name=f"EventBus[{pattern}]", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def offer(self, event_type: str, data: Dict, block_timeout: float) -> bool:
+        """Enqueue an event according to the overflow policy. Returns False if it was dropped."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == BLOCK:
+                    deadline = time.monotonic() + block_timeout
+                    while self._active and len(self._queue) >= self.max_queue:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.bus._record_drop(event_type)
+                            return False
+                        self._cond.wait(remaining)
+                elif self.overflow == SAMPLE:
+                    # Keep one of every `sample_every` overflowing events, replacing the oldest.
+                    self._overflow_seen += 1
+                    self.bus._record_drop(event_type)
+                    if self._overflow_seen % self.sample_every:
+                        return False
+                    self._queue.popleft()
+                else:
+                    self._queue.popleft()
+                    self.bus._record_drop(event_type)
+            if not self._active:
+                return False
+            self._queue.append((event_type, data))
+            self._idle = False
+            self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._active and not self._queue:
+                    self._idle = True
+                    self._cond.notify_all()
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                event_type, data = self._queue.popleft()
+                self._cond.notify_all()  # wake publishers blocked on a full queue
+
+            start = time.perf_counter()
+            ok = True
+            try:
+                if self.with_topic:
+                    self.callback(event_type, data)
+                else:
+                    self.callback(data)
+            except Exception as e:
+                ok = False
+                logger.error(f"Event callback failed for {event_type}: {e}")
+            self.bus._record_handled(event_type, time.perf_counter() - start, ok)
+
+    def wait_idle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or not self._idle:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify_all()
+
+
 class EventBus:
     """
     A lightweight PUB/SUB system for the Wolfclaw pack.
     Enables bots to 'ping' each other and subscribe to system events.
+
+    Each subscriber owns a bounded queue and a dispatcher thread, so `publish`
+    only enqueues and returns. Subscriptions may use exact topics, '*' or a
+    topic prefix ending in '*' (e.g. 'flow.*').
     """
-    
+
     _instance = None
-    
+
+    DEFAULT_MAX_QUEUE = 1000
+    BLOCK_TIMEOUT = 5.0      # seconds a publisher may wait on a BLOCK subscriber
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(EventBus, cls).__new__(cls)
             cls._instance.subscribers = defaultdict(list)
+            cls._instance._lock = threading.Lock()
+            cls._instance._stats_lock = threading.Lock()
+            cls._instance._stats = defaultdict(_TopicStats)
         return cls._instance
 
-    def subscribe(self, event_type: str, callback: Callable):
-        """Allows a bot or module to listen for specific events."""
-        self.subscribers[event_type].append(callback)
-        logger.info(f"Subscribed to event: {event_type}")
+    def subscribe(self, event_type: str, callback: Callable, max_queue: int = None,
+                  overflow: str = DROP_OLDEST, sample_every: int = 10,
+                  with_topic: bool = False) -> Subscription:
+        """
+        Allows a bot or module to listen for specific events.
+        `event_type` may be an exact topic, '*' or a prefix like 'flow.*'.
+        With `with_topic=True` the callback receives (event_type, data).
+        """
+        sub = Subscription(self, event_type, callback, max_queue or self.DEFAULT_MAX_QUEUE,
+                           overflow, sample_every, with_topic)
+        with self._lock:
+            self.subscribers[event_type].append(sub)
+        logger.debug(f"Subscribed to event: {event_type} (overflow={overflow})")
+        return sub
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subs = self.subscribers.get(subscription.pattern, [])
+            if subscription in subs:
+                subs.remove(subscription)
+        subscription.close()
+
+    def _matching(self, event_type: str) -> List[Subscription]:
+        with self._lock:
+            return [s for pattern, subs in self.subscribers.items()
+                    if topic_matches(pattern, event_type) for s in subs]
 
     def publish(self, event_type: str, data: Dict):
-        """Broadcasts an event to all subscribers."""
-        logger.info(f"Publishing event: {event_type}")
-        if event_type in self.subscribers:
-            for callback in self.subscribers[event_type]:
-                try:
-                    callback(data)
-                except Exception as e:
-                    logger.error(f"Event callback failed for {event_type}: {e}")
+        """Broadcasts an event to all subscribers without running their callbacks inline."""
+        logger.debug(f"Publishing event: {event_type}")
+        with self._stats_lock:
+            stats = self._stats[event_type]
+            stats.published += 1
+            stats.count_publish(time.monotonic())
+        for sub in self._matching(event_type):
+            sub.offer(event_type, data, self.BLOCK_TIMEOUT)
+
+    def _record_drop(self, event_type: str):
+        with self._stats_lock:
+            self._stats[event_type].dropped += 1
+
+    def _record_handled(self, event_type: str, elapsed: float, ok: bool):
+        with self._stats_lock:
+            stats = self._stats[event_type]
+            stats.handled += 1
+            if not ok:
+                stats.failed += 1
+            stats.handler_time_total += elapsed
+            stats.handler_time_max = max(stats.handler_time_max, elapsed)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every subscriber queue is drained. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            subs = [s for subs in self.subscribers.values() for s in subs]
+        for sub in subs:
+            if not sub.wait_idle(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def get_metrics(self) -> Dict:
+        """Per-topic publish/handler stats plus the current depth of every subscriber queue."""
+        with self._stats_lock:
+            topics = {t: s.snapshot() for t, s in self._stats.items()}
+        with self._lock:
+            queues = [
+                {"pattern": s.pattern, "depth": s.depth, "max_queue": s.max_queue, "overflow": s.overflow}
+                for subs in self.subscribers.values() for s in subs
+            ]
+        return {"topics": topics, "subscribers": queues}
 
 # Global access point
 bus = EventBus()
@@ -0,0 +1,199 @@
+"""
+Cron expressions for scheduled tasks.
+
+`parse_schedule()` accepts:
+  - standard 5-field cron: "minute hour day-of-month month day-of-week"
+    with '*', lists, ranges, steps ('*/15', '1-5/2') and month/day names
+  - the macros @hourly, @daily/@midnight, @weekly, @monthly, @yearly/@annually
+  - the legacy interval form "every_Xm" / "every_Xh"
+
+Cron fields are evaluated in the schedule's timezone (IANA name, or the
+system local zone when None), so "0 9 * * *" means 09:00 local time across
+DST changes. As in Vixie cron, when both day-of-month and day-of-week are
+restricted a day matching either one fires. A time skipped by a DST jump
+fires once at the shifted instant; a repeated wall-clock time fires once.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTH_NAMES = {n: i for i, n in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+DAY_NAMES = {n: i for i, n in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+
+# (name, low, high, names)
+FIELDS = (
+    ("minute", 0, 59, None),
+    ("hour", 0, 23, None),
+    ("day of month", 1, 31, None),
+    ("month", 1, 12, MONTH_NAMES),
+    ("day of week", 0, 7, DAY_NAMES),
+)
+
+MAX_SEARCH_DAYS = 366 * 5  # enough to find Feb 29 from any starting point
+REPEATED_HOUR_MINUTES = 61
+
+
+def get_zone(name: Optional[str]):
+    """ZoneInfo for an IANA name; None means the system local zone."""
+    if not name:
+        return None
+    if ZoneInfo is None:
+        raise ValueError("Timezones require Python 3.9+ (zoneinfo).")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def _to_local(ts: float, zone) -> datetime:
+    return datetime.fromtimestamp(ts, zone).replace(tzinfo=None)
+
+
+def _from_local(naive: datetime, zone) -> float:
+    # fold=0 picks the first of a repeated time and shifts a skipped one forward
+    return naive.replace(tzinfo=zone, fold=0).timestamp() if zone else naive.timestamp()
+
+
+def _parse_value(token: str, names) -> int:
+    if names and token.lower() in names:
+        return names[token.lower()]
+    if not token.isdigit():
+        raise ValueError(f"'{token}' is not a number")
+    return int(token)
+
+
+def _parse_field(text: str, name: str, low: int, high: int, names) -> Tuple[frozenset, bool]:
+    """Values allowed by one field, and whether the field was unrestricted ('*')."""
+    values = set()
+    star = False
+    for part in text.split(","):
+        if not part:
+            raise ValueError(f"Empty entry in {name} field")
+        rng, _, step_text = part.partition("/")
+        step = 1
+        if step_text:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"Bad step '{step_text}' in {name} field")
+            step = int(step_text)
+        if rng in ("*", "?"):
+            start, end = low, high
+            star = star or not step_text
+        elif "-" in rng:
+            a, _, b = rng.partition("-")
+            start, end = _parse_value(a, names), _parse_value(b, names)
+        else:
+            start = _parse_value(rng, names)
+            end = high if step_text else start
+        if not (low <= start <= high and low <= end <= high):
+            raise ValueError(f"{name} value out of range {low}-{high}: '{part}'")
+        if start > end:
+            raise ValueError(f"Reversed range in {name} field: '{part}'")
+        values.update(range(start, end + 1, step))
+    return frozenset(values), star
+
+
+class CronSchedule:
+    """A parsed 5-field cron expression bound to a timezone."""
+
+    def __init__(self, expr: str, tz: Optional[str] = None):
+        self.expr = expr
+        self.tz = tz
+        self.zone = get_zone(tz)
+        text = MACROS.get(expr.strip().lower(), expr)
+        parts = text.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(parts)}: '{expr}'")
+        parsed = [_parse_field(p, *spec) for p, spec in zip(parts, FIELDS)]
+        (minutes, _), (hours, _), (self.days, self.dom_star), (months, _), (dows, self.dow_star) = parsed
+        self.minutes = tuple(sorted(minutes))
+        self.hours = tuple(sorted(hours))
+        self.months = frozenset(months)
+        self.dows = frozenset(d % 7 for d in dows)  # 7 is Sunday too
+
+    def _day_matches(self, d: date) -> bool:
+        if d.month not in self.months:
+            return False
+        dom_ok = d.day in self.days
+        dow_ok = (d.weekday() + 1) % 7 in self.dows
+        if self.dom_star or self.dow_star:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok
+
+    def _next_local(self, start: datetime) -> Optional[datetime]:
+        """First matching wall-clock minute at or after `start`."""
+        d = start.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            if d.month not in self.months:
+                d = (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+                continue
+            if self._day_matches(d):
+                same_day = d == start.date()
+                for h in self.hours:
+                    if same_day and h < start.hour:
+                        continue
+                    for m in self.minutes:
+                        if same_day and h == start.hour and m < start.minute:
+                            continue
+                        return datetime(d.year, d.month, d.day, h, m)
+            d += timedelta(days=1)
+        return None
+
+    def next_after(self, ts: float) -> Optional[float]:
+        """Epoch time of the first fire strictly after `ts`, or None if it never fires."""
+        local = _to_local(ts, self.zone).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(REPEATED_HOUR_MINUTES):  # second pass of a repeated hour maps into the past
+            candidate = self._next_local(local)
+            if candidate is None:
+                return None
+            when = _from_local(candidate, self.zone)
+            if when > ts:
+                return when
+            local = candidate + timedelta(minutes=1)
+        return None
+
+    def __repr__(self):
+        return f"CronSchedule({self.expr!r}, tz={self.tz!r})"
+
+
+class IntervalSchedule:
+    """Fixed period in seconds, from the legacy 'every_Xm' form."""
+
+    def __init__(self, expr: str, seconds: int):
+        self.expr = expr
+        self.tz = None
+        self.seconds = seconds
+
+    def next_after(self, ts: float) -> float:
+        return ts + self.seconds
+
+    def __repr__(self):
+        return f"IntervalSchedule({self.expr!r})"
+
+
+def parse_schedule(expr: str, tz: Optional[str] = None):
+    """CronSchedule or IntervalSchedule for `expr`. Raises ValueError on bad input."""
+    expr = (expr or "").strip()
+    if not expr:
+        raise ValueError("Schedule expression is empty")
+    if expr.startswith("every_") and expr[-1:] in ("m", "h"):
+        amount = expr[6:-1]
+        if not amount.isdigit() or int(amount) == 0:
+            raise ValueError(f"Bad interval: '{expr}'")
+        return IntervalSchedule(expr, int(amount) * (60 if expr.endswith("m") else 3600))
+    return CronSchedule(expr, tz)
@@ -0,0 +1,104 @@
+"""
+Event Stream — fans EventBus traffic out to push clients (SSE).
+
+Every bus event gets a monotonic sequence number and is kept in a small
+replay buffer, so a reconnecting client can resume from the last sequence
+it saw instead of re-fetching the whole activity feed.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Listener:
+    """One connected client: an asyncio queue fed from the bus dispatcher thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.lagged = False  # set when the client fell behind and events were dropped
+
+    def _put(self, entry: Dict):
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+
+class EventStream:
+    """Thread-safe bridge between the EventBus and asyncio push clients."""
+
+    def __init__(self, replay_size: int = 500, max_pending: int = 1000):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buffer = deque(maxlen=replay_size)
+        self._listeners = set()
+        self._max_pending = max_pending
+        self._subscribed = False
+        try:
+            self._ensure_subscribed()
+        except Exception as e:
+            logger.warning(f"EventStream could not subscribe to EventBus: {e}")
+
+    def _ensure_subscribed(self):
+        with self._lock:
+            if self._subscribed:
+                return
+            self._subscribed = True
+        from core.bus import bus
+        bus.subscribe("*", self._on_event, with_topic=True)
+        logger.info("EventStream subscribed to EventBus.")
+
+    def _on_event(self, topic: str, data: Dict):
+        with self._lock:
+            self._seq += 1
+            entry = {"seq": self._seq, "topic": topic, "ts": time.time(), "data": data}
+            self._buffer.append(entry)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.loop.call_soon_threadsafe(listener._put, entry)
+            except RuntimeError:
+                # Event loop already closed; the client is gone.
+                self.unregister(listener)
+
+    @property
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def since(self, seq: int) -> Tuple[List[Dict], bool]:
+        """
+        Buffered events newer than `seq`. The flag is True when the buffer no
+        longer reaches back to `seq`, i.e. the client missed events and
+        should refetch a full snapshot.
+        """
+        with self._lock:
+            events = [e for e in self._buffer if e["seq"] > seq]
+            oldest = self._buffer[0]["seq"] if self._buffer else self._seq + 1
+        gap = seq < self._seq and oldest > seq + 1
+        return events, gap
+
+    def register(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Listener:
+        self._ensure_subscribed()
+        listener = _Listener(loop or asyncio.get_running_loop(), self._max_pending)
+        with self._lock:
+            self._listeners.add(listener)
+        return listener
+
+    def unregister(self, listener: _Listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    @property
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._listeners)
+
+# Singleton
+event_stream = EventStream()
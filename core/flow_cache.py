@@ -0,0 +1,107 @@
+"""
+Memoization cache for deterministic flow blocks.
+
+Results are keyed on the block type, a hash of the block's rendered config
+and the run's scope (workspace, bot and, for AI blocks, the model), so a
+scheduled flow that fires with the same inputs reuses the previous web
+search or GET request instead of paying for it again, without one
+workspace or bot ever seeing another's results. Entries live in SQLite
+(flow_step_cache) and are shared by every run within that scope.
+
+Per node:
+  config.cache_ttl   seconds to keep the result (0 disables caching)
+  config.cache       false to opt a node out entirely; true to opt in
+The block types in CACHEABLE_TTLS are cached by default. Those in
+OPT_IN_TTLS (AI replies, which are not deterministic) are cached only when
+the node sets `cache: true` or a `cache_ttl`. Anything with side effects
+(commands, messages, GUI input) always runs.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default TTL in seconds per cacheable block type
+CACHEABLE_TTLS = {
+    "web_search":   3600,
+    "http_request": 300,   # GET only
+}
+# Cached only when the node asks for it (cache: true or a cache_ttl)
+OPT_IN_TTLS = {
+    "ai_prompt":    3600,
+}
+_CACHE_CONTROL_KEYS = ("cache", "cache_ttl")
+DEFAULT_AI_MODEL = "gpt-4o"   # what _exec_ai_prompt uses when the node names no model
+PRUNE_INTERVAL = 3600
+
+_last_prune = 0.0
+
+
+def cache_policy(block_type: str, config: dict) -> Optional[float]:
+    """TTL to use for this node, or None if its result must not be cached."""
+    if config.get("cache") is False:
+        return None
+    if block_type in OPT_IN_TTLS:
+        if config.get("cache") is not True and config.get("cache_ttl") in (None, ""):
+            return None
+        default = OPT_IN_TTLS[block_type]
+    elif block_type in CACHEABLE_TTLS:
+        default = CACHEABLE_TTLS[block_type]
+    else:
+        return None
+    if block_type == "http_request" and str(config.get("method", "GET")).upper() != "GET":
+        return None
+    try:
+        ttl = float(config.get("cache_ttl", default))
+    except (TypeError, ValueError):
+        ttl = default
+    return ttl if ttl > 0 else None
+
+
+def cache_scope(block_type: str, config: dict, bot_id: str = None, workspace_id: str = None) -> dict:
+    """Who may share a cached result: the same workspace and bot, and for AI blocks the same model."""
+    scope = {"workspace_id": workspace_id or "", "bot_id": bot_id or ""}
+    if block_type == "ai_prompt":
+        scope["model"] = config.get("model", DEFAULT_AI_MODEL)
+    return scope
+
+
+def cache_key(block_type: str, config: dict, scope: dict = None) -> str:
+    material = {k: v for k, v in config.items() if k not in _CACHE_CONTROL_KEYS}
+    material = {"config": material, "scope": scope or {}}
+    digest = hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{block_type}:{digest}"
+
+
+def lookup(block_type: str, config: dict, bot_id: str = None,
+           workspace_id: str = None) -> Tuple[Optional[str], Optional[float], Optional[Any]]:
+    """Returns (key, ttl, cached_result). key is None when the node is not cacheable."""
+    ttl = cache_policy(block_type, config)
+    if ttl is None:
+        return None, None, None
+    key = cache_key(block_type, config, cache_scope(block_type, config, bot_id, workspace_id))
+    from core import local_db
+    try:
+        return key, ttl, local_db.get_cached_flow_step(key, time.time())
+    except Exception as e:
+        logger.warning(f"Flow cache lookup failed: {e}")
+        return key, ttl, None
+
+
+def store(key: str, block_type: str, result: Any, ttl: float):
+    """Cache a successful result. Error results are never stored."""
+    if isinstance(result, dict) and result.get("error"):
+        return
+    global _last_prune
+    from core import local_db
+    now = time.time()
+    try:
+        local_db.put_cached_flow_step(key, block_type, result, now, ttl)
+        if now - _last_prune > PRUNE_INTERVAL:
+            _last_prune = now
+            local_db.prune_flow_step_cache(now)
+    except Exception as e:
+        logger.warning(f"Flow cache store failed: {e}")
@@ -0,0 +1,256 @@
+"""
+Flow compiler: validates a flow definition and turns it into an execution
+plan once, so runs start from a ready plan instead of re-parsing and
+re-sorting the graph.
+
+A FlowPlan holds the adjacency lists, a topological order, the execution
+levels (blocks in the same level can run in parallel), every block's
+ancestors, and the compiled config templates. `errors` lists problems that
+make the flow unrunnable (cycles, dangling edges, unknown block types,
+missing required config); `warnings` lists template variables that no
+upstream block produces.
+
+Plans are cached by a hash of the flow JSON.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from core.flow_templates import TEMPLATE_FIELDS, compile_template
+
+logger = logging.getLogger(__name__)
+
+# Result keys each block type produces; used to check template variables.
+BLOCK_OUTPUT_KEYS = {
+    "manual_trigger":    ("triggered", "timestamp", "timezone"),
+    "schedule_trigger":  ("cron", "scheduled"),
+    "ai_prompt":         ("response", "error"),
+    "terminal_command":  ("output",),
+    "web_search":        ("results",),
+    "condition":         ("passed", "branch"),
+    "output":            ("message",),
+    "screenshot":        ("screenshot",),
+    "http_request":      ("status_code", "body", "error"),
+    "delay":             ("waited",),
+    "send_email":        ("email_sent_to", "subject", "status"),
+    "send_telegram":     ("telegram_sent_to", "message", "status"),
+    "simulate_gui":      ("result",),
+}
+
+# Config fields a block cannot run without (empty strings count as missing).
+REQUIRED_FIELDS = {
+    "ai_prompt":        ("prompt",),
+    "terminal_command": ("command",),
+    "web_search":       ("query",),
+    "http_request":     ("url",),
+    "condition":        ("field",),
+    "send_email":       ("to",),
+    "send_telegram":    ("chat_id", "message"),
+}
+
+BRANCH_LABELS = ("true", "false")
+PLAN_CACHE_SIZE = 128
+
+
+class _AncestorLists(dict):
+    """node_id -> upstream node ids in topological order, built from the bitmask on first access."""
+
+    def __init__(self, plan: "FlowPlan"):
+        super().__init__()
+        self._plan = plan
+
+    def __missing__(self, node_id: str) -> List[str]:
+        mask = self._plan.ancestor_mask[node_id]
+        order = self._plan.order
+        ids = []
+        while mask:
+            low = mask & -mask
+            ids.append(order[low.bit_length() - 1])
+            mask ^= low
+        self[node_id] = ids
+        return ids
+
+
+class FlowPlan:
+    def __init__(self, flow_data: Dict, flow_hash: str):
+        self.flow_data = flow_data
+        self.flow_hash = flow_hash
+        self.nodes: Dict[str, Dict] = flow_data.get("nodes", {}) or {}
+        self.edges: List[Dict] = flow_data.get("edges", []) or []
+        self.parents: Dict[str, List[str]] = {nid: [] for nid in self.nodes}
+        self.children: Dict[str, List[str]] = {nid: [] for nid in self.nodes}
+        self.out_edges: Dict[str, List[Dict]] = {nid: [] for nid in self.nodes}
+        self.order: List[str] = []
+        self.levels: List[List[str]] = []
+        self.position: Dict[str, int] = {}
+        self.ancestor_mask: Dict[str, int] = {}  # bit i set = order[i] is upstream
+        self.ancestors: Dict[str, List[str]] = _AncestorLists(self)
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+
+    def is_upstream(self, candidate: str, node_id: str) -> bool:
+        pos = self.position.get(candidate)
+        return pos is not None and bool(self.ancestor_mask.get(node_id, 0) >> pos & 1)
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def summary(self) -> Dict:
+        return {"valid": self.valid, "errors": self.errors, "warnings": self.warnings,
+                "levels": self.levels, "flow_hash": self.flow_hash}
+
+
+_cache: "OrderedDict[str, FlowPlan]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(flow_hash: str, build) -> FlowPlan:
+    with _cache_lock:
+        plan = _cache.get(flow_hash)
+        if plan is not None:
+            _cache.move_to_end(flow_hash)
+            return plan
+    plan = build()
+    with _cache_lock:
+        _cache[flow_hash] = plan
+        while len(_cache) > PLAN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return plan
+
+
+def compile_flow_json(flow_json: str) -> FlowPlan:
+    """Compile a flow from its stored JSON text. Raises ValueError on invalid JSON."""
+    flow_hash = hashlib.sha256(flow_json.encode("utf-8")).hexdigest()
+
+    def build():
+        try:
+            flow_data = json.loads(flow_json)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"flow_data must be valid JSON: {e}")
+        return _build(flow_data, flow_hash)
+
+    return _cached(flow_hash, build)
+
+
+def compile_flow(flow_data: Dict) -> FlowPlan:
+    flow_hash = hashlib.sha256(json.dumps(flow_data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return _cached(flow_hash, lambda: _build(flow_data, flow_hash))
+
+
+def _build(flow_data: Dict, flow_hash: str) -> FlowPlan:
+    if not isinstance(flow_data, dict):
+        plan = FlowPlan({}, flow_hash)
+        plan.errors.append("flow_data must be a JSON object with 'nodes' and 'edges'")
+        return plan
+    plan = FlowPlan(flow_data, flow_hash)
+    _link(plan)
+    _sort(plan)
+    _check_blocks(plan)
+    _compile_templates(plan)
+    return plan
+
+
+def _link(plan: FlowPlan):
+    for i, edge in enumerate(plan.edges):
+        src, dst = edge.get("from"), edge.get("to")
+        missing = [end for end in (src, dst) if end not in plan.nodes]
+        if missing:
+            plan.errors.append(f"Edge {i} ({src} -> {dst}) points to unknown node(s): {', '.join(map(str, missing))}")
+            continue
+        branch = edge.get("branch")
+        if branch is not None and str(branch).lower() not in BRANCH_LABELS:
+            plan.errors.append(f"Edge {src} -> {dst} has invalid branch '{branch}' (expected true/false)")
+        plan.children[src].append(dst)
+        plan.parents[dst].append(src)
+        plan.out_edges[src].append(edge)
+
+
+def _sort(plan: FlowPlan):
+    """Kahn's algorithm with levels; anything left over sits on a cycle."""
+    in_degree = {nid: len(p) for nid, p in plan.parents.items()}
+    level_of = {}
+    queue = deque(nid for nid, deg in in_degree.items() if deg == 0)
+    for nid in queue:
+        level_of[nid] = 0
+    while queue:
+        node = queue.popleft()
+        plan.order.append(node)
+        for child in plan.children[node]:
+            level_of[child] = max(level_of.get(child, 0), level_of[node] + 1)
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append(child)
+
+    cyclic = [nid for nid, deg in in_degree.items() if deg > 0]
+    if cyclic:
+        plan.errors.append(f"Cycle detected involving: {', '.join(sorted(cyclic))}")
+
+    for nid in plan.order:
+        while len(plan.levels) <= level_of[nid]:
+            plan.levels.append([])
+        plan.levels[level_of[nid]].append(nid)
+
+    # Ancestor sets as int bitmasks over topological positions: one OR per edge.
+    plan.position = {nid: i for i, nid in enumerate(plan.order)}
+    for nid in plan.order:
+        mask = 0
+        for parent in plan.parents[nid]:
+            mask |= plan.ancestor_mask[parent] | (1 << plan.position[parent])
+        plan.ancestor_mask[nid] = mask
+
+
+def _check_blocks(plan: FlowPlan):
+    from core.flow_engine import BLOCK_EXECUTORS
+    for nid, node in plan.nodes.items():
+        block_type = node.get("type", "") if isinstance(node, dict) else ""
+        if block_type not in BLOCK_EXECUTORS:
+            plan.errors.append(f"Block '{nid}' has unknown type '{block_type}'")
+            continue
+        config = node.get("config", {}) or {}
+        for field in REQUIRED_FIELDS.get(block_type, ()):
+            value = config.get(field)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                plan.errors.append(f"Block '{nid}' ({block_type}) is missing required field '{field}'")
+
+
+def _compile_templates(plan: FlowPlan):
+    """Parse every templated config field once and check its variables."""
+    for nid in plan.order:
+        node = plan.nodes[nid]
+        config = node.get("config", {}) or {}
+        compiled = {}
+        for field in TEMPLATE_FIELDS.get(node.get("type", ""), ()):
+            value = config.get(field)
+            if not isinstance(value, str):
+                continue
+            template = compile_template(value)
+            if template.is_static:
+                continue
+            compiled[field] = template
+            for name in template.names:
+                problem = _check_variable(plan, nid, name)
+                if problem:
+                    plan.warnings.append(f"{nid}.{field}: {{{{{name}}}}} {problem}")
+        if compiled:
+            plan.templates[nid] = compiled
+
+
+def _check_variable(plan: FlowPlan, node_id: str, name: str) -> Optional[str]:
+    source, _, key = name.partition(".")
+    if key and source in plan.nodes:
+        if not plan.is_upstream(source, node_id):
+            return f"refers to '{source}', which is not upstream of this block"
+        known = BLOCK_OUTPUT_KEYS.get(plan.nodes[source].get("type", ""))
+        if known is not None and key not in known:
+            return f"is not an output of '{source}'"
+        return None
+    for nid in plan.ancestors[node_id]:
+        known = BLOCK_OUTPUT_KEYS.get(plan.nodes[nid].get("type", ""))
+        if known is None or name in known:
+            return None
+    return "is not produced by any upstream block"
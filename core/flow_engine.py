@@ -2,22 +2,36 @@
 Wolfclaw Flows — DAG-based Visual Workflow Engine
 
 Each flow is a JSON graph of blocks (nodes) connected by edges.
-The engine resolves execution order via topological sort and passes
-data between blocks through a shared context dictionary.
+The engine resolves a topological order and runs every block as soon as
+all of its inputs have finished, so independent branches execute
+concurrently on a bounded thread pool (`max_parallel` in the flow data).
+A block sees the merged results of its upstream blocks only, which keeps
+its context identical no matter how the branches interleave.
+
+Edges leaving an IF block carry `"branch": "true"|"false"`; only the
+selected side runs, and blocks reachable solely through the other side are
+marked "skipped". A block fed by several branches runs if any of them
+reached it.
 """
 
 import json
 import logging
 import time
-from typing import Any, Dict, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime
 from core.ledger import log_mutation
+from core.tracing import span, wrap
+from core.flow_compiler import FlowPlan, compile_flow
+from core import flow_cache
 
 logger = logging.getLogger(__name__)
 
 # ─────────── BLOCK REGISTRY ───────────
 # Maps block type strings to executor functions.
 # Each executor receives (config: dict, context: dict, bot_id: str) and returns a result.
+# Template fields (see core.flow_templates.TEMPLATE_FIELDS) arrive already rendered.
 
 def _exec_manual_trigger(config: dict, context: dict, bot_id: str) -> dict:
     """Manual trigger with timezone support."""
@@ -40,13 +54,9 @@ def _exec_ai_prompt(config: dict, context: dict, bot_id: str) -> dict:
     from core.llm_engine import WolfEngine
 
     model = config.get("model", "gpt-4o")
-    prompt_template = config.get("prompt", "")
+    prompt = config.get("prompt", "")
     system = config.get("system_prompt", "You are a helpful assistant.")
 
-    # Resolve template variables from context
-    prompt = prompt_template
-    for key, value in context.items():
-        prompt = prompt.replace(f"{{{{{key}}}}}", str(value))
 
     engine = WolfEngine(model)
     messages = [{"role": "user", "content": prompt}]
@@ -67,9 +77,6 @@ def _exec_terminal_command(config: dict, context: dict, bot_id: str) -> dict:
     """Execute a local terminal command."""
     from core.tools import run_terminal_command
     command = config.get("command", "")
-    # Resolve template variables
-    for key, value in context.items():
-        command = command.replace(f"{{{{{key}}}}}", str(value))
     
     # Log to ledger
     if bot_id:
@@ -83,8 +90,6 @@ def _exec_web_search(config: dict, context: dict, bot_id: str) -> dict:
     """Run a web search query."""
     from core.tools import web_search as web_search_tool
     query = config.get("query", "")
-    for key, value in context.items():
-        query = query.replace(f"{{{{{key}}}}}", str(value))
     
     # Log to ledger
     if bot_id:
@@ -124,11 +129,7 @@ def _exec_condition(config: dict, context: dict, bot_id: str) -> dict:
 
 def _exec_output(config: dict, context: dict, bot_id: str) -> dict:
     """Output block — formats and returns the final result."""
-    template = config.get("message", "Flow completed.")
-    for key, value in context.items():
-        template = template.replace(f"{{{{{key}}}}}", str(value))
-    
-    return {"message": template}
+    return {"message": config.get("message", "Flow completed.")}
 
 
 def _exec_screenshot(config: dict, context: dict, bot_id: str) -> dict:
@@ -175,11 +176,6 @@ def _exec_http_request(config: dict, context: dict, bot_id: str) -> dict:
     headers = config.get("headers", {})
     body = config.get("body", "")
     
-    # Resolve templates
-    for key, value in context.items():
-        url = url.replace(f"{{{{{key}}}}}", str(value))
-        body = body.replace(f"{{{{{key}}}}}", str(value))
-    
     if not _is_safe_url(url):
         return {"error": f"Security Block: URL '{url}' is restricted (Local/Private IP)."}
 
@@ -204,10 +200,24 @@ def _exec_http_request(config: dict, context: dict, bot_id: str) -> dict:
         return {"error": str(e)}
 
 
+MAX_INLINE_DELAY = 300           # seconds a delay may block a thread when it cannot park
+MAX_DELAY = 30 * 24 * 3600       # parked delays may last up to 30 days
+
+
+def _delay_seconds(config: dict) -> float:
+    try:
+        return max(0.0, min(float(config.get("seconds", 1)), MAX_DELAY))
+    except (TypeError, ValueError):
+        return 1.0
+
+
 def _exec_delay(config: dict, context: dict, bot_id: str) -> dict:
-    """Wait for a specified number of seconds."""
+    """
+    Wait for a specified number of seconds. Only used for inline runs (CLI,
+    run_flow); queued runs park instead of sleeping, see FlowEngine.
+    """
     seconds = config.get("seconds", 1)
-    time.sleep(min(seconds, 300))  # Cap at 5 minutes
+    time.sleep(min(_delay_seconds(config), MAX_INLINE_DELAY))
     return {"waited": seconds}
 
 
@@ -231,18 +241,12 @@ def _exec_send_email(config: dict, context: dict, bot_id: str) -> dict:
     """Simulate sending an email."""
     to_addr = config.get("to", "")
     subject = config.get("subject", "")
-    for key, value in context.items():
-        to_addr = to_addr.replace(f"{{{{{key}}}}}", str(value))
-        subject = subject.replace(f"{{{{{key}}}}}", str(value))
     return {"email_sent_to": to_addr, "subject": subject, "status": "success"}
 
 def _exec_send_telegram(config: dict, context: dict, bot_id: str) -> dict:
     """Send a Telegram message or simulate it."""
     chat_id = config.get("chat_id", "")
     message = config.get("message", "")
-    for key, value in context.items():
-        chat_id = chat_id.replace(f"{{{{{key}}}}}", str(value))
-        message = message.replace(f"{{{{{key}}}}}", str(value))
     return {"telegram_sent_to": chat_id, "message": message, "status": "success"}
 
 
@@ -283,61 +287,249 @@ BLOCK_CATALOG = [
 
 # ─────────── FLOW ENGINE ───────────
 
+DEFAULT_MAX_PARALLEL = 4
+MAX_PARALLEL_LIMIT = 16  # hard cap on threads a single flow run may use
+
+
 class FlowEngine:
-    def __init__(self, flow_data: dict, bot_id: str = None, max_steps: int = 50):
-        self.nodes = flow_data.get("nodes", {})
-        self.edges = flow_data.get("edges", [])
+    """
+    Executes a compiled FlowPlan (see core.flow_compiler); a plain flow dict
+    is compiled on the way in, reusing the cached plan when possible.
+
+    `completed` maps node ids to results restored from an earlier attempt;
+    those nodes are not executed again unless an upstream node had to run.
+    `on_step(log_entry, result)` is called on the engine thread as each step
+    finishes or is skipped, which is where core.flow_runs checkpoints it.
+    Setting `cancel_event` stops new steps from starting; steps already
+    running are allowed to finish.
+
+    With `park_delays`, a delay block does not sleep: it is checkpointed as
+    "waiting" with its deadline, the rest of the graph keeps going, and once
+    nothing else can run the engine returns status "parked" with
+    `resume_at`. Continuing the run later passes the saved deadlines back in
+    `delay_deadlines`.
+    """
+
+    def __init__(self, flow_data, bot_id: str = None, max_steps: int = 50,
+                 completed: Dict[str, Any] = None, on_step: Callable[[dict, Any], None] = None,
+                 cancel_event=None, park_delays: bool = False, delay_deadlines: Dict[str, float] = None,
+                 workspace_id: str = None):
+        plan = flow_data if isinstance(flow_data, FlowPlan) else compile_flow(flow_data)
+        self.plan = plan
+        self.nodes = plan.nodes
+        self.edges = plan.edges
+        self.parents = plan.parents
+        self.children = plan.children
+        self.out_edges = plan.out_edges
+        self.order = plan.order
+        self.ancestors = plan.ancestors
+        self.templates = plan.templates
+        self.warnings = plan.warnings
         self.bot_id = bot_id
+        self.workspace_id = workspace_id
         self.context: Dict[str, Any] = {}
         self.execution_log: List[dict] = []
         self.max_steps = max_steps
         self.step_count = 0
-    
-    def _topological_sort(self) -> List[str]:
-        in_degree = {nid: 0 for nid in self.nodes}
-        adjacency = {nid: [] for nid in self.nodes}
-        for edge in self.edges:
-            src, dst = edge["from"], edge["to"]
-            if src in adjacency and dst in in_degree:
-                adjacency[src].append(dst)
-                in_degree[dst] += 1
-        queue = [nid for nid, deg in in_degree.items() if deg == 0]
-        order = []
-        while queue:
-            node = queue.pop(0)
-            order.append(node)
-            for neighbor in adjacency.get(node, []):
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
-        return order
-    
+        self.completed = completed or {}
+        self.on_step = on_step
+        self.cancel_event = cancel_event
+        self.park_delays = park_delays
+        self.delay_deadlines = delay_deadlines or {}
+        try:
+            max_parallel = int(plan.flow_data.get("max_parallel", DEFAULT_MAX_PARALLEL))
+        except (TypeError, ValueError):
+            max_parallel = DEFAULT_MAX_PARALLEL
+        self.max_parallel = max(1, min(max_parallel, MAX_PARALLEL_LIMIT))
+
+    @staticmethod
+    def _edge_taken(edge: dict, result: Any) -> bool:
+        """
+        An edge labelled with `branch` ("true"/"false") is only followed when
+        its source returned the same branch; unlabelled edges always are.
+        """
+        label = edge.get("branch")
+        if label is None or not isinstance(result, dict) or "branch" not in result:
+            return True
+        return str(label).lower() == str(result["branch"]).lower()
+
+    def _render_config(self, node_id: str, config: dict, context: dict) -> dict:
+        templates = self.templates.get(node_id)
+        if not templates:
+            return config
+        rendered = dict(config)
+        for field, template in templates.items():
+            rendered[field] = template.render(context)
+        return rendered
+
+    @staticmethod
+    def _merge(node_ids: List[str], results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build a context from node results. Bare keys are applied first in the
+        given (topological) order, then namespaced `node_id.key` entries, so
+        a namespaced entry always wins over a colliding bare key.
+        """
+        context: Dict[str, Any] = {}
+        outputs = [(nid, results[nid]) for nid in node_ids if isinstance(results.get(nid), dict)]
+        for _, result in outputs:
+            context.update(result)
+        for nid, result in outputs:
+            for k, v in result.items():
+                context[f"{nid}.{k}"] = v
+        return context
+
+    def _run_node(self, node_id: str, block_type: str, executor, config: dict, context: dict) -> dict:
+        started = time.time()
+        cache_state = None
+        try:
+            with span(f"flow.node.{block_type}", node_id=node_id) as sp:
+                key, ttl, result = flow_cache.lookup(block_type, config, self.bot_id, self.workspace_id)
+                if key and result is not None:
+                    cache_state = "hit"
+                else:
+                    result = executor(config, context, self.bot_id)
+                    if key:
+                        cache_state = "miss"
+                        flow_cache.store(key, block_type, result, ttl)
+                if sp and cache_state:
+                    sp.set("cache", cache_state)
+            entry = {"node_id": node_id, "type": block_type, "status": "success", "result": result}
+            if isinstance(result, dict) and result.get("error"):
+                entry["status"] = "error"
+                entry["error"] = str(result["error"])
+        except Exception as e:
+            result = {"error": str(e)}
+            entry = {"node_id": node_id, "type": block_type, "status": "error", "error": str(e)}
+        if cache_state:
+            entry["cache"] = cache_state
+        entry["duration_ms"] = round((time.time() - started) * 1000, 1)
+        return {"result": result, "log": entry}
+
+    def _checkpoint(self, entry: dict, result: Any):
+        if not self.on_step:
+            return
+        try:
+            self.on_step(entry, result)
+        except Exception as e:
+            logger.error(f"Flow step checkpoint failed for {entry.get('node_id')}: {e}")
+
     def execute(self) -> dict:
         start_time = time.time()
-        order = self._topological_sort()
-        results = {}
-        for node_id in order:
-            if self.step_count >= self.max_steps: break
-            self.step_count += 1
-            node = self.nodes.get(node_id, {})
-            block_type = node.get("type", "")
-            config = node.get("config", {})
-            executor = BLOCK_EXECUTORS.get(block_type)
-            if not executor: continue
-            try:
-                result = executor(config, self.context, self.bot_id)
-                results[node_id] = result
-                if isinstance(result, dict):
-                    for k, v in result.items():
-                        self.context[f"{node_id}.{k}"] = v
-                        self.context[k] = v
-                self.execution_log.append({"node_id": node_id, "type": block_type, "status": "success", "result": result})
-            except Exception as e:
-                results[node_id] = {"error": str(e)}
-                self.execution_log.append({"node_id": node_id, "type": block_type, "status": "error", "error": str(e)})
+        order = self.order
+        position = {nid: i for i, nid in enumerate(order)}
+        ancestors = self.ancestors
+        remaining = {nid: len(self.parents[nid]) for nid in order}
+        live_inputs = {nid: 0 for nid in order}
+        results: Dict[str, Any] = {}
+        log_entries: Dict[str, dict] = {}
+        ready = deque(nid for nid in order if remaining[nid] == 0)
+        running = {}
+        rerun = set()
+        cancelled = False
+        parked: Dict[str, float] = {}
+
+        def resolve(node_id: str, result: Any = None, skipped: bool = False):
+            """
+            Settle a node's outgoing edges. A node becomes ready once every
+            incoming edge is settled and at least one was taken (OR-join);
+            if none were, it is skipped and its own edges go dead in turn.
+            """
+            pending = [(node_id, result, skipped)]
+            while pending:
+                nid, res, dead = pending.pop()
+                for edge in self.out_edges[nid]:
+                    child = edge["to"]
+                    if child not in remaining:
+                        continue
+                    remaining[child] -= 1
+                    if not dead and self._edge_taken(edge, res):
+                        live_inputs[child] += 1
+                    if remaining[child] == 0:
+                        if live_inputs[child]:
+                            ready.append(child)
+                        else:
+                            entry = {"node_id": child, "type": self.nodes[child].get("type", ""), "status": "skipped"}
+                            log_entries[child] = entry
+                            self._checkpoint(entry, None)
+                            pending.append((child, None, True))
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="FlowNode") as pool:
+            while ready or running:
+                if ready and self.cancel_event is not None and self.cancel_event.is_set():
+                    ready.clear()
+                    cancelled = True
+                while ready and len(running) < self.max_parallel:
+                    node_id = ready.popleft()
+                    node = self.nodes.get(node_id, {})
+                    block_type = node.get("type", "")
+                    # Reuse a checkpoint only if nothing upstream had to run again.
+                    if node_id in self.completed and not any(a in rerun for a in ancestors[node_id]):
+                        results[node_id] = self.completed[node_id]
+                        log_entries[node_id] = {"node_id": node_id, "type": block_type, "status": "restored",
+                                                "result": results[node_id]}
+                        resolve(node_id, results[node_id])
+                        continue
+                    if block_type == "delay" and self.park_delays:
+                        seconds = _delay_seconds(node.get("config", {}) or {})
+                        deadline = self.delay_deadlines.get(node_id)
+                        if deadline is None:
+                            deadline = time.time() + seconds
+                        if time.time() < deadline:
+                            parked[node_id] = deadline
+                            entry = {"node_id": node_id, "type": block_type, "status": "waiting",
+                                     "resume_at": deadline}
+                            log_entries[node_id] = entry
+                            self._checkpoint(entry, {"resume_at": deadline, "seconds": seconds})
+                            continue
+                        rerun.add(node_id)
+                        results[node_id] = {"waited": seconds}
+                        log_entries[node_id] = {"node_id": node_id, "type": block_type, "status": "success",
+                                                "result": results[node_id]}
+                        self._checkpoint(log_entries[node_id], results[node_id])
+                        resolve(node_id, results[node_id])
+                        continue
+                    executor = BLOCK_EXECUTORS.get(block_type)
+                    if not executor or self.step_count >= self.max_steps:
+                        resolve(node_id)
+                        continue
+                    self.step_count += 1
+                    rerun.add(node_id)
+                    context = self._merge(ancestors[node_id], results)
+                    config = self._render_config(node_id, node.get("config", {}) or {}, context)
+                    future = pool.submit(wrap(self._run_node), node_id, block_type, executor,
+                                         config, context)
+                    running[future] = node_id
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_id = running.pop(future)
+                    outcome = future.result()
+                    results[node_id] = outcome["result"]
+                    log_entries[node_id] = outcome["log"]
+                    self._checkpoint(outcome["log"], outcome["result"])
+                    resolve(node_id, outcome["result"])
+
+        executed = sorted(results, key=position.__getitem__)
+        self.execution_log = [log_entries[nid] for nid in sorted(log_entries, key=position.__getitem__)]
+        self.context = self._merge(executed, results)
         elapsed = round(time.time() - start_time, 2)
-        return {"status": "completed", "elapsed_seconds": elapsed, "results": results, "log": self.execution_log}
+        cache_stats = {"hits": 0, "misses": 0}
+        for entry in self.execution_log:
+            if entry.get("cache") == "hit":
+                cache_stats["hits"] += 1
+            elif entry.get("cache") == "miss":
+                cache_stats["misses"] += 1
+        status = "cancelled" if cancelled else "parked" if parked else "completed"
+        outcome = {"status": status, "elapsed_seconds": elapsed,
+                   "results": {nid: results[nid] for nid in executed}, "log": self.execution_log,
+                   "warnings": self.warnings, "cache": cache_stats}
+        if status == "parked":
+            outcome["resume_at"] = min(parked.values())
+        return outcome
 
 def run_flow(flow_data: dict, bot_id: str = None) -> dict:
     engine = FlowEngine(flow_data, bot_id=bot_id)
-    return engine.execute()
+    with span("flow.run", root=True, nodes=len(engine.nodes), max_parallel=engine.max_parallel):
+        return engine.execute()
@@ -0,0 +1,255 @@
+"""
+Background flow execution.
+
+`POST /flows/{id}/run` only enqueues: the run row is created as 'queued'
+and its id returned immediately, while a fixed pool of worker threads
+executes runs through core.flow_runs. At most `per_workspace` runs of one
+workspace execute at once; further runs of that workspace wait without
+blocking other workspaces. Queued runs can be cancelled outright; running
+ones stop dispatching new steps.
+
+A run that reaches a delay block parks instead of holding its worker: the
+runner schedules a continuation on the shared timer service and re-queues
+the run when the delay expires. Parked runs are re-armed from the database
+at startup (`restore_parked`).
+
+Clients poll GET /flows/runs/{run_id} or listen on /api/stream with
+topics=flow.run.* (flow.run.queued / started / step / parked / finished).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from core import flow_runs, local_db
+from core.bus import bus
+from core.timers import timers
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("run_id", "flow_id", "workspace_id", "bot_id", "resume", "enqueued_at", "cancel_event")
+
+    def __init__(self, run_id: str, flow_id: str, workspace_id: str, bot_id: str = None, resume: bool = False):
+        self.run_id = run_id
+        self.flow_id = flow_id
+        self.workspace_id = workspace_id
+        self.bot_id = bot_id
+        self.resume = resume
+        self.enqueued_at = time.monotonic()
+        self.cancel_event = threading.Event()
+
+
+class FlowRunner:
+    def __init__(self, max_workers: int = 4, per_workspace: int = 2, max_queue: int = 500,
+                 keep_results: int = 100):
+        self.max_workers = max_workers
+        self.per_workspace = per_workspace
+        self.max_queue = max_queue
+        self.keep_results = keep_results
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._running: Dict[str, _Job] = {}
+        self._running_per_ws: Dict[str, int] = {}
+        self._results: "OrderedDict[str, Dict]" = OrderedDict()
+        self._workers = []
+        self._parked = set()
+        self._restored = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                       "parked": 0, "wait_ms_total": 0.0, "started": 0}
+
+    # ----------- SUBMISSION -----------
+
+    def submit(self, flow_id: str, workspace_id: str, flow_data, bot_id: str = None) -> str:
+        """Queue a new run of a flow (dict or stored JSON text). Returns the run id."""
+        self._check_capacity()
+        run_id = flow_runs.create_run(flow_id, workspace_id, flow_data, status="queued")
+        self._enqueue(_Job(run_id, flow_id, workspace_id, bot_id, resume=False))
+        return run_id
+
+    def submit_resume(self, run: Dict, bot_id: str = None) -> str:
+        """Queue a resume of a failed or interrupted run."""
+        flow_runs.check_resumable(run)
+        self._check_capacity()
+        local_db.set_flow_run_status(run["id"], "queued")
+        self._enqueue(_Job(run["id"], run["flow_id"], run["workspace_id"], bot_id, resume=True))
+        return run["id"]
+
+    def _check_capacity(self):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFullError(f"Flow queue is full ({self.max_queue} runs waiting).")
+
+    def _enqueue(self, job: _Job):
+        flow_runs.track(job.run_id)
+        with self._cond:
+            self._queue.append(job)
+            self._stats["submitted"] += 1
+            position = len(self._queue)
+            self._ensure_workers()
+            self._cond.notify_all()
+        bus.publish("flow.run.queued", {"run_id": job.run_id, "flow_id": job.flow_id, "workspace_id": job.workspace_id,
+                                        "position": position})
+
+    def _ensure_workers(self):
+        # Called under self._cond
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            w = threading.Thread(target=self._worker_loop, name=f"FlowWorker-{len(self._workers)}", daemon=True)
+            w.start()
+            self._workers.append(w)
+
+    # ----------- DELAY CONTINUATIONS -----------
+
+    @staticmethod
+    def _timer_key(run_id: str) -> str:
+        return f"flow_run:{run_id}"
+
+    def _park(self, run_id: str, resume_at: float):
+        with self._cond:
+            self._parked.add(run_id)
+        timers.schedule(resume_at, self._timer_key(run_id), lambda: self._continue(run_id))
+
+    def _continue(self, run_id: str):
+        """Timer callback: put a parked run back on the queue."""
+        with self._cond:
+            self._parked.discard(run_id)
+        run = local_db.get_flow_run(run_id)
+        if not run or run["status"] != "parked":
+            return
+        local_db.set_flow_run_status(run_id, "queued")
+        self._enqueue(_Job(run_id, run["flow_id"], run["workspace_id"]))
+
+    def restore_parked(self) -> int:
+        """Re-arm timers for runs parked before the last shutdown. Idempotent."""
+        with self._cond:
+            if self._restored:
+                return 0
+            self._restored = True
+        parked = local_db.get_parked_flow_runs()
+        for run in parked:
+            self._park(run["id"], run["resume_at"] or time.time())
+        if parked:
+            logger.info(f"Restored {len(parked)} parked flow runs")
+        return len(parked)
+
+    # ----------- CANCELLATION -----------
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancel a queued, running or parked run. Returns False if there is nothing to cancel."""
+        with self._cond:
+            running = self._running.get(run_id)
+            if running:
+                running.cancel_event.set()
+                logger.info(f"Cancellation requested for running flow {run_id}")
+                return True
+            queued = next((job for job in self._queue if job.run_id == run_id), None)
+            if queued:
+                self._queue.remove(queued)
+                self._stats["cancelled"] += 1
+
+        if queued:
+            flow_id, workspace_id, error = queued.flow_id, queued.workspace_id, "Cancelled before start."
+        else:
+            run = local_db.get_flow_run(run_id)
+            if not run or run["status"] != "parked":
+                return False
+            timers.cancel(self._timer_key(run_id))
+            with self._cond:
+                self._parked.discard(run_id)
+                self._stats["cancelled"] += 1
+            flow_id, workspace_id, error = run["flow_id"], run["workspace_id"], "Cancelled while waiting on a delay."
+        flow_runs.untrack(run_id)
+        local_db.finish_flow_run(run_id, "cancelled", 0.0, error)
+        bus.publish("flow.run.finished", {"run_id": run_id, "flow_id": flow_id, "workspace_id": workspace_id,
+                                          "status": "cancelled"})
+        return True
+
+    # ----------- WORKERS -----------
+
+    def _next_job(self) -> _Job:
+        """Block until a queued job whose workspace is under its cap is available."""
+        with self._cond:
+            while True:
+                for job in self._queue:
+                    if self._running_per_ws.get(job.workspace_id, 0) < self.per_workspace:
+                        self._queue.remove(job)
+                        self._running[job.run_id] = job
+                        self._running_per_ws[job.workspace_id] = self._running_per_ws.get(job.workspace_id, 0) + 1
+                        self._stats["started"] += 1
+                        self._stats["wait_ms_total"] += (time.monotonic() - job.enqueued_at) * 1000
+                        return job
+                self._cond.wait()
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            outcome = "failed"
+            try:
+                result = flow_runs.execute_run(job.run_id, bot_id=job.bot_id, resume=job.resume,
+                                               cancel_event=job.cancel_event, park_delays=True)
+                outcome = result["status"]
+                if outcome == "parked":
+                    self._park(job.run_id, result["resume_at"])
+                else:
+                    self._remember(job.run_id, result)
+            except Exception as e:
+                logger.error(f"Flow run {job.run_id} crashed: {e}")
+                self._remember(job.run_id, {"run_id": job.run_id, "status": "failed", "error": str(e)})
+            finally:
+                with self._cond:
+                    self._running.pop(job.run_id, None)
+                    self._running_per_ws[job.workspace_id] -= 1
+                    if not self._running_per_ws[job.workspace_id]:
+                        del self._running_per_ws[job.workspace_id]
+                    self._stats[outcome if outcome in ("completed", "cancelled", "parked") else "failed"] += 1
+                    self._cond.notify_all()
+
+    def _remember(self, run_id: str, result: Dict):
+        with self._cond:
+            self._results[run_id] = result
+            self._results.move_to_end(run_id)
+            while len(self._results) > self.keep_results:
+                self._results.popitem(last=False)
+
+    # ----------- INTROSPECTION -----------
+
+    def get_result(self, run_id: str) -> Optional[Dict]:
+        """Full engine result of a recently finished run (kept in memory only)."""
+        with self._cond:
+            return self._results.get(run_id)
+
+    def queue_position(self, run_id: str) -> Optional[int]:
+        with self._cond:
+            for i, job in enumerate(self._queue):
+                if job.run_id == run_id:
+                    return i + 1
+        return None
+
+    def get_metrics(self) -> Dict:
+        with self._cond:
+            started = self._stats["started"]
+            return {
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "running_per_workspace": dict(self._running_per_ws),
+                "parked": len(self._parked),
+                "max_workers": self.max_workers,
+                "per_workspace_limit": self.per_workspace,
+                "max_queue": self.max_queue,
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "cancelled": self._stats["cancelled"],
+                "parked_total": self._stats["parked"],
+                "avg_queue_wait_ms": round(self._stats["wait_ms_total"] / started, 1) if started else 0.0,
+            }
+
+# Singleton
+flow_runner = FlowRunner()
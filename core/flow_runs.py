@@ -0,0 +1,144 @@
+"""
+Durable flow runs.
+
+Every run gets a `flow_runs` row holding a snapshot of the flow definition,
+and each step is checkpointed to `flow_steps` as soon as it finishes. A run
+that failed or was interrupted (process exit mid-run) can be resumed: steps
+that already succeeded are restored from their checkpoints instead of being
+executed (and paid for) again.
+
+Runs executed by core.flow_runner park on delay blocks instead of sleeping
+(status 'parked' with resume_at); the runner's timer continues them.
+
+Progress is published on the event bus as flow.run.started, flow.run.step,
+flow.run.parked and flow.run.finished.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from core import local_db
+from core.bus import bus
+from core.flow_compiler import FlowPlan, compile_flow_json
+from core.flow_engine import FlowEngine
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_active_runs = set()
+_active_lock = threading.Lock()
+
+
+def track(run_id: str):
+    """Mark a run as owned by this process (queued or executing)."""
+    with _active_lock:
+        _active_runs.add(run_id)
+
+
+def untrack(run_id: str):
+    with _active_lock:
+        _active_runs.discard(run_id)
+
+
+def is_active(run_id: str) -> bool:
+    with _active_lock:
+        return run_id in _active_runs
+
+
+def effective_status(run: Dict) -> str:
+    """A queued/running row that no live worker in this process owns was interrupted."""
+    if run["status"] in ("queued", "running") and not is_active(run["id"]):
+        return "interrupted"
+    return run["status"]
+
+
+def create_run(flow_id: str, ws_id: str, flow_data, status: str = "running") -> str:
+    """`flow_data` may be the stored JSON text, which keeps the compiled-plan cache warm."""
+    flow_json = flow_data if isinstance(flow_data, str) else json.dumps(flow_data)
+    return local_db.create_flow_run(flow_id, ws_id, flow_json, status=status)
+
+
+def check_resumable(run: Dict):
+    status = effective_status(run)
+    if status in ("queued", "running"):
+        raise ValueError("Run is still in progress.")
+    if status == "completed":
+        raise ValueError("Run already completed; nothing to resume.")
+    if status == "parked":
+        raise ValueError("Run is waiting on a delay and will continue automatically.")
+
+
+def execute_run(run_id: str, bot_id: str = None, resume: bool = False,
+                cancel_event: threading.Event = None, park_delays: bool = False) -> Dict:
+    """
+    Execute a run row. `resume` retries a failed/interrupted run as a new
+    attempt; a parked run is simply continued (same attempt) because its
+    successful and waiting steps are restored either way.
+    """
+    run = local_db.get_flow_run(run_id)
+    if not run:
+        raise KeyError(run_id)
+    # Empty for a fresh run; checkpoints of earlier attempts/continuations otherwise.
+    completed = local_db.get_successful_flow_steps(run_id)
+    deadlines = local_db.get_waiting_flow_steps(run_id)
+    if resume:
+        attempt = local_db.restart_flow_run(run_id)
+        logger.info(f"Resuming flow run {run_id} (attempt {attempt}, {len(completed)} steps restored)")
+    else:
+        attempt = run["attempt"]
+        local_db.set_flow_run_status(run_id, "running")
+    return _execute(run_id, run["flow_id"], compile_flow_json(run["flow_data"]), completed, attempt,
+                    bot_id, cancel_event, park_delays, deadlines, workspace_id=run["workspace_id"])
+
+
+def _execute(run_id: str, flow_id: str, plan: FlowPlan, completed: Dict[str, Any],
+             attempt: int, bot_id: str = None, cancel_event: threading.Event = None,
+             park_delays: bool = False, deadlines: Dict[str, float] = None, workspace_id: str = None) -> Dict:
+    # Every event names the run's workspace so push clients only see their own runs.
+    ids = {"run_id": run_id, "flow_id": flow_id, "workspace_id": workspace_id}
+
+    def checkpoint(entry: Dict, result: Any):
+        local_db.save_flow_step(run_id, entry["node_id"], entry.get("type", ""), entry["status"],
+                                result=result, error=entry.get("error", ""), attempt=attempt,
+                                duration_ms=entry.get("duration_ms"))
+        bus.publish("flow.run.step", {**ids, "node_id": entry["node_id"],
+                                      "type": entry.get("type", ""), "status": entry["status"]})
+
+    track(run_id)
+    bus.publish("flow.run.started", {**ids, "attempt": attempt})
+    started = time.time()
+    try:
+        engine = FlowEngine(plan, bot_id=bot_id, completed=completed, on_step=checkpoint,
+                            cancel_event=cancel_event, park_delays=park_delays, delay_deadlines=deadlines,
+                            workspace_id=workspace_id)
+        with span("flow.run", root=True, flow_id=flow_id, run_id=run_id, attempt=attempt,
+                  nodes=len(engine.nodes)):
+            result = engine.execute()
+    except Exception as e:
+        local_db.finish_flow_run(run_id, "failed", round(time.time() - started, 2), str(e))
+        bus.publish("flow.run.finished", {**ids, "status": "failed"})
+        raise
+    finally:
+        untrack(run_id)
+
+    if result["status"] == "parked":
+        local_db.park_flow_run(run_id, result["resume_at"], result["elapsed_seconds"])
+        bus.publish("flow.run.parked", {**ids, "resume_at": result["resume_at"]})
+        result.update({"run_id": run_id, "attempt": attempt})
+        return result
+
+    failed = [entry["node_id"] for entry in result["log"] if entry["status"] == "error"]
+    if result["status"] == "cancelled":
+        status, error = "cancelled", "Cancelled by user."
+    elif failed:
+        status, error = "failed", f"{len(failed)} step(s) failed: {', '.join(failed)}"
+    else:
+        status, error = "completed", ""
+    # Total active time over every segment, not just this continuation.
+    result["elapsed_seconds"] = local_db.finish_flow_run(run_id, status, result["elapsed_seconds"], error)
+    bus.publish("flow.run.finished", {**ids, "status": status,
+                                      "elapsed_seconds": result["elapsed_seconds"]})
+    result.update({"run_id": run_id, "status": status, "attempt": attempt})
+    return result
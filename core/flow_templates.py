@@ -0,0 +1,58 @@
+"""
+Compiled `{{var}}` templates for flow block configs.
+
+A config string is parsed once into alternating literal and variable
+segments; rendering is a single join that only looks up the variables the
+template actually references. Unknown variables are left as-is
+(`{{name}}`), matching the old str.replace behaviour.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+_VAR = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+# Config fields rendered as templates, per block type.
+TEMPLATE_FIELDS = {
+    "ai_prompt":        ("prompt",),
+    "terminal_command": ("command",),
+    "web_search":       ("query",),
+    "output":           ("message",),
+    "http_request":     ("url", "body"),
+    "send_email":       ("to", "subject"),
+    "send_telegram":    ("chat_id", "message"),
+}
+
+
+class Template:
+    __slots__ = ("source", "literals", "names")
+
+    def __init__(self, source: str, literals: Tuple[str, ...], names: Tuple[str, ...]):
+        self.source = source
+        self.literals = literals  # always len(names) + 1
+        self.names = names
+
+    @property
+    def is_static(self) -> bool:
+        return not self.names
+
+    def render(self, context: Dict[str, Any]) -> str:
+        if not self.names:
+            return self.source
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            out.append(str(context[name]) if name in context else "{{" + name + "}}")
+            out.append(literal)
+        return "".join(out)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(source: str) -> Template:
+    literals, names = [], []
+    pos = 0
+    for m in _VAR.finditer(source):
+        literals.append(source[pos:m.start()])
+        names.append(m.group(1))
+        pos = m.end()
+    literals.append(source[pos:])
+    return Template(source, tuple(literals), tuple(names))
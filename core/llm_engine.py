@@ -7,6 +7,7 @@ import re
 import json
 import platform
 import logging
+import threading
 from litellm import completion
 from .config import get_key
 from .tools import WOLFCLAW_TOOLS, execute_tool
@@ -15,9 +16,89 @@ from .ledger import log_mutation
 from .vault import decrypt_key
 from .heartbeat import heartbeat
 from .wallet import check_budget, log_spend
+from .tracing import span
+from .output_capture import owned_by
 
 logger = logging.getLogger(__name__)
 
+
+# Rough cost estimation (USD per 1M tokens)
+COST_MAP = {
+    'gpt-4o': {'input': 2.50, 'output': 10.00},
+    'gpt-4o-mini': {'input': 0.15, 'output': 0.60},
+    'claude-3-5-sonnet': {'input': 3.00, 'output': 15.00},
+    'llama': {'input': 0.50, 'output': 0.50},
+}
+DEFAULT_COST_RATE = {'input': 0.50, 'output': 0.50}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call; the most specific COST_MAP key in the model name wins."""
+    cost_rate = DEFAULT_COST_RATE
+    for key in sorted(COST_MAP, key=len, reverse=True):
+        if key in (model or "").lower():
+            cost_rate = COST_MAP[key]
+            break
+    return (prompt_tokens * cost_rate['input'] + completion_tokens * cost_rate['output']) / 1_000_000
+
+
+def usage_report(response) -> dict:
+    """Prompt/completion token counts of a response, with the prompt split into cached and uncached."""
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    # OpenAI (and LiteLLM's normalized form) report prompt_tokens_details.cached_tokens;
+    # Anthropic reports cache_read_input_tokens.
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    if not cached:
+        cached = getattr(usage, "cache_read_input_tokens", 0)
+    cached = min(int(cached or 0), prompt_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached,
+        "uncached_prompt_tokens": prompt_tokens - cached,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+def _set_usage(response, report: dict):
+    """Overwrite a response's usage with `report` (a usage_report dict), in place."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    usage.prompt_tokens = report["prompt_tokens"]
+    usage.completion_tokens = report["completion_tokens"]
+    usage.total_tokens = report["prompt_tokens"] + report["completion_tokens"]
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        details["cached_tokens"] = report["cached_prompt_tokens"]
+    elif details is not None:
+        details.cached_tokens = report["cached_prompt_tokens"]
+    if getattr(usage, "cache_read_input_tokens", None) is not None:
+        usage.cache_read_input_tokens = report["cached_prompt_tokens"]
+
+
+def _supports_cache_control(model: str) -> bool:
+    return (model or "").lower().startswith(("claude", "anthropic/"))
+
+
+def _supports_stream_usage(model: str) -> bool:
+    """Providers that send a final usage chunk when asked via stream_options."""
+    return (model or "").lower().startswith(("gpt", "openai/", "claude", "anthropic/", "gemini", "nvidia_nim/"))
+
+
+# Filtered global SOUL.md per path, reused until the file changes: one read
+# per edit, and the same string in every system prompt.
+_soul_cache = {}  # path -> (mtime, text)
+_soul_lock = threading.Lock()
+
+
+class ChatCancelled(Exception):
+    """Raised when a chat is aborted through its cancel_event."""
+
 # Ref: PAM-Sovereign-Orchestration
 
 class WolfEngine:
@@ -47,7 +128,7 @@ class WolfEngine:
             # Check for Ollama
             response = requests.get("http://localhost:11434/api/tags", timeout=1)
             if response.status_code == 200:
-                print("INFO: Local AI (Ollama) detected. Defaulting to local model.")
+                logger.info("Local AI (Ollama) detected. Defaulting to local model.")
                 # If model_name is generic like 'auto', use a default local one
                 if model_name in ["auto", "default"]:
                     return "ollama/llama3"
@@ -62,12 +143,20 @@ class WolfEngine:
     # ----------- SOUL.md / MEMORY / USER CONTEXT LOADING -----------
 
     def _load_global_soul(self) -> str:
-        """Load and filter the global SOUL.md based on OS."""
+        """Load and filter the global SOUL.md based on OS (cached until the file changes)."""
         soul_paths = [
             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SOUL.md"),
             os.path.join(os.getcwd(), "SOUL.md"),
         ]
         for soul_path in soul_paths:
+            try:
+                mtime = os.stat(soul_path).st_mtime
+            except OSError:
+                continue
+            with _soul_lock:
+                cached = _soul_cache.get(soul_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
             if os.path.exists(soul_path):
                 try:
                     with open(soul_path, "r", encoding="utf-8") as f:
@@ -81,7 +170,10 @@ class WolfEngine:
                         raw_soul = re.sub(r'\[WINDOWS_ONLY_START\].*?\[WINDOWS_ONLY_END\]', '', raw_soul, flags=re.DOTALL)
                         raw_soul = raw_soul.replace("[LINUX_ONLY_START]", "").replace("[LINUX_ONLY_END]", "")
                     
-                    return raw_soul.strip()
+                    soul = raw_soul.strip()
+                    with _soul_lock:
+                        _soul_cache[soul_path] = (mtime, soul)
+                    return soul
                 except:
                     pass
         return ""
@@ -163,6 +255,70 @@ class WolfEngine:
 
         return kwargs
 
+    @staticmethod
+    def _cacheable_messages(model: str, full_messages: list, prefix_len: int) -> list:
+        """
+        For providers with explicit prompt caching (Anthropic), send the system
+        prompt as two blocks with cache breakpoints: the shared prefix (core
+        directives + shared context, `prefix_len` chars) and the rest.
+        Other providers cache identical prefixes on their own.
+        """
+        if not _supports_cache_control(model) or not full_messages or full_messages[0].get("role") != "system":
+            return full_messages
+        text = full_messages[0]["content"]
+        blocks = [part for part in (text[:prefix_len], text[prefix_len:].lstrip("\n")) if part]
+        system = {"role": "system", "content": [
+            {"type": "text", "text": part, "cache_control": {"type": "ephemeral"}} for part in blocks
+        ]}
+        return [system] + full_messages[1:]
+
+    def _complete(self, kwargs: dict, phase: str = "completion", on_token=None, cancel_event=None):
+        """
+        Run one LiteLLM completion inside a tracing span. With `on_token` or
+        `cancel_event` the call is streamed: each text delta goes to
+        on_token, and a set cancel_event aborts it with ChatCancelled.
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise ChatCancelled("Chat cancelled.")
+        with span(f"llm.{phase}", model=kwargs.get("model"), messages=len(kwargs.get("messages", []))) as sp:
+            if on_token is None and cancel_event is None:
+                response = completion(**kwargs)
+            else:
+                response = self._complete_streaming(kwargs, on_token, cancel_event)
+            if sp is not None and getattr(response, "usage", None) is not None:
+                report = usage_report(response)
+                sp.set("prompt_tokens", report["prompt_tokens"])
+                sp.set("cached_prompt_tokens", report["cached_prompt_tokens"])
+                sp.set("completion_tokens", report["completion_tokens"])
+            return response
+
+    def _complete_streaming(self, kwargs: dict, on_token, cancel_event):
+        """Stream a completion and rebuild the full response (tool calls included) from its chunks."""
+        from litellm import stream_chunk_builder
+        stream_kwargs = dict(kwargs, stream=True)
+        if _supports_stream_usage(kwargs.get("model")):
+            # Without this streamed calls carry no usage, cached_tokens included.
+            stream_kwargs["stream_options"] = {"include_usage": True}
+        stream = completion(**stream_kwargs)
+        chunks = []
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ChatCancelled("Chat cancelled.")
+                chunks.append(chunk)
+                delta = getattr(chunk.choices[0], "delta", None) if chunk.choices else None
+                text = getattr(delta, "content", None)
+                if text and on_token is not None:
+                    on_token(text)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None and cancel_event is not None and cancel_event.is_set():
+                try:
+                    close()  # drop the HTTP connection so the provider stops generating
+                except Exception:
+                    pass
+        return stream_chunk_builder(chunks, messages=kwargs.get("messages"))
+
     # ----------- MEMORY REFLECTION -----------
 
     def _reflect_to_memory(self, bot_id: str, messages: list):
@@ -192,7 +348,7 @@ class WolfEngine:
             kwargs = self._build_completion_kwargs(self.model_name, reflection_prompt)
             kwargs.pop("tools", None)  # No tools needed for reflection
             
-            response = completion(**kwargs)
+            response = self._complete(kwargs, phase="reflection")
             new_facts = response.choices[0].message.content
             
             if new_facts and "NO_NEW_FACTS" not in new_facts:
@@ -206,27 +362,49 @@ class WolfEngine:
 
     # ----------- MAIN CHAT METHOD -----------
 
-    def chat(self, messages: list, system_prompt: str = None, stream: bool = False, bot_id: str = None):
+    def chat(self, messages: list, system_prompt: str = None, stream: bool = False, bot_id: str = None,
+             on_token=None, cancel_event=None, tool_names: list = None, shared_context: str = None):
         """
         Send a chat request with multi-model fallback.
         messages: list of dicts [{"role": "user", "content": "..."}]
         bot_id: optional, used to load per-bot context and save memory
+        on_token: optional callable receiving each text delta as it arrives
+        cancel_event: optional threading.Event; setting it aborts the chat with ChatCancelled
+        tool_names: optional list of tool names the model may call (None = all, [] = none)
+        shared_context: optional text common to several calls (e.g. every agent of a
+            War Room turn); it goes right after the core directives so those calls
+            share a byte-identical, provider-cacheable prompt prefix
         """
+        # A root when called outside a request (channel bots, agents on worker threads).
+        with span("llm.chat", root=True, model=self.model_name, bot_id=bot_id, user_id=self.user_id):
+            return self._chat(messages, system_prompt=system_prompt, stream=stream, bot_id=bot_id,
+                              on_token=on_token, cancel_event=cancel_event, tool_names=tool_names,
+                              shared_context=shared_context)
+
+    def _chat(self, messages: list, system_prompt: str = None, stream: bool = False, bot_id: str = None,
+              on_token=None, cancel_event=None, tool_names: list = None, shared_context: str = None):
         full_messages = []
         system_parts = []
         
         # Build comprehensive system prompt
         # 1. Global Soul (Base Directives)
-        global_soul = self._load_global_soul()
+        with span("llm.prompt_assembly", bot_id=bot_id):
+            global_soul = self._load_global_soul()
+            bot_context = self._load_bot_context(bot_id)
+
         if global_soul:
             system_parts.append(f"# CORE DIRECTIVES\n{global_soul}")
 
+        # Shared context - identical across the calls that pass it, so it belongs in the cached prefix
+        if shared_context:
+            system_parts.append(f"# SHARED CONTEXT\n{shared_context}")
+        prefix_len = len("\n\n".join(system_parts))
+
         # 2. External Context (RAG, documents) - passed via system_prompt argument
         if system_prompt:
             system_parts.append(f"# EXTERNAL CONTEXT\n{system_prompt}")
 
         # 3. Personal Identity & Long-Term Context (Bot SOUL, User Context, Memory)
-        bot_context = self._load_bot_context(bot_id)
         if bot_context:
             system_parts.append(bot_context)
 
@@ -238,7 +416,7 @@ class WolfEngine:
 
         # --- BUDGET CHECK ---
         if bot_id and not check_budget(bot_id):
-            print(f"CRITICAL: Bot {bot_id} has exceeded its daily budget. Execution blocked.")
+            logger.error(f"Bot {bot_id} has exceeded its daily budget. Execution blocked.")
             log_mutation(bot_id, "budget_block", {"status": "failed", "reason": "Monthly/Daily budget reached"})
             raise RuntimeError(f"Budget exceeded for bot {bot_id}")
 
@@ -252,13 +430,22 @@ class WolfEngine:
             while retries > 0:
                 try:
                     if i > 0 or retries < 3:
-                        logger.info(f"Attempting model: {model} (Retry: {3-retries})")
+                        logger.info("Attempting model: %s (Retry: %d)", model, 3 - retries)
                     
                     kwargs = self._build_completion_kwargs(model, full_messages, stream)
-                    response = completion(**kwargs)
+                    if tool_names is not None:
+                        allowed = [t for t in kwargs["tools"] if t["function"]["name"] in tool_names]
+                        if allowed:
+                            kwargs["tools"] = allowed
+                        else:
+                            kwargs.pop("tools")
+                    kwargs["messages"] = self._cacheable_messages(model, full_messages, prefix_len)
+                    response = self._complete(kwargs, on_token=on_token, cancel_event=cancel_event)
                     if bot_id:
                         log_event(bot_id, "chat_message", status="success", details={"model": model})
                     break # Success!
+                except ChatCancelled:
+                    raise
                 except Exception as e:
                     retries -= 1
                     last_error = e
@@ -277,9 +464,12 @@ class WolfEngine:
                     max_loops = 10
                     loop_count = 0
                     tool_history = []  # Track (tool_name, args) to detect loops
+                    spent = usage_report(response)  # summed over every completion of the loop
                     
                     while getattr(response.choices[0].message, "tool_calls", None) and loop_count < max_loops:
                         loop_count += 1
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise ChatCancelled("Chat cancelled.")
                         
                         assist_msg = response.choices[0].message
                         # Detect stagnation (Self-Correction Nerve)
@@ -309,7 +499,7 @@ class WolfEngine:
                             
                             tool_history.append((function_name, str(function_args)))
                             
-                            print(f"INFO: AI called tool: {function_name} ({function_args})")
+                            logger.debug("AI called tool: %s (%s)", function_name, function_args, extra={"rate_key": "llm.tool_call"})
                             if bot_id:
                                 log_event(bot_id, "tool_call", status="success", details={"tool_name": function_name})
                                 log_mutation(bot_id, "tool_execution", {"tool_name": function_name, "args": function_args})
@@ -318,7 +508,8 @@ class WolfEngine:
                                 logger.warning("Agent execution suspended: User activity detected (Heartbeat).")
                                 raise PermissionError("Execution blocked by Heartbeat: Machine is currently in use by user.")
                             
-                            tool_result = execute_tool(function_name, function_args)
+                            with span(f"tool.{function_name}", tool=function_name), owned_by(self.user_id):
+                                tool_result = execute_tool(function_name, function_args)
                             
                             tool_msg = {
                                 "role": "tool",
@@ -338,9 +529,14 @@ class WolfEngine:
                                            "ask the user for clarification if you are stuck."
                             })
 
-                        kwargs["messages"] = full_messages
-                        response = completion(**kwargs)
+                        kwargs["messages"] = self._cacheable_messages(model, full_messages, prefix_len)
+                        response = self._complete(kwargs, on_token=on_token, cancel_event=cancel_event)
+                        spent = {k: spent[k] + v for k, v in usage_report(response).items()}
                     # --- END TOOL LOOP ---
+                    if loop_count:
+                        # The returned response reports what the whole chat cost, so
+                        # budgets and usage logs charge the tool-loop completions too.
+                        _set_usage(response, spent)
                     
                     if not heartbeat.is_safe_to_execute():
                         logger.warning("Agent execution suspended: User activity detected (Heartbeat).")
@@ -365,21 +561,7 @@ class WolfEngine:
                         completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
                         total_tokens = getattr(usage, 'total_tokens', 0) or (prompt_tokens + completion_tokens)
 
-                        # Rough cost estimation (per 1M tokens)
-                        COST_MAP = {
-                            'gpt-4o': {'input': 2.50, 'output': 10.00},
-                            'gpt-4o-mini': {'input': 0.15, 'output': 0.60},
-                            'claude-3-5-sonnet': {'input': 3.00, 'output': 15.00},
-                            'llama': {'input': 0.50, 'output': 0.50},
-                        }
-                        cost_rate = {'input': 0.50, 'output': 0.50}  # default
-                        for key, rate in COST_MAP.items():
-                            if key in model.lower():
-                                cost_rate = rate
-                                break
-                        
-                        estimated_cost = (prompt_tokens * cost_rate['input'] / 1_000_000) + \
-                                         (completion_tokens * cost_rate['output'] / 1_000_000)
+                        estimated_cost = estimate_cost(model, prompt_tokens, completion_tokens)
 
                         _usage_db.log_usage(
                             ws_id=ws_id,
@@ -401,6 +583,8 @@ class WolfEngine:
                         logger.warning(f"Usage logging failed (non-critical): {usage_err}")
                     
                     return response
+                except ChatCancelled:
+                    raise
                 except Exception as e:
                     last_error = e
                     import traceback
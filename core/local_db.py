@@ -2,8 +2,19 @@ import sqlite3
 import os
 import json
 import uuid
-from typing import Dict, List, Optional
-from datetime import datetime
+import zlib
+import logging
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from core.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+
+def _invalidate_registry(reason: str, bots_only: bool = False):
+    """Drop cached workspace/bot lookups after a write (see core.registry)."""
+    from core.registry import registry
+    registry.invalidate(reason, bots_only=bots_only)
 
 DB_PATH = os.path.join(os.path.expanduser("~"), ".wolfclaw", "wolfclaw_local.db")
 
@@ -146,7 +157,7 @@ def init_db():
     # --- Chat history table migration ---
     c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chat_histories'")
     if c.fetchone():
-        print("[DB] Migrating 'chat_histories' to 'chat_history'...")
+        logger.info("Migrating 'chat_histories' to 'chat_history'...")
         c.execute("ALTER TABLE chat_histories RENAME TO chat_history")
     
     c.execute("PRAGMA table_info(chat_history)")
@@ -240,24 +251,63 @@ def init_db():
             cron_expr TEXT NOT NULL DEFAULT '0 * * * *',
             action_type TEXT NOT NULL DEFAULT 'flow',
             action_id TEXT NOT NULL,
+            prompt TEXT,
+            timezone TEXT,
+            misfire_policy TEXT DEFAULT 'skip',
+            max_instances INTEGER DEFAULT 1,
+            coalesce INTEGER DEFAULT 1,
+            keep_results INTEGER,
+            keep_days INTEGER,
+            next_run REAL,
             last_run TEXT,
             enabled INTEGER DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
-
-    # Task results table (Phase 14)
+    else:
+        for col, decl in (("prompt", "TEXT"), ("timezone", "TEXT"),
+                          ("misfire_policy", "TEXT DEFAULT 'skip'"), ("next_run", "REAL"),
+                          ("max_instances", "INTEGER DEFAULT 1"), ("coalesce", "INTEGER DEFAULT 1"),
+                          ("keep_results", "INTEGER"), ("keep_days", "INTEGER")):
+            if col not in col_names:
+                c.execute(f"ALTER TABLE scheduled_tasks ADD COLUMN {col} {decl}")
+
+    # Task results table (Phase 14). `result` holds zlib bytes when encoding = 'zlib'.
     c.execute("PRAGMA table_info(task_results)")
-    if not c.fetchall():
+    result_cols = [col['name'] for col in c.fetchall()]
+    if not result_cols:
         c.execute('''
         CREATE TABLE task_results (
             id TEXT PRIMARY KEY,
             task_id TEXT NOT NULL,
             result TEXT NOT NULL,
+            status TEXT DEFAULT 'ok',
+            encoding TEXT,
+            size INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(task_id) REFERENCES scheduled_tasks(id) ON DELETE CASCADE
         )
         ''')
+    elif 'status' not in result_cols:
+        c.execute("ALTER TABLE task_results ADD COLUMN status TEXT DEFAULT 'ok'")
+        c.execute("ALTER TABLE task_results ADD COLUMN encoding TEXT")
+        c.execute("ALTER TABLE task_results ADD COLUMN size INTEGER")
+        c.execute("UPDATE task_results SET status = 'error' WHERE result LIKE '❌%'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_results_task ON task_results(task_id)")
+
+    # Per-day rollups of task results removed by compaction
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS task_result_summaries (
+            task_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            runs INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            first_at TEXT,
+            last_at TEXT,
+            PRIMARY KEY (task_id, day)
+        )
+    ''')
 
     # Flows table (Phase 27 — Visual Workflow Builder)
     c.execute("PRAGMA table_info(flows)")
@@ -276,6 +326,87 @@ def init_db():
         )
         ''')
 
+    # Flow runs: one row per run plus a checkpoint row per executed step
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS flow_runs (
+        id TEXT PRIMARY KEY,
+        flow_id TEXT NOT NULL,
+        workspace_id TEXT DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'running',
+        flow_data TEXT NOT NULL DEFAULT '{}',
+        attempt INTEGER DEFAULT 1,
+        error TEXT DEFAULT '',
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        elapsed_seconds REAL,
+        resume_at REAL
+    )
+    ''')
+    c.execute("PRAGMA table_info(flow_runs)")
+    if 'resume_at' not in [col[1] for col in c.fetchall()]:
+        c.execute("ALTER TABLE flow_runs ADD COLUMN resume_at REAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_flow_runs_flow ON flow_runs(flow_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_flow_runs_status ON flow_runs(status)")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS flow_steps (
+        run_id TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        type TEXT DEFAULT '',
+        status TEXT NOT NULL,
+        result TEXT,
+        error TEXT DEFAULT '',
+        attempt INTEGER DEFAULT 1,
+        duration_ms REAL,
+        finished_at TEXT NOT NULL,
+        PRIMARY KEY (run_id, node_id),
+        FOREIGN KEY(run_id) REFERENCES flow_runs(id) ON DELETE CASCADE
+    )
+    ''')
+
+    # Memoized results of deterministic flow blocks, shared across runs
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS flow_step_cache (
+        cache_key TEXT PRIMARY KEY,
+        block_type TEXT NOT NULL,
+        result TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        hits INTEGER DEFAULT 0
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_flow_step_cache_expires ON flow_step_cache(expires_at)")
+
+    # Notifications (persistent Notification Center)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL DEFAULT '',
+        title TEXT NOT NULL,
+        body TEXT DEFAULT '',
+        category TEXT DEFAULT 'info',
+        source TEXT DEFAULT 'system',
+        ts TEXT NOT NULL,
+        read INTEGER DEFAULT 0
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_read_ts ON notifications(user_id, read, ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS notification_counters (
+        user_id TEXT PRIMARY KEY,
+        unread INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS notification_reads (
+        user_id TEXT NOT NULL,
+        notification_id INTEGER NOT NULL,
+        cleared INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, notification_id)
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notification_reads_notif ON notification_reads(notification_id)")
+
     conn.commit()
     conn.close()
 
@@ -328,8 +459,14 @@ def delete_user(user_id: str):
     c = conn.cursor()
     c.execute("PRAGMA foreign_keys = ON")
     c.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    c.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+    c.execute("DELETE FROM notification_reads WHERE user_id = ?", (user_id,))
     conn.commit()
     conn.close()
+    _invalidate_registry("delete_user")
+    # Cached tokens would otherwise keep authenticating the deleted user until their TTL.
+    from core.session_cache import session_cache
+    session_cache.invalidate_user(user_id)
 
 # Workspaces
 def create_workspace(user_id: str, name: str) -> str:
@@ -339,6 +476,7 @@ def create_workspace(user_id: str, name: str) -> str:
     c.execute("INSERT INTO workspaces (id, user_id, name) VALUES (?, ?, ?)", (ws_id, user_id, name))
     conn.commit()
     conn.close()
+    _invalidate_registry("create_workspace")
     return ws_id
 
 def get_or_create_workspace(user_id: str) -> str:
@@ -355,6 +493,7 @@ def get_or_create_workspace(user_id: str) -> str:
         # Create a default workspace for this user
         return create_workspace(user_id, "Default Workspace")
 
+@traced("db.get_workspaces_for_user")
 def get_workspaces_for_user(user_id: str) -> List[Dict]:
     conn = _get_connection()
     c = conn.cursor()
@@ -375,6 +514,7 @@ def update_workspace_ssh(ws_id: str, ssh_data_list: list):
     c.execute("UPDATE workspaces SET ssh_config = ? WHERE id = ?", (json.dumps(ssh_data_list), ws_id))
     conn.commit()
     conn.close()
+    _invalidate_registry("update_workspace_ssh")
     
 def get_workspace_ssh(ws_id: str) -> list:
     conn = _get_connection()
@@ -407,8 +547,10 @@ def create_bot(ws_id: str, name: str, model: str, prompt: str, fallback_models:
     )
     conn.commit()
     conn.close()
+    _invalidate_registry("create_bot", bots_only=True)
     return bot_id
 
+@traced("db.get_bots_for_workspace")
 def get_bots_for_workspace(ws_id: str) -> Dict[str, Dict]:
     conn = _get_connection()
     c = conn.cursor()
@@ -437,6 +579,7 @@ def update_bot_prompt(bot_id: str, new_prompt: str):
     c.execute("UPDATE bots SET prompt = ? WHERE id = ?", (new_prompt, bot_id))
     conn.commit()
     conn.close()
+    _invalidate_registry("update_bot_prompt", bots_only=True)
 
 def update_bot_user_context(bot_id: str, new_context: str):
     conn = _get_connection()
@@ -444,6 +587,7 @@ def update_bot_user_context(bot_id: str, new_context: str):
     c.execute("UPDATE bots SET user_context = ? WHERE id = ?", (new_context, bot_id))
     conn.commit()
     conn.close()
+    _invalidate_registry("update_bot_user_context", bots_only=True)
 
 def update_bot_memory(bot_id: str, new_memory: str):
     conn = _get_connection()
@@ -451,6 +595,7 @@ def update_bot_memory(bot_id: str, new_memory: str):
     c.execute("UPDATE bots SET memory = ? WHERE id = ?", (new_memory, bot_id))
     conn.commit()
     conn.close()
+    _invalidate_registry("update_bot_memory", bots_only=True)
     
 def update_bot_telegram(bot_id: str, token: str):
     conn = _get_connection()
@@ -458,6 +603,7 @@ def update_bot_telegram(bot_id: str, token: str):
     c.execute("UPDATE bots SET telegram_token = ? WHERE id = ?", (token, bot_id))
     conn.commit()
     conn.close()
+    _invalidate_registry("update_bot_telegram", bots_only=True)
     
 def delete_bot(bot_id: str):
     conn = _get_connection()
@@ -470,9 +616,13 @@ def delete_bot(bot_id: str):
     except Exception:
         pass
     
+    task_ids = []
     try:
-        c.execute("DELETE FROM task_results WHERE task_id IN (SELECT id FROM scheduled_tasks WHERE action_id = ?)", (bot_id,))
-        c.execute("DELETE FROM scheduled_tasks WHERE action_id = ?", (bot_id,))
+        c.execute("SELECT id FROM scheduled_tasks WHERE action_type = 'bot' AND action_id = ?", (bot_id,))
+        task_ids = [row[0] for row in c.fetchall()]
+        c.execute("DELETE FROM task_results WHERE task_id IN (SELECT id FROM scheduled_tasks WHERE action_type = 'bot' AND action_id = ?)", (bot_id,))
+        c.execute("DELETE FROM task_result_summaries WHERE task_id IN (SELECT id FROM scheduled_tasks WHERE action_type = 'bot' AND action_id = ?)", (bot_id,))
+        c.execute("DELETE FROM scheduled_tasks WHERE action_type = 'bot' AND action_id = ?", (bot_id,))
     except Exception:
         pass
     
@@ -492,6 +642,9 @@ def delete_bot(bot_id: str):
     
     conn.commit()
     conn.close()
+    _invalidate_registry("delete_bot", bots_only=True)
+    for task_id in task_ids:
+        _reschedule_task(task_id)
 
 # Vault
 def set_key_local(user_id: str, col_name: str, key: str):
@@ -632,6 +785,7 @@ def delete_document(doc_id: str):
 # Chat History (Persistent Conversations)
 # -------------------------------------------------------------------------------------
 
+@traced("db.save_chat_history")
 def save_chat_history(ws_id: str, bot_id: str, title: str, messages: str, chat_id: Optional[str] = None) -> str:
     """Create or update a chat history thread."""
     conn = _get_connection()
@@ -723,6 +877,7 @@ def get_knowledge_docs(bot_id: str) -> List[Dict]:
     conn.close()
     return [dict(row) for row in rows]
 
+@traced("db.get_knowledge_chunks_for_bot")
 def get_knowledge_chunks_for_bot(bot_id: str) -> List[Dict]:
     """Get ALL chunks for a bot (used for search)."""
     conn = _get_connection()
@@ -743,6 +898,7 @@ def delete_knowledge_doc(doc_id: str):
 
 # ─────────── Usage Analytics (Phase 17) ───────────
 
+@traced("db.log_usage")
 def log_usage(ws_id: str, bot_id: str, model: str, prompt_tokens: int, completion_tokens: int, total_tokens: int, estimated_cost: float, response_time_ms: int):
     """Log a single LLM API call."""
     conn = _get_connection()
@@ -813,24 +969,46 @@ def get_usage_daily(ws_id: str, days: int = 30) -> List[Dict]:
 
 # ─────────── Scheduled Tasks (Phase 14) ───────────
 
-def create_scheduled_task(ws_id: str, bot_id: str, name: str, prompt: str, schedule_type: str, schedule_value: str) -> str:
-    """Create a new scheduled task."""
+SCHEDULED_TASK_FIELDS = ("ws_id", "name", "cron_expr", "action_type", "action_id", "prompt",
+                         "timezone", "misfire_policy", "max_instances", "coalesce", "keep_results",
+                         "keep_days", "enabled")
+
+def _reschedule_task(task_id: str):
+    """Tell the running scheduler a task changed so it re-arms (see core.task_scheduler)."""
+    from core.task_scheduler import task_scheduler
+    task_scheduler.refresh(task_id)
+
+def create_scheduled_task(ws_id: str, name: str, cron_expr: str, action_type: str, action_id: str,
+                          prompt: str = None, timezone: str = None, misfire_policy: str = "skip",
+                          max_instances: int = 1, coalesce: bool = True, keep_results: int = None,
+                          keep_days: int = None) -> str:
+    """Create a new scheduled task. `action_type` is 'bot' (send `prompt` to bot `action_id`) or 'flow'."""
     conn = _get_connection()
     c = conn.cursor()
     task_id = str(uuid.uuid4())
     c.execute('''
-        INSERT INTO scheduled_tasks (id, workspace_id, bot_id, name, prompt, schedule_type, schedule_value)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (task_id, ws_id, bot_id, name, prompt, schedule_type, schedule_value))
+        INSERT INTO scheduled_tasks (id, ws_id, name, cron_expr, action_type, action_id, prompt, timezone,
+                                     misfire_policy, max_instances, coalesce, keep_results, keep_days)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (task_id, ws_id, name, cron_expr, action_type, action_id, prompt, timezone, misfire_policy,
+          max_instances, 1 if coalesce else 0, keep_results, keep_days))
     conn.commit()
     conn.close()
+    _reschedule_task(task_id)
     return task_id
 
-def get_scheduled_tasks(ws_id: str) -> List[Dict]:
-    """Get all scheduled tasks for a workspace."""
+def get_scheduled_tasks(ws_id: str = None, enabled_only: bool = False) -> List[Dict]:
+    """Scheduled tasks for a workspace (all workspaces when ws_id is None)."""
     conn = _get_connection()
     c = conn.cursor()
-    c.execute('SELECT * FROM scheduled_tasks WHERE workspace_id = ? ORDER BY created_at DESC', (ws_id,))
+    query = 'SELECT * FROM scheduled_tasks WHERE 1 = 1'
+    params = []
+    if ws_id is not None:
+        query += ' AND ws_id = ?'
+        params.append(ws_id)
+    if enabled_only:
+        query += ' AND enabled = 1'
+    c.execute(query + ' ORDER BY created_at DESC', params)
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
@@ -845,11 +1023,25 @@ def get_scheduled_task(task_id: str) -> Optional[Dict]:
     return dict(row) if row else None
 
 def update_scheduled_task(task_id: str, **kwargs):
-    """Update a scheduled task's fields."""
+    """Update a scheduled task's fields (see SCHEDULED_TASK_FIELDS)."""
+    unknown = set(kwargs) - set(SCHEDULED_TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown scheduled task fields: {', '.join(sorted(unknown))}")
+    if not kwargs:
+        return
+    conn = _get_connection()
+    c = conn.cursor()
+    assignments = ", ".join(f"{key} = ?" for key in kwargs)
+    c.execute(f'UPDATE scheduled_tasks SET {assignments} WHERE id = ?', (*kwargs.values(), task_id))
+    conn.commit()
+    conn.close()
+    _reschedule_task(task_id)
+
+def set_task_next_run(task_id: str, next_run: Optional[float]):
+    """Persist the next fire time (epoch seconds) so missed runs can be detected after downtime."""
     conn = _get_connection()
     c = conn.cursor()
-    for key, val in kwargs.items():
-        c.execute(f'UPDATE scheduled_tasks SET {key} = ? WHERE id = ?', (val, task_id))
+    c.execute('UPDATE scheduled_tasks SET next_run = ? WHERE id = ?', (next_run, task_id))
     conn.commit()
     conn.close()
 
@@ -858,34 +1050,117 @@ def delete_scheduled_task(task_id: str):
     conn = _get_connection()
     c = conn.cursor()
     c.execute('DELETE FROM task_results WHERE task_id = ?', (task_id,))
+    c.execute('DELETE FROM task_result_summaries WHERE task_id = ?', (task_id,))
     c.execute('DELETE FROM scheduled_tasks WHERE id = ?', (task_id,))
     conn.commit()
     conn.close()
-
-def save_task_result(task_id: str, result: str) -> str:
-    """Save a task execution result."""
+    _reschedule_task(task_id)
+
+TASK_RESULT_COMPRESS_MIN = 4096  # bytes; smaller bodies are stored as plain text
+
+def _pack_task_result(result: str, compress: bool):
+    """(stored value, encoding, size) for a result body."""
+    raw = result.encode("utf-8")
+    if compress and len(raw) >= TASK_RESULT_COMPRESS_MIN:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed, "zlib", len(raw)
+    return result, None, len(raw)
+
+def _unpack_task_result(row: Dict) -> Dict:
+    if row.get("encoding") == "zlib":
+        row["result"] = zlib.decompress(row["result"]).decode("utf-8")
+    row.pop("encoding", None)
+    return row
+
+@traced("db.save_task_result")
+def save_task_result(task_id: str, result: str, status: str = "ok", compress: bool = True) -> str:
+    """Save a task execution result; large bodies are zlib-compressed."""
+    value, encoding, size = _pack_task_result(result, compress)
     conn = _get_connection()
     c = conn.cursor()
     result_id = str(uuid.uuid4())
-    c.execute('INSERT INTO task_results (id, task_id, result) VALUES (?, ?, ?)', (result_id, task_id, result))
+    c.execute('INSERT INTO task_results (id, task_id, result, status, encoding, size) VALUES (?, ?, ?, ?, ?, ?)',
+              (result_id, task_id, value, status, encoding, size))
     c.execute('UPDATE scheduled_tasks SET last_run = CURRENT_TIMESTAMP WHERE id = ?', (task_id,))
     conn.commit()
     conn.close()
     return result_id
 
-def get_task_results(task_id: str, limit: int = 20) -> List[Dict]:
-    """Get execution results for a task."""
+def get_task_results(task_id: str, limit: int = 20, before: int = None) -> List[Dict]:
+    """Execution results of a task, newest first. `before` is the `cursor` of the last row of the previous page."""
     conn = _get_connection()
     c = conn.cursor()
-    c.execute('SELECT * FROM task_results WHERE task_id = ? ORDER BY created_at DESC LIMIT ?', (task_id, limit))
+    query = "SELECT rowid AS cursor, * FROM task_results WHERE task_id = ?"
+    params: list = [task_id]
+    if before is not None:
+        query += " AND rowid < ?"
+        params.append(before)
+    query += " ORDER BY rowid DESC LIMIT ?"
+    params.append(limit)
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+    return [_unpack_task_result(dict(row)) for row in rows]
+
+def compact_task_results(task_id: str, keep: int, max_age_days: int) -> int:
+    """
+    Remove results of a task beyond the newest `keep` or older than
+    `max_age_days`, folding them into per-day task_result_summaries first.
+    Returns the number of rows removed.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+    condition = ("task_id = ? AND (created_at < ? OR rowid <= COALESCE("
+                 "(SELECT rowid FROM task_results WHERE task_id = ? ORDER BY rowid DESC LIMIT 1 OFFSET ?), -1))")
+    params = (task_id, cutoff, task_id, keep)
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        INSERT INTO task_result_summaries (task_id, day, runs, errors, bytes, first_at, last_at)
+        SELECT task_id, DATE(created_at), COUNT(*), SUM(status = 'error'), SUM(COALESCE(size, LENGTH(result))),
+               MIN(created_at), MAX(created_at)
+        FROM task_results WHERE {condition} GROUP BY DATE(created_at)
+        ON CONFLICT(task_id, day) DO UPDATE SET
+            runs = runs + excluded.runs,
+            errors = errors + excluded.errors,
+            bytes = bytes + excluded.bytes,
+            first_at = MIN(first_at, excluded.first_at),
+            last_at = MAX(last_at, excluded.last_at)
+    ''', params)
+    c.execute(f'DELETE FROM task_results WHERE {condition}', params)
+    removed = c.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+def get_task_result_summaries(task_id: str, limit: int = 90) -> List[Dict]:
+    """Per-day run/error counts of compacted results, newest day first."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('SELECT day, runs, errors, bytes, first_at, last_at FROM task_result_summaries '
+              'WHERE task_id = ? ORDER BY day DESC LIMIT ?', (task_id, limit))
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
+def get_task_result_stats(task_id: str) -> Dict:
+    """Row count and stored vs. original bytes of a task's retained results."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT COUNT(*) AS results, SUM(status = 'error') AS errors,
+               COALESCE(SUM(LENGTH(result)), 0) AS stored_bytes, COALESCE(SUM(size), 0) AS original_bytes
+        FROM task_results WHERE task_id = ?
+    ''', (task_id,))
+    row = c.fetchone()
+    conn.close()
+    return {k: (row[k] or 0) for k in row.keys()}
+
 # -------------------------------------------------------------------------------------
 # Flows (Phase 27 — Visual Workflow Builder)
 # -------------------------------------------------------------------------------------
 
+@traced("db.save_flow")
 def save_flow(ws_id: str, name: str, description: str, flow_data: str, flow_id: Optional[str] = None) -> str:
     """Create or update a flow."""
     conn = _get_connection()
@@ -932,9 +1207,339 @@ def delete_flow(flow_id: str):
     conn = _get_connection()
     c = conn.cursor()
     c.execute('DELETE FROM flows WHERE id = ?', (flow_id,))
+    c.execute('DELETE FROM flow_steps WHERE run_id IN (SELECT id FROM flow_runs WHERE flow_id = ?)', (flow_id,))
+    c.execute('DELETE FROM flow_runs WHERE flow_id = ?', (flow_id,))
+    conn.commit()
+    conn.close()
+
+# -------------------------------------------------------------------------------------
+# Flow runs (step checkpoints for history and resume)
+# Pagination uses SQLite rowids as opaque cursors: runs newest first, steps in
+# the order they were first recorded.
+# -------------------------------------------------------------------------------------
+
+def create_flow_run(flow_id: str, ws_id: str, flow_data: str, status: str = 'running') -> str:
+    conn = _get_connection()
+    c = conn.cursor()
+    run_id = str(uuid.uuid4())
+    c.execute("INSERT INTO flow_runs (id, flow_id, workspace_id, status, flow_data, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+              (run_id, flow_id, ws_id or '', status, flow_data, datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+    return run_id
+
+def set_flow_run_status(run_id: str, status: str):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE flow_runs SET status = ?, resume_at = NULL WHERE id = ?", (status, run_id))
+    conn.commit()
+    conn.close()
+
+def park_flow_run(run_id: str, resume_at: float, elapsed_seconds: float = 0.0):
+    """
+    Mark a run as waiting on a delay block until `resume_at` (epoch seconds).
+    The segment's active time is added to the run's elapsed_seconds.
+    """
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE flow_runs SET status = 'parked', resume_at = ?, elapsed_seconds = COALESCE(elapsed_seconds, 0) + ? "
+              "WHERE id = ?", (resume_at, elapsed_seconds, run_id))
+    conn.commit()
+    conn.close()
+
+def get_parked_flow_runs() -> List[Dict]:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, flow_id, workspace_id, resume_at FROM flow_runs WHERE status = 'parked'")
+    rows = c.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def restart_flow_run(run_id: str) -> int:
+    """Mark a run as running again for a resume attempt. Returns the new attempt number."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE flow_runs SET status = 'running', attempt = attempt + 1, error = '', finished_at = NULL WHERE id = ?",
+              (run_id,))
+    c.execute("SELECT attempt FROM flow_runs WHERE id = ?", (run_id,))
+    row = c.fetchone()
+    conn.commit()
+    conn.close()
+    return row['attempt'] if row else 0
+
+def finish_flow_run(run_id: str, status: str, elapsed_seconds: float, error: str = '') -> float:
+    """
+    Record a run's outcome. `elapsed_seconds` is the last segment's active time; it is
+    added to the segments already recorded (parked continuations, earlier attempts).
+    Returns the run's total active time.
+    """
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE flow_runs SET status = ?, error = ?, finished_at = ?, "
+              "elapsed_seconds = ROUND(COALESCE(elapsed_seconds, 0) + ?, 2), resume_at = NULL WHERE id = ?",
+              (status, error, datetime.now().isoformat(), elapsed_seconds, run_id))
+    c.execute("SELECT elapsed_seconds FROM flow_runs WHERE id = ?", (run_id,))
+    row = c.fetchone()
+    conn.commit()
+    conn.close()
+    return row['elapsed_seconds'] if row else elapsed_seconds
+
+@traced("db.save_flow_step")
+def save_flow_step(run_id: str, node_id: str, block_type: str, status: str, result=None,
+                   error: str = '', attempt: int = 1, duration_ms: float = None):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO flow_steps (run_id, node_id, type, status, result, error, attempt, duration_ms, finished_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(run_id, node_id) DO UPDATE SET
+            status = excluded.status, result = excluded.result, error = excluded.error,
+            attempt = excluded.attempt, duration_ms = excluded.duration_ms, finished_at = excluded.finished_at
+    ''', (run_id, node_id, block_type, status, json.dumps(result, default=str) if result is not None else None,
+          error, attempt, duration_ms, datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
+def get_flow_run(run_id: str) -> Optional[Dict]:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT rowid AS cursor, * FROM flow_runs WHERE id = ?", (run_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_flow_runs(flow_id: str, limit: int = 20, before: int = None) -> List[Dict]:
+    """Runs of a flow, newest first, without the flow_data snapshot."""
+    conn = _get_connection()
+    c = conn.cursor()
+    query = ("SELECT rowid AS cursor, id, flow_id, workspace_id, status, attempt, error, started_at, finished_at, elapsed_seconds "
+             "FROM flow_runs WHERE flow_id = ?")
+    params: list = [flow_id]
+    if before is not None:
+        query += " AND rowid < ?"
+        params.append(before)
+    query += " ORDER BY rowid DESC LIMIT ?"
+    params.append(limit)
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_flow_steps(run_id: str, limit: int = 100, after: int = None, status: str = None) -> List[Dict]:
+    conn = _get_connection()
+    c = conn.cursor()
+    query = "SELECT rowid AS cursor, * FROM flow_steps WHERE run_id = ?"
+    params: list = [run_id]
+    if after is not None:
+        query += " AND rowid > ?"
+        params.append(after)
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    query += " ORDER BY rowid ASC LIMIT ?"
+    params.append(limit)
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+    steps = []
+    for r in rows:
+        d = dict(r)
+        d['result'] = json.loads(d['result']) if d['result'] else None
+        steps.append(d)
+    return steps
+
+def get_waiting_flow_steps(run_id: str) -> Dict[str, float]:
+    """node_id -> resume_at for delay steps a parked run is waiting on."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT node_id, result FROM flow_steps WHERE run_id = ? AND status = 'waiting'", (run_id,))
+    rows = c.fetchall()
+    conn.close()
+    return {r['node_id']: json.loads(r['result'])['resume_at'] for r in rows if r['result']}
+
+def get_successful_flow_steps(run_id: str) -> Dict[str, Any]:
+    """node_id -> result for every step of a run that completed successfully."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT node_id, result FROM flow_steps WHERE run_id = ? AND status = 'success'", (run_id,))
+    rows = c.fetchall()
+    conn.close()
+    return {r['node_id']: json.loads(r['result']) if r['result'] else None for r in rows}
+
+def get_cached_flow_step(cache_key: str, now: float) -> Optional[Any]:
+    """Return a cached step result if present and not expired, counting the hit."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT result FROM flow_step_cache WHERE cache_key = ? AND expires_at > ?", (cache_key, now))
+    row = c.fetchone()
+    if row:
+        c.execute("UPDATE flow_step_cache SET hits = hits + 1 WHERE cache_key = ?", (cache_key,))
+        conn.commit()
+    conn.close()
+    return json.loads(row['result']) if row else None
+
+def put_cached_flow_step(cache_key: str, block_type: str, result: Any, now: float, ttl: float):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO flow_step_cache (cache_key, block_type, result, created_at, expires_at, hits)
+        VALUES (?, ?, ?, ?, ?, 0)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            result = excluded.result, created_at = excluded.created_at, expires_at = excluded.expires_at
+    ''', (cache_key, block_type, json.dumps(result, default=str), now, now + ttl))
+    conn.commit()
+    conn.close()
+
+def prune_flow_step_cache(now: float) -> int:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM flow_step_cache WHERE expires_at <= ?", (now,))
+    removed = c.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+def get_flow_step_cache_stats() -> List[Dict]:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("SELECT block_type, COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits FROM flow_step_cache GROUP BY block_type")
+    rows = c.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+# -------------------------------------------------------------------------------------
+# Notifications (Notification Center)
+# user_id '' marks a broadcast notification (background agents, scheduler, ...).
+# notification_counters keeps the unread count per user_id so reading it is O(1).
+# Broadcast rows are shared and never modified per user: each user's read/cleared
+# state for them lives in notification_reads, and their unread count is the
+# broadcast counter minus that user's reads.
+# -------------------------------------------------------------------------------------
+
+def get_max_notification_id() -> int:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('SELECT COALESCE(MAX(id), 0) AS max_id FROM notifications')
+    row = c.fetchone()
+    conn.close()
+    return row['max_id'] if row else 0
+
+@traced("db.insert_notifications")
+def insert_notifications(rows: List[Dict]):
+    """Bulk insert notifications (dicts with id, user_id, title, body, category, source, ts)."""
+    if not rows:
+        return
+    unread_by_user: Dict[str, int] = {}
+    for r in rows:
+        unread_by_user[r['user_id']] = unread_by_user.get(r['user_id'], 0) + 1
+    conn = _get_connection()
+    c = conn.cursor()
+    c.executemany('''
+        INSERT INTO notifications (id, user_id, title, body, category, source, ts, read)
+        VALUES (:id, :user_id, :title, :body, :category, :source, :ts, 0)
+    ''', rows)
+    c.executemany('''
+        INSERT INTO notification_counters (user_id, unread) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET unread = unread + excluded.unread
+    ''', list(unread_by_user.items()))
+    conn.commit()
+    conn.close()
+
+def get_notifications(user_id: str, limit: int = 50, unread_only: bool = False) -> List[Dict]:
+    """Newest-first notifications addressed to a user or broadcast to everyone (minus ones they cleared)."""
+    conn = _get_connection()
+    c = conn.cursor()
+    query = '''
+        SELECT n.id, n.user_id, n.title, n.body, n.category, n.source, n.ts,
+               CASE WHEN n.user_id = '' THEN (n.read = 1 OR r.notification_id IS NOT NULL) ELSE n.read END AS read
+        FROM notifications n
+        LEFT JOIN notification_reads r ON r.notification_id = n.id AND r.user_id = ?
+        WHERE (n.user_id = ? OR (n.user_id = '' AND COALESCE(r.cleared, 0) = 0))
+    '''
+    if unread_only:
+        query += ' AND n.read = 0 AND r.notification_id IS NULL'
+    c.execute(query + ' ORDER BY n.id DESC LIMIT ?', (user_id, user_id, limit))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row, read=bool(row['read'])) for row in rows]
+
+def get_unread_notification_count(user_id: str) -> int:
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT
+            (SELECT COALESCE(SUM(unread), 0) FROM notification_counters WHERE user_id IN (?, \'\'))
+          - (SELECT COUNT(*) FROM notification_reads r JOIN notifications n ON n.id = r.notification_id
+             WHERE r.user_id = ? AND n.user_id = \'\' AND n.read = 0) AS unread
+    ''', (user_id, user_id))
+    row = c.fetchone()
+    conn.close()
+    return max(0, row['unread']) if row else 0
+
+def mark_notification_read(user_id: str, notif_id: int):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('SELECT user_id FROM notifications WHERE id = ? AND user_id IN (?, \'\') AND read = 0', (notif_id, user_id))
+    row = c.fetchone()
+    if row and row['user_id'] == '':
+        c.execute('INSERT OR IGNORE INTO notification_reads (user_id, notification_id) VALUES (?, ?)', (user_id, notif_id))
+        conn.commit()
+    elif row:
+        c.execute('UPDATE notifications SET read = 1 WHERE id = ?', (notif_id,))
+        c.execute('UPDATE notification_counters SET unread = MAX(0, unread - 1) WHERE user_id = ?', (user_id,))
+        conn.commit()
+    conn.close()
+
+def mark_all_notifications_read(user_id: str):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('UPDATE notifications SET read = 1 WHERE user_id = ? AND read = 0', (user_id,))
+    c.execute('UPDATE notification_counters SET unread = 0 WHERE user_id = ?', (user_id,))
+    c.execute('''
+        INSERT OR IGNORE INTO notification_reads (user_id, notification_id)
+        SELECT ?, id FROM notifications WHERE user_id = \'\' AND read = 0
+    ''', (user_id,))
     conn.commit()
     conn.close()
 
+def clear_notifications(user_id: str):
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM notifications WHERE user_id = ?', (user_id,))
+    c.execute('UPDATE notification_counters SET unread = 0 WHERE user_id = ?', (user_id,))
+    c.execute('''
+        INSERT INTO notification_reads (user_id, notification_id, cleared)
+        SELECT ?, id, 1 FROM notifications WHERE user_id = \'\'
+        ON CONFLICT(user_id, notification_id) DO UPDATE SET cleared = 1
+    ''', (user_id,))
+    conn.commit()
+    conn.close()
+
+def prune_notifications(max_age_days: int, max_rows: int) -> int:
+    """Drop notifications older than max_age_days or beyond the newest max_rows, then resync counters."""
+    conn = _get_connection()
+    c = conn.cursor()
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    c.execute('DELETE FROM notifications WHERE ts < ?', (cutoff,))
+    removed = c.rowcount
+    c.execute('''
+        DELETE FROM notifications WHERE id <= (
+            SELECT id FROM notifications ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+    ''', (max_rows,))
+    removed += c.rowcount
+    if removed:
+        c.execute('DELETE FROM notification_reads WHERE notification_id NOT IN (SELECT id FROM notifications)')
+        c.execute('''
+            UPDATE notification_counters SET unread = (
+                SELECT COUNT(*) FROM notifications n
+                WHERE n.user_id = notification_counters.user_id AND n.read = 0
+            )
+        ''')
+    conn.commit()
+    conn.close()
+    return removed
+
 init_db()
 def create_session(user_id: str, days: int = 7) -> str:
     conn = _get_connection()
@@ -948,6 +1553,7 @@ def create_session(user_id: str, days: int = 7) -> str:
     conn.close()
     return session_id
 
+@traced("db.get_session")
 def get_session(session_id: str) -> Optional[Dict]:
     conn = _get_connection()
     c = conn.cursor()
@@ -959,9 +1565,8 @@ def get_session(session_id: str) -> Optional[Dict]:
         now = int(datetime.now().timestamp())
         if sess["expires_at"] > now:
             return sess
-        else:
-            print(f"[DB] Session {session_id[:8]} expired at {sess['expires_at']} (Current: {now})")
-            delete_session(session_id)
+        # Expired rows are removed by delete_expired_sessions (background sweeper).
+        logger.debug("Session %s expired at %s (current: %s)", session_id[:8], sess["expires_at"], now)
     return None
 
 def delete_session(session_id: str):
@@ -970,6 +1575,28 @@ def delete_session(session_id: str):
     c.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
     conn.commit()
     conn.close()
+    from core.session_cache import session_cache
+    session_cache.invalidate(session_id)
+
+def delete_all_sessions():
+    """Log every local session out."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM sessions")
+    conn.commit()
+    conn.close()
+    from core.session_cache import session_cache
+    session_cache.clear()
+
+def delete_expired_sessions() -> int:
+    """Remove every session past its expiry. Returns the number of rows deleted."""
+    conn = _get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM sessions WHERE expires_at <= ?", (int(datetime.now().timestamp()),))
+    removed = c.rowcount
+    conn.commit()
+    conn.close()
+    return removed
 
 def verify_workspace_access(user_id: str, workspace_id: str) -> bool:
     """Check if a workspace belongs to a specific user (Isolation)."""
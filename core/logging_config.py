@@ -0,0 +1,140 @@
+"""
+Logging setup for Wolfclaw.
+
+Modules log through `logging.getLogger(__name__)`. `setup_logging()` routes
+every record through a QueueHandler, so the calling thread only enqueues;
+a QueueListener thread does the actual (file/console) I/O. A per-key rate
+limiter keeps chatty hot-path messages from flooding the log, and records
+can optionally be emitted as JSON lines.
+
+Environment:
+  WOLFCLAW_LOG_LEVEL   root level (default INFO; DEBUG enables hot-path detail)
+  WOLFCLAW_LOG_JSON    '1' to emit JSON lines instead of plain text
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields are included as-is."""
+
+    _STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._STANDARD and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Allow at most `burst` records per key every `interval` seconds.
+    The key is `extra={"rate_key": ...}` when given, otherwise the call
+    site (file and line), so f-string messages from one line share a
+    bucket. WARNING and above always pass. The first record after a
+    suppressed run reports how many were dropped. At most `max_keys` keys
+    are tracked; the least recently seen one is evicted first.
+    """
+
+    def __init__(self, interval: float = 10.0, burst: int = 5, max_keys: int = 2048):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._state: "OrderedDict[Tuple, List[float]]" = OrderedDict()  # key -> [window_start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, "rate_key", None) or (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None:
+                self._state.move_to_end(key)
+            if state is None or now - state[0] >= self.interval:
+                suppressed = int(state[2]) if state else 0
+                self._state[key] = [now, 1, 0]
+                while len(self._state) > self.max_keys:
+                    self._state.popitem(last=False)
+                if suppressed:
+                    record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+def setup_logging(log_file: str = None, level: str = None, json_format: bool = None,
+                  console: bool = True) -> logging.Logger:
+    """Configure the root logger once; later calls return it unchanged."""
+    global _listener
+    with _setup_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            return root
+
+        level = (level or os.environ.get("WOLFCLAW_LOG_LEVEL", "INFO")).upper()
+        if json_format is None:
+            json_format = os.environ.get("WOLFCLAW_LOG_JSON", "0") == "1"
+        formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+
+        handlers = []
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        if console:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        for h in handlers:
+            h.setFormatter(formatter)
+
+        log_queue: "queue.Queue" = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, level, logging.INFO))
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -1,24 +1,71 @@
 """
 Phase 14 — Notification Center
-Thread-safe in-memory notification store with read/unread tracking.
+Durable notification store backed by SQLite (see local_db), with batched
+inserts, per-user unread counters and retention pruning.
 """
+import logging
 import threading
+import time
 from datetime import datetime
-from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# user_id for notifications that are not addressed to a specific user
+BROADCAST = ""
+MAX_FLUSH_ATTEMPTS = 3  # a batch that fails this often is dropped instead of retried forever
 
 class NotificationCenter:
     """Central notification system for background agent events."""
 
-    def __init__(self, max_notifications=200):
+    def __init__(self, batch_size: int = 50, flush_interval: float = 1.0,
+                 retention_days: int = 30, max_rows: int = 100_000, prune_interval: float = 3600):
         self._lock = threading.Lock()
-        self._notifications = deque(maxlen=max_notifications)
-        self._unread_count = 0
+        self._pending = []
+        self._failures = 0  # consecutive failed flushes of the batch at the head of _pending
+        self._next_id = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.prune_interval = prune_interval
+        self._wake = threading.Event()
+        self._flusher = None
+        self._last_prune = 0.0
+
+    def _allocate_id(self) -> int:
+        # Called under self._lock. IDs are handed out in-process so a pushed
+        # notification has its final, monotonic ID before it is flushed.
+        if self._next_id is None:
+            from core import local_db
+            self._next_id = local_db.get_max_notification_id() + 1
+        notif_id = self._next_id
+        self._next_id += 1
+        return notif_id
 
-    def push(self, title: str, body: str, category: str = "info", source: str = "system"):
-        """Push a new notification."""
+    def _ensure_flusher(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="NotificationFlusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                logger.error(f"NotificationCenter flush failed: {e}")
+
+    def push(self, title: str, body: str, category: str = "info", source: str = "system", user_id: str = None):
+        """Queue a new notification; it is written to the DB in the next batch."""
         with self._lock:
             notif = {
-                "id": len(self._notifications),
+                "id": self._allocate_id(),
+                "user_id": user_id or BROADCAST,
                 "title": title,
                 "body": body,
                 "category": category,  # info, success, warning, error
@@ -26,36 +73,81 @@ class NotificationCenter:
                 "ts": datetime.utcnow().isoformat(),
                 "read": False
             }
-            self._notifications.appendleft(notif)
-            self._unread_count += 1
-            return notif
+            self._pending.append(notif)
+            full = len(self._pending) >= self.batch_size
+            self._ensure_flusher()
+        if full:
+            self._wake.set()
+        try:
+            from core.bus import bus
+            bus.publish("notification.created", notif)
+        except Exception:
+            pass
+        return notif
 
-    def get_all(self, limit: int = 50) -> list:
+    def flush(self):
+        """
+        Write all pending notifications in one transaction. A failed batch is
+        retried on later flushes and dropped after MAX_FLUSH_ATTEMPTS.
+        """
         with self._lock:
-            return list(self._notifications)[:limit]
+            batch, self._pending = self._pending, []
+        if batch:
+            from core import local_db
+            try:
+                local_db.insert_notifications(batch)
+            except Exception as e:
+                with self._lock:
+                    self._failures += 1
+                    if self._failures < MAX_FLUSH_ATTEMPTS:
+                        self._pending = batch + self._pending
+                        raise
+                    self._failures = 0
+                logger.error(f"Dropping {len(batch)} notifications after {MAX_FLUSH_ATTEMPTS} failed writes: {e}")
+                return
+            with self._lock:
+                self._failures = 0
 
-    def get_unread_count(self) -> int:
-        with self._lock:
-            return self._unread_count
+    def _flush_before_read(self):
+        # Reads show what is already stored rather than failing the request;
+        # the failed batch stays queued for the background flusher to retry.
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"NotificationCenter flush before read failed: {e}")
 
-    def mark_all_read(self):
-        with self._lock:
-            for n in self._notifications:
-                n["read"] = True
-            self._unread_count = 0
+    def prune(self) -> int:
+        from core import local_db
+        self.flush()
+        removed = local_db.prune_notifications(self.retention_days, self.max_rows)
+        if removed:
+            logger.info(f"Pruned {removed} notifications.")
+        return removed
 
-    def mark_read(self, notif_id: int):
-        with self._lock:
-            for n in self._notifications:
-                if n["id"] == notif_id and not n["read"]:
-                    n["read"] = True
-                    self._unread_count = max(0, self._unread_count - 1)
-                    break
+    def get_all(self, limit: int = 50, user_id: str = BROADCAST) -> list:
+        from core import local_db
+        self._flush_before_read()
+        return local_db.get_notifications(user_id, limit)
 
-    def clear(self):
-        with self._lock:
-            self._notifications.clear()
-            self._unread_count = 0
+    def get_unread_count(self, user_id: str = BROADCAST) -> int:
+        from core import local_db
+        self._flush_before_read()
+        return local_db.get_unread_notification_count(user_id)
+
+    def mark_all_read(self, user_id: str = BROADCAST):
+        from core import local_db
+        self._flush_before_read()
+        local_db.mark_all_notifications_read(user_id)
+
+    def mark_read(self, notif_id: int, user_id: str = BROADCAST):
+        from core import local_db
+        self._flush_before_read()
+        local_db.mark_notification_read(user_id, notif_id)
+
+    def clear(self, user_id: str = BROADCAST):
+        from core import local_db
+        self._flush_before_read()
+        local_db.clear_notifications(user_id)
 
 # Singleton
 notifications = NotificationCenter()
@@ -75,10 +167,11 @@ try:
         }
         title = title_map.get(event_name, event_name.replace("_", " ").title())
         body = str(data)[:200] if data else ""
-        notifications.push(title, body, category="info", source=event_name)
+        user_id = data.get("user_id") if isinstance(data, dict) else None
+        notifications.push(title, body, category="info", source=event_name, user_id=user_id)
 
     for evt in ["flow_executed", "bot_ping", "macro_recorded", "clipboard_change",
                  "plugin_installed", "swarm_completed", "webhook_triggered"]:
-        bus.subscribe(evt, lambda data, en=evt: _on_event(en, data))
+        bus.subscribe(evt, _on_event, with_topic=True)
 except Exception:
     pass
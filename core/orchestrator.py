@@ -1,50 +1,194 @@
 import json
 import logging
-from typing import List, Dict, Any
-from core.llm_engine import WolfEngine
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List
+from core.llm_engine import WolfEngine, ChatCancelled, usage_report
 from core.bot_manager import get_bots
+from core.tracing import wrap
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_PARALLEL = 4
+MAX_PARALLEL_LIMIT = 16
+DEFAULT_AGENT_TIMEOUT = 180.0  # seconds per sub-agent task
+CANCEL_POLL_INTERVAL = 0.25    # how often a running plan checks for cancellation
+
+# Every agent of a turn gets the same digest of the conversation instead of a
+# full copy: the last HISTORY_RECENT_MESSAGES verbatim, older ones clipped.
+HISTORY_RECENT_MESSAGES = 6
+HISTORY_SNIPPET_CHARS = 200
+HISTORY_DIGEST_CHARS = 6000
+
+
+class _TaskCancel:
+    """One War Room task's stop flag; also reads as set once the whole run is cancelled."""
+
+    __slots__ = ("_own", "_run")
+
+    def __init__(self, run_event: threading.Event = None):
+        self._own = threading.Event()
+        self._run = run_event
+
+    def set(self):
+        self._own.set()
+
+    def is_set(self) -> bool:
+        return self._own.is_set() or (self._run is not None and self._run.is_set())
+
+
+def _history_digest(chat_history: List[Dict[str, str]]) -> str:
+    """Deterministic digest of the conversation, so every call of a turn sends identical bytes."""
+    turns = [m for m in chat_history if m.get("role") in ("user", "assistant") and m.get("content")]
+    if not turns:
+        return ""
+    older, recent = turns[:-HISTORY_RECENT_MESSAGES], turns[-HISTORY_RECENT_MESSAGES:]
+    lines = []
+    if older:
+        lines.append(f"Earlier ({len(older)} messages, clipped):")
+        for m in older:
+            text = " ".join(str(m["content"]).split())
+            if len(text) > HISTORY_SNIPPET_CHARS:
+                text = text[:HISTORY_SNIPPET_CHARS] + "..."
+            lines.append(f"- {m['role']}: {text}")
+        lines.append("")
+        lines.append("Most recent:")
+    for m in recent:
+        lines.append(f"{m['role']}: {m['content']}")
+    digest = "\n".join(lines)
+    if len(digest) > HISTORY_DIGEST_CHARS:
+        # Keep the newest lines; the cut is deterministic, so the prefix stays stable
+        tail = digest[-HISTORY_DIGEST_CHARS:]
+        digest = "...\n" + tail[tail.find("\n") + 1:]
+    return digest
+
+
+def _parse_plan(plan_text: str) -> List[Dict[str, Any]]:
+    """Manager output -> list of {id, agent_id, task, depends_on}."""
+    # Extract JSON if markdown wrapped
+    if "```json" in plan_text:
+        plan_text = plan_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in plan_text:
+        plan_text = plan_text.split("```")[1].split("```")[0].strip()
+
+    plan = json.loads(plan_text)
+    if isinstance(plan, dict):
+        plan = plan.get("tasks", [])
+    if not isinstance(plan, list):
+        raise ValueError("Plan is not a JSON array.")
+
+    tasks = []
+    for i, item in enumerate(plan):
+        if not isinstance(item, dict):
+            continue
+        deps = item.get("depends_on") or []
+        if not isinstance(deps, list):
+            deps = [deps]
+        tasks.append({
+            "id": str(item.get("id") or f"task_{i + 1}"),
+            "agent_id": item.get("agent_id"),
+            "task": item.get("task"),
+            "depends_on": [str(d) for d in deps],
+        })
+    return tasks
+
+
 class MultiAgentOrchestrator:
     """
     Handles 'War Room' multi-agent conversations.
     A Manager bot receives the user prompt, analyzes it, and delegates
     sub-tasks to a list of available specialized bots.
+
+    Sub-agent tasks run concurrently (at most `max_parallel` at a time). A
+    task listing `depends_on` waits for those tasks and receives their
+    results; if one of them fails, it is skipped. Each task gets
+    `agent_timeout` seconds, and the manager synthesizes whatever succeeded.
+
+    `run_war_room` can report events as they happen through `on_event`,
+    including 'token' events carrying each agent's output while it streams.
+    Setting `cancel_event` stops the run and aborts outstanding LLM calls.
+
+    The conversation and the user's request go to every agent as one shared
+    context block (see WolfEngine.chat's shared_context), so all calls of a
+    turn start with the same bytes and provider prompt caching can hit. A
+    final 'usage' event reports cached vs. uncached prompt tokens per agent.
     """
-    def __init__(self, manager_bot_id: str, sub_bot_ids: List[str], user_id: str = None):
+    def __init__(self, manager_bot_id: str, sub_bot_ids: List[str], user_id: str = None,
+                 max_parallel: int = DEFAULT_MAX_PARALLEL, agent_timeout: float = DEFAULT_AGENT_TIMEOUT):
         self.user_id = user_id
         self.manager_bot_id = manager_bot_id
         self.sub_bot_ids = sub_bot_ids
-        
+        self.max_parallel = max(1, min(int(max_parallel), MAX_PARALLEL_LIMIT))
+        self.agent_timeout = agent_timeout
+
         # Load bot profiles once
         all_bots = get_bots(user_id=user_id)
         self.manager_bot = all_bots.get(manager_bot_id)
         self.sub_bots = {bid: all_bots.get(bid) for bid in sub_bot_ids if bid in all_bots}
-        
+
         if not self.manager_bot:
             raise ValueError(f"Manager bot {manager_bot_id} not found.")
         if not self.sub_bots:
             raise ValueError("No valid sub-bots provided.")
 
-    def run_war_room(self, user_prompt: str, chat_history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    def _engine(self, profile: Dict) -> WolfEngine:
+        return WolfEngine(
+            profile["model"],
+            fallback_models=profile.get("fallback_models", []),
+            user_id=self.user_id
+        )
+
+    def run_war_room(self, user_prompt: str, chat_history: List[Dict[str, str]],
+                     on_event: Callable[[Dict], None] = None,
+                     cancel_event: threading.Event = None) -> List[Dict[str, Any]]:
         """
         Executes the multi-agent orchestration sequence:
         1. Manager breaks down the task.
         2. Manager delegates to sub-bots.
-        3. Sub-bots execute and return results.
+        3. Sub-bots execute concurrently and return results.
         4. Manager synthesizes the final response.
-        
+
         Returns a list of 'event' dicts that can be displayed in the UI sequentially.
+        Each one is also passed to `on_event` when it happens; token events
+        only go to `on_event`.
         """
         events = []
-        
+        usage: List[Dict] = []
+
+        def emit(event: Dict):
+            events.append(event)
+            if on_event is not None:
+                on_event(event)
+
+        try:
+            self._run_stages(user_prompt, chat_history, emit, usage, on_event, cancel_event)
+        finally:
+            if usage:
+                emit(self._usage_event(usage))
+        return events
+
+    def _run_stages(self, user_prompt: str, chat_history: List[Dict[str, str]], emit: Callable[[Dict], None],
+                    usage: List[Dict], on_event: Callable[[Dict], None], cancel_event: threading.Event):
+        def cancelled() -> bool:
+            if cancel_event is None or not cancel_event.is_set():
+                return False
+            emit({"type": "status", "bot_name": "System", "content": "War Room cancelled."})
+            return True
+
+        def record(agent: str, task_id: str, response):
+            usage.append(dict(usage_report(response), agent=agent, task_id=task_id))
+
+        token_sink = self._token_sink(on_event)
+        shared_context = f"Conversation so far:\n{_history_digest(chat_history)}\n\n" if chat_history else ""
+        shared_context += f'Current user request:\n"{user_prompt}"'
+
         # 1. Provide Context to Manager
         sub_bots_info = "\n".join([
-            f"- {bot_info['name']} (ID: {bot_id}): {bot_info['prompt'][:100]}..." 
+            f"- {bot_info['name']} (ID: {bot_id}): {bot_info['prompt'][:100]}..."
             for bot_id, bot_info in self.sub_bots.items()
         ])
-        
+
         orchestration_prompt = f"""
 You are the Lead Manager of this War Room. You must accomplish the following user request:
 "{user_prompt}"
@@ -54,155 +198,292 @@ You have the following specialized agents available to you:
 
 Step 1: Break down the user's request into specific tasks.
 Step 2: Assign EACH task to the most appropriate agent by referencing their exact ID.
-Step 3: Output your plan as a valid JSON array of objects. NO OTHER TEXT. 
+Step 3: Output your plan as a valid JSON array of objects. NO OTHER TEXT.
+Tasks run in parallel. Only if a task needs another task's output, list that
+task's id in "depends_on".
 Format:
 [
   {{
+    "id": "task_1",
     "agent_id": "the-id-of-the-agent",
-    "task": "The specific instruction for this agent"
+    "task": "The specific instruction for this agent",
+    "depends_on": []
   }}
 ]
 """
-        
-        events.append({
+
+        emit({
             "type": "status",
             "bot_name": self.manager_bot["name"],
             "content": "Analyzing task and delegating..."
         })
-        
+
         # Initialize Manager Engine
-        manager_engine = WolfEngine(
-            self.manager_bot["model"], 
-            fallback_models=self.manager_bot.get("fallback_models", []),
-            user_id=self.user_id
-        )
-        
+        manager_engine = self._engine(self.manager_bot)
+
         # Get Delegation Plan
         try:
-            # We use a temporary history for the manager's meta-cognition
-            temp_history = chat_history.copy()
-            temp_history.append({"role": "user", "content": orchestration_prompt})
-            
             response = manager_engine.chat(
-                messages=temp_history,
+                messages=[{"role": "user", "content": orchestration_prompt}],
                 system_prompt="You are an expert project manager. You ONLY output valid JSON arrays.",
-                bot_id=self.manager_bot_id
+                bot_id=self.manager_bot_id,
+                cancel_event=cancel_event,
+                shared_context=shared_context
             )
-            
-            plan_text = response.choices[0].message.content
-            
-            # Extract JSON if markdown wrapped
-            if "```json" in plan_text:
-                plan_text = plan_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in plan_text:
-                plan_text = plan_text.split("```")[1].split("```")[0].strip()
-                
-            delegation_plan = json.loads(plan_text)
-            
+            record(self.manager_bot["name"], "plan", response)
+
+            delegation_plan = _parse_plan(response.choices[0].message.content)
+
+        except ChatCancelled:
+            cancelled()
+            return
         except Exception as e:
             logger.error(f"Failed to generate delegation plan: {e}")
-            events.append({
+            emit({
                 "type": "error",
                 "bot_name": "System",
                 "content": f"Manager failed to create a valid plan: {e}"
             })
-            return events
+            return
 
         # 2. Execute Plan
-        sub_results = []
-        for task_item in delegation_plan:
-            target_agent_id = task_item.get("agent_id")
-            task_instruction = task_item.get("task")
-            
-            agent_profile = self.sub_bots.get(target_agent_id)
-            if not agent_profile:
-                continue
-                
-            events.append({
-                "type": "status",
-                "bot_name": agent_profile["name"],
-                "content": f"Working on: {task_instruction}"
+        sub_results, failures = self._execute_plan(delegation_plan, shared_context, emit, usage, token_sink,
+                                                   cancel_event)
+        if cancelled():
+            return
+
+        if not sub_results:
+            emit({
+                "type": "error",
+                "bot_name": "System",
+                "content": "No agent completed its task; nothing to synthesize."
             })
-            
-            try:
-                # Initialize Sub-Agent Engine
-                agent_engine = WolfEngine(
-                    agent_profile["model"], 
-                    fallback_models=agent_profile.get("fallback_models", []),
-                    user_id=self.user_id
-                )
-                
-                # Contextualize the sub-agent's prompt
-                agent_context = chat_history.copy()
-                agent_context.append({
-                    "role": "user", 
-                    "content": f"The Manager has assigned you the following task:\n\n{task_instruction}\n\nPlease execute it."
-                })
-                
-                res = agent_engine.chat(
-                    messages=agent_context,
-                    system_prompt=agent_profile["prompt"],
-                    bot_id=target_agent_id
-                )
-                
-                agent_reply = res.choices[0].message.content
-                
-                events.append({
-                    "type": "message",
-                    "bot_name": agent_profile["name"],
-                    "content": agent_reply
-                })
-                
-                sub_results.append({
-                    "agent": agent_profile["name"],
-                    "task": task_instruction,
-                    "result": agent_reply
-                })
-                
-            except Exception as e:
-                events.append({
-                    "type": "error",
-                    "bot_name": agent_profile["name"],
-                    "content": f"Failed to execute task: {e}"
-                })
+            return
 
         # 3. Manager Synthesis
-        events.append({
+        emit({
             "type": "status",
             "bot_name": self.manager_bot["name"],
             "content": "Synthesizing final response..."
         })
-        
+
+        failure_note = ""
+        if failures:
+            failure_note = (
+                "\nThese tasks did NOT complete, so their results are missing. "
+                "Work with what you have and tell the user what is missing:\n"
+                f"{json.dumps(failures, indent=2)}\n"
+            )
         synthesis_prompt = f"""
 The sub-agents have completed their tasks. Here are their results:
 
 {json.dumps(sub_results, indent=2)}
-
+{failure_note}
 Please synthesize these results into a final, cohesive response for the user, answering their original request:
 "{user_prompt}"
 """
         try:
-            temp_history = chat_history.copy()
-            temp_history.append({"role": "user", "content": synthesis_prompt})
-            
             final_response = manager_engine.chat(
-                messages=temp_history,
+                messages=[{"role": "user", "content": synthesis_prompt}],
                 system_prompt=self.manager_bot["prompt"],
-                bot_id=self.manager_bot_id
+                bot_id=self.manager_bot_id,
+                on_token=token_sink("synthesis", self.manager_bot["name"]) if token_sink else None,
+                cancel_event=cancel_event,
+                shared_context=shared_context
             )
-            
+            record(self.manager_bot["name"], "synthesis", final_response)
+
             final_reply = final_response.choices[0].message.content
-            events.append({
+            emit({
                 "type": "message",
                 "bot_name": self.manager_bot["name"],
+                "task_id": "synthesis",
                 "content": final_reply
             })
-            
+
+        except ChatCancelled:
+            cancelled()
         except Exception as e:
-            events.append({
+            emit({
                 "type": "error",
                 "bot_name": "System",
                 "content": f"Manager synthesis failed: {e}"
             })
 
-        return events
+    @staticmethod
+    def _usage_event(usage: List[Dict]) -> Dict:
+        totals = {key: sum(u[key] for u in usage) for key in
+                  ("prompt_tokens", "cached_prompt_tokens", "uncached_prompt_tokens", "completion_tokens")}
+        return {
+            "type": "usage",
+            "bot_name": "System",
+            "content": (f"{totals['prompt_tokens']} prompt tokens ({totals['cached_prompt_tokens']} cached), "
+                        f"{totals['completion_tokens']} completion tokens across {len(usage)} calls."),
+            "agents": usage,
+            "totals": totals
+        }
+
+    @staticmethod
+    def _token_sink(on_event):
+        """Factory of per-task on_token callbacks that forward deltas as 'token' events."""
+        if on_event is None:
+            return None
+
+        def for_task(task_id: str, bot_name: str):
+            return lambda text: on_event({"type": "token", "bot_name": bot_name, "task_id": task_id,
+                                          "content": text})
+        return for_task
+
+    @staticmethod
+    def _guard_tokens(sink: Callable[[str], None], stop: _TaskCancel) -> Callable[[str], None]:
+        """Drop a task's token deltas once it has failed, timed out or been cancelled."""
+        def forward(text: str):
+            if not stop.is_set():
+                sink(text)
+        return forward
+
+    # ----------- SUB-AGENT EXECUTION -----------
+
+    def _run_agent(self, engine: WolfEngine, agent_id: str, profile: Dict, instruction: str,
+                   dep_results: List[Dict], shared_context: str,
+                   on_token=None, cancel_event: threading.Event = None):
+        """Returns (reply, usage_report)."""
+        # Contextualize the sub-agent's prompt
+        content = f"The Manager has assigned you the following task:\n\n{instruction}\n\n"
+        if dep_results:
+            content += f"Results of the tasks yours builds on:\n{json.dumps(dep_results, indent=2)}\n\n"
+
+        res = engine.chat(
+            messages=[{"role": "user", "content": content + "Please execute it."}],
+            system_prompt=profile["prompt"],
+            bot_id=agent_id,
+            on_token=on_token,
+            cancel_event=cancel_event,
+            shared_context=shared_context
+        )
+        return res.choices[0].message.content, usage_report(res)
+
+    def _execute_plan(self, plan: List[Dict], shared_context: str, emit: Callable[[Dict], None],
+                      usage: List[Dict], on_token=None, cancel_event: threading.Event = None):
+        """
+        Run plan tasks as their dependencies finish. Returns (sub_results, failures)
+        in plan order. Each agent gets its own cancel flag (combined with
+        cancel_event) that is set when its task fails, so a timed-out agent
+        aborts its LLM call and its tokens stop being forwarded; it is not
+        waited for. Once cancel_event is set nothing new starts and unfinished
+        tasks fail. Each finished agent's token usage is appended to `usage`.
+        """
+        tasks = {}
+        for item in plan:
+            profile = self.sub_bots.get(item["agent_id"])
+            if profile and item["id"] not in tasks:
+                tasks[item["id"]] = dict(item, profile=profile)
+        for t in tasks.values():
+            unknown = [d for d in t["depends_on"] if d not in tasks]
+            if unknown:
+                logger.warning(f"War Room task {t['id']} depends on unknown tasks {unknown}; ignoring them.")
+            t["depends_on"] = [d for d in t["depends_on"] if d in tasks and d != t["id"]]
+
+        results: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+        engines: Dict[str, WolfEngine] = {}
+        running = {}  # future -> (task_id, deadline)
+        stops: Dict[str, _TaskCancel] = {}
+        pending = list(tasks)
+
+        def fail(task_id: str, message: str):
+            if task_id in stops:
+                stops[task_id].set()
+            errors[task_id] = message
+            emit({
+                "type": "error",
+                "bot_name": tasks[task_id]["profile"]["name"],
+                "task_id": task_id,
+                "content": message
+            })
+
+        # Concurrency is gated by `running`; the pool is sized so an abandoned
+        # (timed-out) agent never holds back a queued one.
+        pool = ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix="WarRoomAgent")
+        try:
+            while pending or running:
+                # Skip tasks whose dependencies failed; start those whose dependencies are done
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for task_id in list(pending):
+                        deps = tasks[task_id]["depends_on"]
+                        failed = [d for d in deps if d in errors]
+                        if failed:
+                            pending.remove(task_id)
+                            fail(task_id, f"Skipped: depends on failed task(s) {', '.join(failed)}.")
+                            progressed = True
+                        elif all(d in results for d in deps) and len(running) < self.max_parallel:
+                            pending.remove(task_id)
+                            t = tasks[task_id]
+                            emit({
+                                "type": "status",
+                                "bot_name": t["profile"]["name"],
+                                "task_id": task_id,
+                                "content": f"Working on: {t['task']}"
+                            })
+                            engine = engines.get(t["agent_id"])
+                            if engine is None:
+                                engine = engines[t["agent_id"]] = self._engine(t["profile"])
+                            dep_results = [{"task": tasks[d]["task"], "result": results[d]} for d in deps]
+                            stop = stops[task_id] = _TaskCancel(cancel_event)
+                            agent_on_token = None
+                            if on_token:
+                                agent_on_token = self._guard_tokens(on_token(task_id, t["profile"]["name"]), stop)
+                            future = pool.submit(wrap(self._run_agent), engine, t["agent_id"], t["profile"],
+                                                 t["task"], dep_results, shared_context, agent_on_token, stop)
+                            running[future] = (task_id, time.monotonic() + self.agent_timeout)
+
+                if not running:
+                    for task_id in pending:  # only a dependency cycle can leave tasks here
+                        fail(task_id, "Skipped: circular depends_on in the plan.")
+                    break
+
+                timeout = max(0.0, min(deadline for _, deadline in running.values()) - time.monotonic())
+                if cancel_event is not None:
+                    timeout = min(timeout, CANCEL_POLL_INTERVAL)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if cancel_event is not None and cancel_event.is_set():
+                    # Agents see the same event and abort their LLM calls; don't wait for them.
+                    for task_id, _ in running.values():
+                        fail(task_id, "Cancelled.")
+                    for task_id in pending:
+                        fail(task_id, "Cancelled.")
+                    running.clear()
+                    break
+                for future in done:
+                    task_id, _ = running.pop(future)
+                    try:
+                        results[task_id], report = future.result()
+                        usage.append(dict(report, agent=tasks[task_id]["profile"]["name"], task_id=task_id))
+                        emit({
+                            "type": "message",
+                            "bot_name": tasks[task_id]["profile"]["name"],
+                            "task_id": task_id,
+                            "content": results[task_id],
+                            "usage": report
+                        })
+                    except Exception as e:
+                        fail(task_id, f"Failed to execute task: {e}")
+                now = time.monotonic()
+                for future, (task_id, deadline) in list(running.items()):
+                    if now >= deadline and not future.done():
+                        running.pop(future)
+                        fail(task_id, f"Timed out after {self.agent_timeout:.0f}s.")
+        finally:
+            pool.shutdown(wait=False)
+
+        sub_results = [
+            {"agent": tasks[i]["profile"]["name"], "task": tasks[i]["task"], "result": results[i]}
+            for i in tasks if i in results
+        ]
+        failures = [
+            {"agent": tasks[i]["profile"]["name"], "task": tasks[i]["task"], "error": errors[i]}
+            for i in tasks if i in errors
+        ]
+        return sub_results, failures
@@ -0,0 +1,316 @@
+"""
+Bounded, streaming capture of command output for the terminal and SSH tools.
+
+Commands used to buffer their whole output in memory and hand all of it to
+the LLM, so a `cat` of a large log could use gigabytes of RAM and overflow
+the context window. An OutputCapture is fed chunks as they arrive and keeps
+only a head and a tail window per stream (stdout/stderr). Once output
+outgrows the windows, everything from the first byte on is spilled to a
+file under data/tool_output/ named by the capture's id; the tool reply
+shows head + tail with an omission marker carrying that id, and the rest
+can be paged with `read_output` (LLM tool `read_command_output`, or
+GET /api/tools/output/{id}).
+
+While a command runs, its output is published on the EventBus as
+`tool.output.chunk` events (rate-limited), bracketed by `tool.output.started`
+and `tool.output.finished`, so streaming clients (SSE /api/stream with
+topics=tool.output.*) can show it live. Output is private: events carry the
+requesting user's id (from `owned_by`) and /api/stream only delivers them to
+that user; a capture with no owner publishes nothing.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from core.paths import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+HEAD_CHARS = 4000              # kept from the start of each stream
+TAIL_CHARS = 12000             # kept from the end of each stream
+SPILL_MAX_BYTES = 64 * 1024 * 1024
+SPILL_RETENTION = 24 * 3600    # spill files older than this are deleted
+PRUNE_INTERVAL = 3600
+READ_DEFAULT_CHARS = 8000
+READ_MAX_CHARS = 65536
+PUBLISH_INTERVAL = 0.25        # at most one live chunk event per capture per interval
+PUBLISH_MAX_CHARS = 16384      # live text per event; the rest of a burst is skipped
+
+SPILL_DIR = get_data_dir() / "tool_output"
+_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+_owner: contextvars.ContextVar = contextvars.ContextVar("wolfclaw_tool_owner", default=None)
+
+
+@contextmanager
+def owned_by(user_id: Optional[str]):
+    """Captures created inside this block stream their live output to `user_id` only."""
+    token = _owner.set(user_id)
+    try:
+        yield
+    finally:
+        _owner.reset(token)
+
+
+class _Window:
+    """Head and tail of one stream; the middle is only counted."""
+
+    __slots__ = ("head", "head_len", "tail", "tail_len", "head_chars", "tail_chars", "total")
+
+    def __init__(self, head_chars: int, tail_chars: int):
+        self.head = []
+        self.head_len = 0
+        self.tail = deque()
+        self.tail_len = 0
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.total = 0
+
+    def add(self, text: str):
+        self.total += len(text)
+        room = self.head_chars - self.head_len
+        if room > 0:
+            self.head.append(text[:room])
+            self.head_len += min(room, len(text))
+            text = text[room:]
+        if not text:
+            return
+        self.tail.append(text)
+        self.tail_len += len(text)
+        while self.tail_len - len(self.tail[0]) >= self.tail_chars:
+            self.tail_len -= len(self.tail.popleft())
+
+    @property
+    def omitted(self) -> int:
+        return max(0, self.total - self.head_chars - self.tail_chars)
+
+    def render(self, marker: str) -> str:
+        head = "".join(self.head)
+        tail = "".join(self.tail)
+        if not self.omitted:
+            return head + tail
+        return f"{head}\n\n... [{self.omitted} characters omitted; {marker}] ...\n\n{tail[-self.tail_chars:]}"
+
+
+class OutputCapture:
+    """Collects one command's output in bounded memory. Thread-safe; feed it from reader threads."""
+
+    def __init__(self, tool: str, label: str = "", head_chars: int = HEAD_CHARS, tail_chars: int = TAIL_CHARS,
+                 live: bool = True, user_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.tool = tool
+        self.label = label
+        self.user_id = user_id or _owner.get()
+        self.live = live and bool(self.user_id)
+        self._lock = threading.Lock()
+        self._windows = {name: _Window(head_chars, tail_chars) for name in ("stdout", "stderr")}
+        self._pending = []         # chunks kept until a stream overflows its window (then spilled)
+        self._spill = None
+        self._spill_path = None
+        self._spilled_bytes = 0
+        self._spill_full = False
+        self._live_buf = {"stdout": [], "stderr": []}
+        self._live_len = 0
+        self._live_skipped = 0
+        self._last_publish = 0.0
+        self.finished = False
+        if self.live:
+            self._publish("tool.output.started", {"tool": tool, "label": label})
+
+    # ----------- FEEDING -----------
+
+    def write(self, stream: str, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self.finished:
+                # A reader that outlived finish() (e.g. a detached grandchild holding the
+                # pipe): the reply is already built and the spill file must not be reopened.
+                return
+            window = self._windows[stream]
+            window.add(text)
+            self._to_spill(stream, text)
+            if self.live:
+                self._buffer_live(stream, text)
+        if self.live and time.monotonic() - self._last_publish >= PUBLISH_INTERVAL:
+            self._flush_live()
+
+    def _to_spill(self, stream: str, text: str):
+        # Called under self._lock.
+        if self._spill is None and not self._spill_full:
+            self._pending.append((stream, text))
+            if not any(w.omitted for w in self._windows.values()):
+                return
+            self._open_spill()
+            pending, self._pending = self._pending, []
+        else:
+            pending = [(stream, text)]
+        if self._spill is None:
+            return
+        for name, chunk in pending:
+            data = chunk.encode("utf-8", errors="replace")
+            if self._spilled_bytes + len(data) > SPILL_MAX_BYTES:
+                self._spill.write(b"\n... [spill limit reached; remaining output was not saved]\n")
+                self._close_spill()
+                self._spill_full = True
+                return
+            self._spill.write(data)
+            self._spilled_bytes += len(data)
+
+    def _open_spill(self):
+        _prune_spills()
+        try:
+            SPILL_DIR.mkdir(parents=True, exist_ok=True)
+            self._spill_path = SPILL_DIR / f"{self.id}.log"
+            self._spill = open(self._spill_path, "wb")
+        except OSError as e:
+            logger.warning(f"Could not spill output of {self.tool} to disk: {e}")
+            self._spill = None
+            self._spill_path = None
+            self._spill_full = True
+            self._pending = []
+
+    def _close_spill(self):
+        if self._spill is not None:
+            try:
+                self._spill.close()
+            except OSError:
+                pass
+            self._spill = None
+
+    # ----------- LIVE EVENTS -----------
+
+    def _buffer_live(self, stream: str, text: str):
+        # Called under self._lock.
+        room = PUBLISH_MAX_CHARS - self._live_len
+        if room <= 0:
+            self._live_skipped += len(text)
+            return
+        self._live_buf[stream].append(text[:room])
+        self._live_len += min(room, len(text))
+        self._live_skipped += max(0, len(text) - room)
+
+    def _flush_live(self):
+        with self._lock:
+            if not self._live_len and not self._live_skipped:
+                return
+            buffers = {name: "".join(chunks) for name, chunks in self._live_buf.items() if chunks}
+            skipped = self._live_skipped
+            self._live_buf = {"stdout": [], "stderr": []}
+            self._live_len = 0
+            self._live_skipped = 0
+            self._last_publish = time.monotonic()
+        for stream, content in buffers.items():
+            self._publish("tool.output.chunk", {"stream": stream, "content": content})
+        if skipped:
+            self._publish("tool.output.chunk", {"stream": "", "content": "", "skipped": skipped})
+
+    def _publish(self, topic: str, data: Dict):
+        try:
+            from core.bus import bus
+            bus.publish(topic, {"output_id": self.id, "user_id": self.user_id, **data})
+        except Exception as e:
+            logger.debug(f"Could not publish {topic}: {e}")
+
+    # ----------- RESULT -----------
+
+    def finish(self, exit_status: Optional[int] = None, note: str = ""):
+        """Flush live output and close the spill file. Later writes are ignored. Safe to call twice."""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            self._close_spill()
+            self._spill_full = True
+            self._pending = []
+        if self.live:
+            self._flush_live()
+            self._publish("tool.output.finished", {"tool": self.tool, "label": self.label,
+                                                   "exit_status": exit_status, "note": note,
+                                                   "total_chars": self.total_chars, "truncated": self.truncated})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+    @property
+    def total_chars(self) -> int:
+        return sum(w.total for w in self._windows.values())
+
+    @property
+    def truncated(self) -> bool:
+        return any(w.omitted for w in self._windows.values())
+
+    @property
+    def spill_path(self):
+        return self._spill_path
+
+    def text(self, stream: str = "stdout") -> str:
+        """The stream's output: complete if it fit, else head + marker + tail."""
+        if self._spill_path is not None:
+            marker = f"full output saved as output_id {self.id}, page through it with read_command_output"
+        else:
+            marker = "full output was not saved"
+        with self._lock:
+            return self._windows[stream].render(marker)
+
+    def render(self) -> str:
+        """stdout, then stderr under an 'Error Output:' header, as the tools have always returned them."""
+        output = self.text("stdout")
+        err_output = self.text("stderr")
+        if err_output:
+            output += f"\nError Output:\n{err_output}"
+        return output
+
+
+def read_output(output_id: str, offset: int = 0, length: int = READ_DEFAULT_CHARS) -> Dict:
+    """
+    A slice of a spilled output by character offset. Returns content, the
+    next offset and whether the end was reached; KeyError if unknown/expired.
+    """
+    if not _ID_RE.match(output_id or ""):
+        raise KeyError(output_id)
+    path = SPILL_DIR / f"{output_id}.log"
+    if not path.exists():
+        raise KeyError(output_id)
+    offset = max(0, int(offset))
+    length = max(1, min(int(length), READ_MAX_CHARS))
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        skipped = 0
+        while skipped < offset:
+            block = f.read(min(READ_MAX_CHARS, offset - skipped))
+            if not block:
+                break
+            skipped += len(block)
+        content = f.read(length)
+        eof = not f.read(1)
+    return {"output_id": output_id, "offset": offset, "next_offset": offset + len(content),
+            "content": content, "eof": eof, "size_bytes": path.stat().st_size}
+
+
+def _prune_spills():
+    """Delete spill files past SPILL_RETENTION; runs at most once per PRUNE_INTERVAL."""
+    global _last_prune
+    with _prune_lock:
+        now = time.time()
+        if now - _last_prune < PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    try:
+        for path in SPILL_DIR.glob("*.log"):
+            try:
+                if now - path.stat().st_mtime > SPILL_RETENTION:
+                    path.unlink()
+            except OSError:
+                pass
+    except OSError:
+        pass
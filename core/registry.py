@@ -0,0 +1,101 @@
+"""
+In-memory registry of each user's workspace, bots and SSH servers (desktop mode).
+
+Resolving "which workspace, which bots" used to cost a workspaces query plus
+a bots query (with a json.loads per bot) every time a handler, the engine or
+a tool asked. The registry caches both, tagged with a version number;
+local_db mutators call `invalidate()`, which bumps the version so every
+cached entry is treated as stale. A load that races with a mutation is
+discarded instead of cached.
+
+Callers always receive copies, so mutating a returned bot dict is safe.
+"""
+import copy
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workspaces: Dict[str, tuple] = {}  # user_id -> (version, ws_id)
+        self._bots: Dict[str, tuple] = {}        # ws_id -> (version, {bot_id: bot})
+        self._ssh: Dict[str, tuple] = {}         # ws_id -> (version, [server])
+        self._versions = {"workspaces": 0, "bots": 0, "ssh": 0}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, reason: str = "", bots_only: bool = False):
+        """
+        Mark cached entries stale; called after any write. Bot writes pass
+        `bots_only=True` so the (rarely changing) workspace ids survive.
+        """
+        with self._lock:
+            self._versions["bots"] += 1
+            self._bots.clear()
+            if not bots_only:
+                self._versions["workspaces"] += 1
+                self._workspaces.clear()
+                self._versions["ssh"] += 1
+                self._ssh.clear()
+        logger.debug(f"Registry invalidated ({reason or 'unspecified'}, bots_only={bots_only})")
+
+    def _lookup(self, kind: str, key: str, loader: Callable):
+        table = {"workspaces": self._workspaces, "bots": self._bots, "ssh": self._ssh}[kind]
+        with self._lock:
+            entry = table.get(key)
+            version = self._versions[kind]
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            # Only keep the result if nothing was written while it loaded.
+            if self._versions[kind] == version:
+                table[key] = (version, value)
+        return value
+
+    def workspace_id(self, user_id: str) -> str:
+        """The user's active (first) workspace, created on first use."""
+        from core import local_db
+
+        def load():
+            workspaces = local_db.get_workspaces_for_user(user_id)
+            if workspaces:
+                return workspaces[0]["id"]
+            ws_id = local_db.create_workspace(user_id, "Default Workspace")
+            logger.info(f"Created new default workspace: {ws_id}")
+            return ws_id
+
+        return self._lookup("workspaces", user_id, load)
+
+    def bots(self, ws_id: str) -> Dict[str, Dict]:
+        """All bots in a workspace, keyed by bot id (deep copy)."""
+        from core import local_db
+        bots = self._lookup("bots", ws_id, lambda: local_db.get_bots_for_workspace(ws_id))
+        return copy.deepcopy(bots)
+
+    def bot(self, ws_id: str, bot_id: str) -> Optional[Dict]:
+        from core import local_db
+        bots = self._lookup("bots", ws_id, lambda: local_db.get_bots_for_workspace(ws_id))
+        bot = bots.get(bot_id)
+        return copy.deepcopy(bot) if bot else None
+
+    def ssh_servers(self, ws_id: str) -> List[Dict]:
+        """The workspace's saved SSH servers (deep copy; includes credentials)."""
+        from core import local_db
+        servers = self._lookup("ssh", ws_id, lambda: local_db.get_workspace_ssh(ws_id))
+        return copy.deepcopy(servers)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {"versions": dict(self._versions), "hits": self.hits, "misses": self.misses,
+                    "workspaces": len(self._workspaces), "bot_sets": len(self._bots),
+                    "ssh_sets": len(self._ssh)}
+
+# Singleton
+registry = Registry()
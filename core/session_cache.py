@@ -0,0 +1,119 @@
+"""
+In-process cache for session-token lookups.
+
+api.deps.get_current_user runs on every authenticated request; without a
+cache each one opens a SQLite connection. Valid sessions are cached until
+the earlier of `ttl` and the session's own expiry; unknown or expired
+tokens are cached negatively for a short time. Expired rows are deleted by
+a background sweeper instead of inside the request path.
+
+Every invalidation bumps a generation counter; a DB lookup that started
+under an older generation is returned but not cached, so a lookup racing
+a logout cannot put the deleted session back.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    def __init__(self, ttl: float = 300, negative_ttl: float = 30,
+                 max_entries: int = 10_000, sweep_interval: float = 3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # token -> (session or None, cached_until)
+        self._generation = 0  # bumped by every invalidation
+        self._sweeper = None
+        self._stop_event = threading.Event()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Return the session for `token`, or None if it is unknown or expired."""
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(token)
+            generation = self._generation
+        if hit is not None:
+            session, cached_until = hit
+            if now < cached_until:
+                if session is None or session["expires_at"] > now:
+                    return session
+                return None
+
+        from core import local_db
+        session = local_db.get_session(token)
+        if session:
+            cached_until = min(now + self.ttl, session["expires_at"])
+        else:
+            cached_until = now + self.negative_ttl
+        with self._lock:
+            if generation != self._generation:
+                return session  # invalidated while we were reading; don't cache
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[token] = (session, cached_until)
+        self._ensure_sweeper()
+        return session
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached session of `user_id` (account deleted, all sessions revoked)."""
+        with self._lock:
+            self._generation += 1
+            self._entries = {t: e for t, e in self._entries.items()
+                             if e[0] is None or e[0].get("user_id") != user_id}
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _evict(self, now: float):
+        # Called under self._lock: drop stale entries, then everything if still full.
+        self._entries = {t: e for t, e in self._entries.items() if e[1] > now}
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+    # ----------- BACKGROUND SWEEPER -----------
+
+    def _ensure_sweeper(self):
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="SessionSweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval):
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Delete expired sessions from the DB and drop stale cache entries."""
+        from core import local_db
+        try:
+            removed = local_db.delete_expired_sessions()
+        except Exception as e:
+            logger.warning(f"Session sweep failed: {e}")
+            return 0
+        with self._lock:
+            self._evict(time.time())
+        if removed:
+            logger.info(f"Swept {removed} expired sessions.")
+        return removed
+
+    def stop(self):
+        self._stop_event.set()
+
+# Singleton
+session_cache = SessionCache()
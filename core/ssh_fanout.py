@@ -0,0 +1,186 @@
+"""
+Run one command on many saved SSH servers at once.
+
+Hosts run on a bounded thread pool over the shared SSH connection pool
+(core.ssh_pool), each under its own wall-clock timeout, so checking fifty
+servers costs roughly the slowest host instead of the sum of all of them.
+Output is passed to `on_event` per host as it arrives; the return value is
+an aggregated, structured result with one entry per host.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_PARALLEL = 16
+MAX_PARALLEL_LIMIT = 64
+DEFAULT_TIMEOUT = 60
+MAX_TIMEOUT = 3600
+MAX_HOSTS = 200
+TOOL_OUTPUT_CHARS = 1500   # per-host output kept in the tool reply for the LLM
+HOST_HEAD_CHARS = 2000     # per-host output kept in the result (rest spills, see core.output_capture)
+HOST_TAIL_CHARS = 6000
+STREAM_MAX_CHARS = 1024 * 1024  # per-host output forwarded to on_event
+
+STATUSES = ("ok", "failed", "timeout", "error", "cancelled")
+
+
+def select_servers(servers: List[Dict], hosts=None) -> List[Dict]:
+    """
+    Servers matching `hosts`: empty or "all" selects every server; otherwise a
+    list (or comma-separated string) of server names, hostnames, ids or groups.
+    Raises ValueError if a selector matches nothing.
+    """
+    if isinstance(hosts, str):
+        hosts = [h.strip() for h in hosts.split(",")]
+    selectors = [h for h in hosts or [] if h]
+    if not selectors or any(h.lower() == "all" for h in selectors):
+        return list(servers)
+
+    selected, seen = [], set()
+    for selector in selectors:
+        wanted = selector.lower()
+        matches = [s for s in servers if wanted in (
+            str(s.get("name", "")).lower(), str(s.get("host", "")).lower(),
+            str(s.get("id", "")).lower(), str(s.get("group", "")).lower())]
+        if not matches:
+            raise ValueError(f"No saved server or group matches '{selector}'.")
+        for server in matches:
+            key = server.get("id") or (server.get("host"), server.get("port"), server.get("user"))
+            if key not in seen:
+                seen.add(key)
+                selected.append(server)
+    return selected
+
+
+def _run_host(server: Dict, command: str, timeout: float, emit: Callable,
+              cancel_event: threading.Event) -> Dict:
+    from core.ssh_pool import ssh_pool
+    from core.tools import _ssh_target
+
+    target = _ssh_target(server)
+    label = target["name"] or target["host"]
+    result = {"id": server.get("id"), "name": label, "host": target["host"], "status": "error",
+              "exit_status": None, "stdout": "", "stderr": "", "output_id": None, "error": None, "duration_ms": 0}
+    if cancel_event.is_set():
+        result["status"] = "cancelled"
+        return result
+    if not target["host"]:
+        result["error"] = "Server has no host configured."
+        return result
+    if not target["password"] and not target["key_content"]:
+        result["error"] = "No SSH authentication method (password or PEM key) saved for this server."
+        return result
+
+    from core.output_capture import OutputCapture
+    capture = OutputCapture("run_remote_ssh_fanout", label=label, head_chars=HOST_HEAD_CHARS,
+                            tail_chars=HOST_TAIL_CHARS, live=False)
+    streamed = 0
+
+    def on_output(stream: str, text: str):
+        nonlocal streamed
+        capture.write(stream, text)
+        if streamed < STREAM_MAX_CHARS:
+            text = text[:STREAM_MAX_CHARS - streamed]
+            streamed += len(text)
+            emit({"type": "output", "host": label, "stream": stream, "content": text})
+            if streamed >= STREAM_MAX_CHARS:
+                emit({"type": "output_truncated", "host": label, "output_id": capture.id})
+
+    emit({"type": "host_started", "host": label})
+    started = time.time()
+    try:
+        status = ssh_pool.stream(
+            target["host"], command, on_output, port=target["port"], user=target["user"],
+            password=target["password"], key_content=target["key_content"], timeout=timeout,
+            cancel_event=cancel_event
+        )
+        if status is None:
+            result["status"] = "cancelled" if cancel_event.is_set() else "timeout"
+            if result["status"] == "timeout":
+                result["error"] = f"Timed out after {timeout}s."
+        else:
+            result["exit_status"] = status
+            result["status"] = "ok" if status == 0 else "failed"
+    except Exception as e:
+        result["error"] = str(e)
+        logger.warning(f"Fan-out to {label} failed: {e}")
+    finally:
+        capture.finish(result["exit_status"])
+    result["stdout"] = capture.text("stdout")
+    result["stderr"] = capture.text("stderr")
+    if capture.spill_path is not None:
+        result["output_id"] = capture.id
+    result["duration_ms"] = int((time.time() - started) * 1000)
+    return result
+
+
+def fan_out(command: str, servers: List[Dict], max_parallel: int = MAX_PARALLEL,
+            timeout: float = DEFAULT_TIMEOUT, on_event: Optional[Callable[[Dict], None]] = None,
+            cancel_event: Optional[threading.Event] = None) -> Dict:
+    """
+    Run `command` on every server concurrently (at most `max_parallel` at a
+    time, each limited to `timeout` seconds). Emits host_started, output and
+    host_done events; returns {"command", "hosts": [...], "summary", "duration_ms"}.
+    """
+    if not command or not command.strip():
+        raise ValueError("Command is required.")
+    if not servers:
+        raise ValueError("No servers selected.")
+    if len(servers) > MAX_HOSTS:
+        raise ValueError(f"At most {MAX_HOSTS} servers per fan-out.")
+    max_parallel = max(1, min(int(max_parallel or MAX_PARALLEL), MAX_PARALLEL_LIMIT, len(servers)))
+    timeout = max(1.0, min(float(timeout or DEFAULT_TIMEOUT), MAX_TIMEOUT))
+    cancel_event = cancel_event or threading.Event()
+
+    def emit(event: Dict):
+        if on_event:
+            try:
+                on_event(event)
+            except Exception as e:
+                logger.debug(f"Fan-out event handler failed: {e}")
+
+    def work(server: Dict) -> Dict:
+        result = _run_host(server, command, timeout, emit, cancel_event)
+        emit({"type": "host_done", **{k: v for k, v in result.items() if k not in ("stdout", "stderr")}})
+        return result
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="ssh-fanout") as pool:
+        results = list(pool.map(work, servers))
+
+    summary = {"total": len(results), **{status: 0 for status in STATUSES}}
+    for r in results:
+        summary[r["status"]] += 1
+    duration_ms = int((time.time() - started) * 1000)
+    logger.info(f"Fan-out to {len(results)} servers finished in {duration_ms}ms: {summary}")
+    return {"command": command, "hosts": results, "summary": summary, "duration_ms": duration_ms}
+
+
+def format_result(result: Dict, max_chars: int = TOOL_OUTPUT_CHARS) -> str:
+    """Compact text version of a fan-out result for the LLM."""
+    s = result["summary"]
+    counts = ", ".join(f"{s[k]} {k}" for k in STATUSES if s[k])
+    lines = [f"Ran on {s['total']} servers in {result['duration_ms']}ms ({counts})."]
+    for r in result["hosts"]:
+        head = f"### {r['name']} ({r['host']}) - {r['status']}"
+        if r["exit_status"] is not None:
+            head += f", exit {r['exit_status']}"
+        lines.append(f"\n{head}, {r['duration_ms']}ms")
+        if r["error"]:
+            lines.append(f"Error: {r['error']}")
+        text = r["stdout"]
+        if r["stderr"]:
+            text += f"\nError Output:\n{r['stderr']}"
+        text = text.strip()
+        if len(text) > max_chars:
+            # The end of the output usually carries the verdict; keep that part.
+            text = f"[... {len(text) - max_chars} chars omitted]\n" + text[-max_chars:]
+        if r.get("output_id"):
+            lines.append(f"(Full output: output_id {r['output_id']}, readable with read_command_output.)")
+        if text:
+            lines.append(text)
+    return "\n".join(lines)
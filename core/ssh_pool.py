@@ -0,0 +1,372 @@
+"""
+Pooled SSH connections for the remote-server tools.
+
+Opening an SSH session costs a TCP connect, a key exchange, user auth and
+(for key auth) parsing the private key. The pool keeps one authenticated
+paramiko transport per (host, port, user, credential) and opens a fresh
+channel on it for every command, so an agent running ten commands on a
+server pays for one handshake. Up to CHANNELS_PER_CONNECTION commands share
+a transport at the same time (OpenSSH allows 10 sessions by default).
+
+A pooled connection is checked before reuse (transport alive, plus an
+SSH_MSG_IGNORE probe once it has sat idle), kept alive with SSH keepalives
+while pooled, and closed after IDLE_TIMEOUT seconds without use. Parsed
+private keys are cached by content hash.
+
+`stream` hands output to a callback as it arrives and stops the command at
+a wall-clock deadline; `run` collects it into strings.
+"""
+import codecs
+import hashlib
+import io
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+import paramiko
+
+from core.timers import timers
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 300.0           # close connections unused for this long
+KEEPALIVE_INTERVAL = 30        # seconds between SSH keepalives on pooled transports
+PROBE_AFTER_IDLE = 15.0        # probe a connection idle this long before reusing it
+CONNECT_TIMEOUT = 10
+CHANNELS_PER_CONNECTION = 8
+MAX_CONNECTIONS = 64
+KEY_CACHE_SIZE = 32
+READ_CHUNK = 32768
+POLL_INTERVAL = 0.2            # max wait for output before re-checking deadline and cancel
+REAP_KEY = "ssh_pool:reap"
+
+_KEY_CLASSES = [getattr(paramiko, name) for name in ("RSAKey", "Ed25519Key", "ECDSAKey", "DSSKey")
+                if hasattr(paramiko, name)]
+
+
+class SSHKeyError(ValueError):
+    pass
+
+
+def _fingerprint(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
+
+
+class _Connection:
+    __slots__ = ("key", "client", "transport", "channels", "active", "created_at", "last_used", "commands")
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.transport = client.get_transport()
+        self.channels = threading.BoundedSemaphore(CHANNELS_PER_CONNECTION)
+        self.active = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.commands = 0
+
+    def alive(self) -> bool:
+        return self.transport is not None and self.transport.is_active() and self.transport.is_authenticated()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHPool:
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT, max_connections: int = MAX_CONNECTIONS,
+                 timer_service=None):
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self._timers = timer_service or timers
+        self._lock = threading.Lock()
+        self._conns: Dict[tuple, _Connection] = {}
+        self._connecting: Dict[tuple, list] = {}  # key -> [connect lock, callers using it]
+        self._keys: "OrderedDict[str, paramiko.PKey]" = OrderedDict()
+        self._reap_scheduled = False
+        self._stats = {"connects": 0, "reused": 0, "stale": 0, "expired": 0, "commands": 0,
+                       "key_cache_hits": 0, "key_parses": 0}
+
+    # ----------- KEYS -----------
+
+    def load_key(self, key_content: str) -> paramiko.PKey:
+        """Parse a PEM/OpenSSH private key, trying each key type; cached by content hash."""
+        digest = _fingerprint(key_content)
+        with self._lock:
+            pkey = self._keys.get(digest)
+            if pkey is not None:
+                self._keys.move_to_end(digest)
+                self._stats["key_cache_hits"] += 1
+                return pkey
+        pkey = None
+        for key_class in _KEY_CLASSES:
+            try:
+                pkey = key_class.from_private_key(io.StringIO(key_content))
+                break
+            except Exception:
+                continue
+        if pkey is None:
+            raise SSHKeyError("Could not parse PEM key. Ensure it is a valid OpenSSH private key.")
+        with self._lock:
+            self._stats["key_parses"] += 1
+            self._keys[digest] = pkey
+            while len(self._keys) > KEY_CACHE_SIZE:
+                self._keys.popitem(last=False)
+        return pkey
+
+    # ----------- CONNECTIONS -----------
+
+    @staticmethod
+    def _pool_key(host: str, port: int, user: str, password: str, key_content: str) -> tuple:
+        # The credential is part of the key so an edited password never reuses the old session.
+        return (host, int(port), user, _fingerprint(key_content or password or ""))
+
+    def _connect(self, key: tuple, host: str, port: int, user: str, password: str, key_content: str,
+                 timeout: float) -> _Connection:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        auth = {"pkey": self.load_key(key_content)} if key_content else {"password": password}
+        client.connect(hostname=host, port=port, username=user, timeout=timeout,
+                       allow_agent=False, look_for_keys=False, **auth)
+        client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+        conn = _Connection(key, client)
+        with self._lock:
+            self._stats["connects"] += 1
+        logger.debug(f"SSH connected to {user}@{host}:{port}", extra={"rate_key": "ssh_pool.connect"})
+        return conn
+
+    def _healthy(self, conn: _Connection) -> bool:
+        if not conn.alive():
+            return False
+        if time.monotonic() - conn.last_used > PROBE_AFTER_IDLE:
+            try:
+                conn.transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def _acquire(self, host: str, port: int, user: str, password: str, key_content: str,
+                 timeout: float) -> _Connection:
+        """A healthy pooled connection for this target, connecting if needed. Counts one active user."""
+        key = self._pool_key(host, port, user, password, key_content)
+        with self._lock:
+            gate = self._connecting.setdefault(key, [threading.Lock(), 0])
+            gate[1] += 1
+        # One connect per target at a time; concurrent callers wait and then share it.
+        try:
+            with gate[0]:
+                with self._lock:
+                    conn = self._conns.get(key)
+                if conn is not None and not self._healthy(conn):
+                    self._discard(conn, "stale")
+                    conn = None
+                if conn is None:
+                    conn = self._connect(key, host, port, user, password, key_content, timeout)
+                    with self._lock:
+                        self._conns[key] = conn
+                        self._evict_over_limit()
+                else:
+                    with self._lock:
+                        self._stats["reused"] += 1
+                with self._lock:
+                    conn.active += 1
+                    conn.last_used = time.monotonic()
+        finally:
+            with self._lock:
+                gate[1] -= 1
+                if key not in self._conns:
+                    self._drop_gate(key)
+        self._schedule_reap()
+        return conn
+
+    def _drop_gate(self, key: tuple):
+        # Called under self._lock: forget the connect lock of a target nobody is connecting to.
+        gate = self._connecting.get(key)
+        if gate is not None and not gate[1]:
+            del self._connecting[key]
+
+    def _release(self, conn: _Connection):
+        with self._lock:
+            conn.active -= 1
+            conn.last_used = time.monotonic()
+
+    def _discard(self, conn: _Connection, reason: str):
+        with self._lock:
+            if self._conns.get(conn.key) is conn:
+                del self._conns[conn.key]
+                self._drop_gate(conn.key)
+            self._stats[reason] = self._stats.get(reason, 0) + 1
+        conn.close()
+
+    def _evict_over_limit(self):
+        # Called under self._lock: close the least recently used idle connections.
+        idle = sorted((c for c in self._conns.values() if not c.active), key=lambda c: c.last_used)
+        while len(self._conns) > self.max_connections and idle:
+            victim = idle.pop(0)
+            del self._conns[victim.key]
+            self._drop_gate(victim.key)
+            self._stats["expired"] += 1
+            threading.Thread(target=victim.close, daemon=True).start()
+
+    @contextmanager
+    def session(self, host: str, port: int = 22, user: str = "ubuntu", password: str = "",
+                key_content: str = "", timeout: float = CONNECT_TIMEOUT):
+        """
+        An open paramiko Channel on a pooled connection to the target; exec
+        one command on it. A reused connection that turns out to be dead is
+        replaced once.
+        """
+        for attempt in range(2):
+            conn = self._acquire(host, port, user, password, key_content, timeout)
+            if not conn.channels.acquire(timeout=timeout):
+                self._release(conn)
+                raise TimeoutError(f"All {CHANNELS_PER_CONNECTION} SSH channels to {host} are busy.")
+            try:
+                channel = conn.transport.open_session(timeout=timeout)
+                break
+            except (paramiko.SSHException, EOFError, OSError):
+                conn.channels.release()
+                self._release(conn)
+                reused = conn.commands > 0
+                # The server dropped a pooled connection since the health check.
+                self._discard(conn, "stale")
+                if attempt or not reused:
+                    raise
+        with self._lock:
+            conn.commands += 1
+            self._stats["commands"] += 1
+        try:
+            yield channel
+        finally:
+            channel.close()
+            conn.channels.release()
+            self._release(conn)
+
+    def stream(self, host: str, command: str, on_output: Callable[[str, str], None], port: int = 22,
+               user: str = "ubuntu", password: str = "", key_content: str = "", timeout: float = 30,
+               cancel_event: Optional[threading.Event] = None) -> Optional[int]:
+        """
+        Run one command on the target, calling on_output("stdout" | "stderr", text)
+        for each chunk as it arrives. `timeout` is a wall-clock limit for the
+        whole command. Returns the exit status, or None if the command was cut
+        off by the timeout or cancel_event (its channel is closed; the pooled
+        connection stays usable).
+        """
+        deadline = time.monotonic() + timeout
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+
+        def emit(name: str, data: bytes, final: bool = False):
+            text = decoders[name].decode(data, final)
+            if text:
+                on_output(name, text)
+
+        def pump(channel) -> bool:
+            got = False
+            if channel.recv_ready():
+                emit("stdout", channel.recv(READ_CHUNK))
+                got = True
+            if channel.recv_stderr_ready():
+                emit("stderr", channel.recv_stderr(READ_CHUNK))
+                got = True
+            return got
+
+        def stopped() -> bool:
+            return time.monotonic() >= deadline or (cancel_event is not None and cancel_event.is_set())
+
+        def wait(channel):
+            select.select([channel], [], [], min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+        with self.session(host, port, user, password, key_content, min(timeout, CONNECT_TIMEOUT)) as channel:
+            channel.exec_command(command)
+            # stopped() is checked on every pass: a command that never pauses its
+            # output must still hit the deadline and honor cancel_event.
+            while not (channel.exit_status_ready() or channel.closed):
+                if stopped():
+                    return None
+                if not pump(channel):
+                    wait(channel)
+            # The exit status can arrive ahead of the last output, and a background
+            # child may still hold the pipes: keep reading until the server sends EOF.
+            while not stopped():
+                eof = channel.eof_received or channel.closed  # read before pumping: EOF follows the last data
+                if pump(channel):
+                    continue
+                if eof:
+                    break
+                wait(channel)
+            for name in decoders:
+                emit(name, b"", final=True)
+            return channel.recv_exit_status()
+
+    def run(self, host: str, command: str, port: int = 22, user: str = "ubuntu", password: str = "",
+            key_content: str = "", timeout: float = 30) -> Tuple[int, str, str]:
+        """Run one command on the target. Returns (exit_status, stdout, stderr); TimeoutError after `timeout`s."""
+        output = {"stdout": [], "stderr": []}
+        status = self.stream(host, command, lambda name, text: output[name].append(text), port=port, user=user,
+                             password=password, key_content=key_content, timeout=timeout)
+        if status is None:
+            raise TimeoutError(f"Command did not finish within {timeout}s on {host}.")
+        return status, "".join(output["stdout"]), "".join(output["stderr"])
+
+    # ----------- EXPIRY -----------
+
+    def _schedule_reap(self):
+        with self._lock:
+            if self._reap_scheduled:
+                return
+            self._reap_scheduled = True
+        self._timers.schedule(time.time() + min(60.0, self.idle_timeout), REAP_KEY, self.reap)
+
+    def reap(self) -> int:
+        """Close connections idle longer than idle_timeout (or dead). Re-arms itself while any remain."""
+        now = time.monotonic()
+        with self._lock:
+            self._reap_scheduled = False
+            expired = [c for c in self._conns.values()
+                       if not c.active and (now - c.last_used > self.idle_timeout or not c.alive())]
+            for conn in expired:
+                del self._conns[conn.key]
+                self._drop_gate(conn.key)
+                self._stats["expired"] += 1
+            remaining = len(self._conns)
+        for conn in expired:
+            conn.close()
+        if remaining:
+            self._schedule_reap()
+        return len(expired)
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+            for key in list(self._connecting):
+                self._drop_gate(key)
+        for conn in conns:
+            conn.close()
+        self._timers.cancel(REAP_KEY)
+        with self._lock:
+            self._reap_scheduled = False
+
+    def get_metrics(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "connections": [
+                    {"host": c.key[0], "port": c.key[1], "user": c.key[2], "active": c.active,
+                     "commands": c.commands, "idle_s": round(now - c.last_used, 1)}
+                    for c in self._conns.values()
+                ],
+                "cached_keys": len(self._keys),
+                "idle_timeout": self.idle_timeout,
+                **self._stats,
+            }
+
+
+# Singleton
+ssh_pool = SSHPool()
@@ -1,62 +1,302 @@
+"""
+Swarm orchestration: a manager bot splits a task into subtasks, worker bots
+solve them concurrently, and the manager reduces their outputs to one answer.
+
+  1. Plan   - the manager returns a JSON list of {id, worker, task}. A
+              subtask naming an unknown worker goes to the workers in turn.
+  2. Map    - subtasks run on a thread pool, `max_parallel` at a time, each
+              with its worker's model and tool settings.
+  3. Reduce - with more than REDUCE_FANIN results the manager first condenses
+              them in groups, then synthesizes the group summaries.
+
+Every LLM call is charged to one SwarmBudget (`max_tokens`, `max_cost` in
+USD), tool-loop completions included: WolfEngine.chat returns a response
+whose usage covers the whole call. Once it runs out no new subtask starts; the manager still reduces
+what is there, so the final answer can overshoot the budget by that step.
+Engines are created on first use and reused across swarms.
+
+Every call carries the swarm task as WolfEngine's shared_context, so all
+calls of a swarm open with the same prompt prefix for provider caching;
+each worker result reports its cached vs. uncached prompt tokens.
+"""
+import json
 import logging
-from typing import List, Dict, Any
-from core.llm_engine import WolfEngine
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from core.tracing import wrap
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_PARALLEL = 4
+MAX_PARALLEL_LIMIT = 16
+MAX_SUBTASKS = 24
+REDUCE_FANIN = 6  # worker outputs the manager condenses in one reduce call
+
+PLAN_SYSTEM_PROMPT = "You are the manager of a team of AI workers. You ONLY output valid JSON arrays."
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class SwarmBudget:
+    """Token and cost allowance shared by every call of one swarm run (None = unlimited)."""
+
+    def __init__(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def charge(self, model: str, response) -> Dict:
+        """Add a response's usage; returns its usage report."""
+        from core.llm_engine import estimate_cost, usage_report
+        report = usage_report(response)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += report["prompt_tokens"]
+            self.cached_prompt_tokens += report["cached_prompt_tokens"]
+            self.completion_tokens += report["completion_tokens"]
+            self.cost += estimate_cost(model, report["prompt_tokens"], report["completion_tokens"])
+        return report
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            if self.max_tokens is not None and self.prompt_tokens + self.completion_tokens >= self.max_tokens:
+                return True
+            return self.max_cost is not None and self.cost >= self.max_cost
+
+    def check(self):
+        if self.exhausted:
+            raise BudgetExceeded("Swarm budget exhausted.")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+                "estimated_cost": round(self.cost, 6),
+                "max_tokens": self.max_tokens,
+                "max_cost": self.max_cost,
+            }
+
+
+def _parse_plan(text: str, worker_ids: List[str]) -> List[Dict[str, Any]]:
+    """Manager output -> list of {id, worker, task}, assigning unknown workers in turn."""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+
+    plan = json.loads(text)
+    if isinstance(plan, dict):
+        plan = plan.get("subtasks") or plan.get("tasks") or []
+    if not isinstance(plan, list):
+        raise ValueError("Plan is not a JSON array.")
+
+    subtasks = []
+    unassigned = 0
+    for item in plan:
+        if isinstance(item, str):
+            item = {"task": item}
+        if not isinstance(item, dict) or not item.get("task"):
+            continue
+        worker = item.get("worker") or item.get("worker_id") or item.get("agent_id")
+        if worker not in worker_ids:
+            worker = worker_ids[unassigned % len(worker_ids)]
+            unassigned += 1
+        subtasks.append({"id": str(item.get("id") or f"subtask_{len(subtasks) + 1}"),
+                         "worker": worker, "task": str(item["task"])})
+        if len(subtasks) >= MAX_SUBTASKS:
+            break
+    if not subtasks:
+        raise ValueError("Plan has no subtasks.")
+    return subtasks
+
+
 class SwarmOrchestrator:
     """
     Manages a crew of agents (Manager -> Workers) to decompose and solve complex tasks.
     """
-    def __init__(self):
-        self.llm = WolfEngine("default")
 
-    def run_swarm(self, task: str, manager_bot_id: str, worker_bot_ids: List[str], workspace_id: str) -> Dict[str, Any]:
+    def run_swarm(self, task: str, manager_bot_id: str, worker_bot_ids: List[str], workspace_id: str,
+                  workers: List[Dict] = None, max_parallel: int = DEFAULT_MAX_PARALLEL,
+                  max_tokens: int = None, max_cost: float = None, user_id: str = None) -> Dict[str, Any]:
         """
         Executes a multi-agent swarm task.
         1. Manager analyzes the task and decomposes it for workers.
-        2. Workers execute their sub-tasks in parallel (simulated or actual).
-        3. Manager synthesizes the final output.
+        2. Workers execute their sub-tasks in parallel.
+        3. Manager synthesizes the final output (map-reduce for many results).
+
+        `workers` optionally overrides settings per worker bot:
+        [{"bot_id": ..., "model": ..., "tools": [tool names]}].
         """
+        from core.bot_manager import get_bots
+
         logger.info(f"Swarm Initiated: Manager {manager_bot_id} with {len(worker_bot_ids)} workers for task: '{task}'")
-        
-        # In a fully realized implementation, we would query the DB for the bot system prompts.
-        # Here we mock the orchestration flow:
-        
-        # Step 1: Manager Decomposition (Mocked for now)
-        decomposition_prompt = f"You are a Manager Agent. Break down this task for your {len(worker_bot_ids)} workers: '{task}'"
-        
-        # We would actually call self.llm.chat(...) here to get a structured JSON plan from the manager.
-        # But to keep the API fast for the MVP, we simulate the orchestration:
-        plan = [f"Worker {bot_id} handles part of the task" for bot_id in worker_bot_ids]
-        
+        started = time.monotonic()
+        max_parallel = max(1, min(int(max_parallel), MAX_PARALLEL_LIMIT))
+        budget = SwarmBudget(max_tokens, max_cost)
+
+        all_bots = get_bots(user_id=user_id)
+        manager = all_bots.get(manager_bot_id)
+        if not manager:
+            raise ValueError(f"Manager bot {manager_bot_id} not found.")
+        overrides = {w["bot_id"]: w for w in (workers or []) if w.get("bot_id")}
+        profiles = {}
+        for bot_id in worker_bot_ids:
+            if bot_id in all_bots:
+                profiles[bot_id] = dict(all_bots[bot_id], **{
+                    k: v for k, v in overrides.get(bot_id, {}).items() if k in ("model", "tools") and v is not None
+                })
+        if not profiles:
+            raise ValueError("No valid worker bots provided.")
+
+        # Step 1: Manager Decomposition
+        plan = self._plan(task, manager, manager_bot_id, profiles, budget, user_id)
+
         # Step 2: Worker Execution
-        worker_results = []
-        for i, bot_id in enumerate(worker_bot_ids):
-            worker_task = plan[i] if i < len(plan) else "Assist with the task"
-            logger.info(f"Worker {bot_id} executing: {worker_task}")
-            # Simulated worker result
-            worker_results.append({
-                "bot_id": bot_id,
-                "task": worker_task,
-                "output": f"Completed sub-task: {worker_task}. Findings: Everything looks good from my side."
-            })
-            
+        worker_results = self._map(task, plan, profiles, budget, max_parallel, user_id)
+
         # Step 3: Manager Synthesis
-        reports = "\\n".join([f"Worker {r['bot_id']}: {r['output']}" for r in worker_results])
-        synthesis_prompt = f"Synthesize these reports into a final answer for the user's task '{task}':\\n{reports}"
-        
-        # We simulate the manager's final polish:
-        final_answer = f"The Swarm has completed the task: '{task}'.\\n\\nHere is the synthesized report from the workers:\\n"
-        for r in worker_results:
-            final_answer += f"- **Worker {r['bot_id']}** reported: {r['output']}\\n"
-            
-        return {
-            "status": "success",
+        completed = [r for r in worker_results if r["status"] == "ok"]
+        if completed:
+            final_answer = self._reduce(task, manager, manager_bot_id, completed, budget, user_id)
+        else:
+            final_answer = "No worker completed its subtask, so there is nothing to synthesize."
+
+        usage = budget.snapshot()
+        result = {
+            "status": "success" if completed else "failed",
             "task": task,
             "manager_bot_id": manager_bot_id,
+            "plan": plan,
             "worker_results": worker_results,
-            "final_answer": final_answer
+            "final_answer": final_answer,
+            "usage": usage,
+            "budget_exhausted": budget.exhausted,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
         }
+        try:
+            from core.bus import bus
+            bus.publish("swarm_completed", {"task": task[:200], "workspace_id": workspace_id,
+                                            "workers": len(profiles), "status": result["status"], **usage})
+        except Exception:
+            pass
+        return result
+
+    # ----------- LLM CALLS -----------
+
+    @staticmethod
+    def _call(task: str, profile: Dict, bot_id: str, prompt: str, system_prompt: str, budget: SwarmBudget,
+              user_id: str = None, tool_names: List[str] = None, enforce: bool = True):
+        """One LLM call of the swarm for `task`, charged to its budget. Returns (reply, usage_report)."""
+        from core.task_executor import task_executor
+        if enforce:
+            budget.check()
+        engine = task_executor.engine_for(profile, user_id)
+        response = engine.chat(messages=[{"role": "user", "content": prompt}], system_prompt=system_prompt,
+                               bot_id=bot_id, tool_names=tool_names, shared_context=f'Swarm task:\n"{task}"')
+        report = budget.charge(profile.get("model"), response)
+        return response.choices[0].message.content or "", report
+
+    def _plan(self, task: str, manager: Dict, manager_bot_id: str, profiles: Dict[str, Dict],
+              budget: SwarmBudget, user_id: str) -> List[Dict]:
+        roster = "\n".join(f"- {p['name']} (ID: {bot_id}): {p['prompt'][:100]}..." for bot_id, p in profiles.items())
+        prompt = f"""
+Break down this task into independent subtasks for your workers:
+"{task}"
+
+Your workers:
+{roster}
+
+Subtasks run in parallel, so each one must make sense on its own. Use at most
+{MAX_SUBTASKS} subtasks. Output a JSON array, NO OTHER TEXT:
+[
+  {{"id": "subtask_1", "worker": "the-worker-id", "task": "The specific instruction"}}
+]
+"""
+        try:
+            text, _ = self._call(task, manager, manager_bot_id, prompt, PLAN_SYSTEM_PROMPT, budget, user_id,
+                                 tool_names=[])
+            return _parse_plan(text, list(profiles))
+        except Exception as e:
+            # Without a usable plan every worker gets the whole task.
+            logger.warning(f"Swarm manager failed to plan ({e}); giving each worker the full task.")
+            return [{"id": f"subtask_{i + 1}", "worker": bot_id, "task": task} for i, bot_id in enumerate(profiles)]
+
+    def _run_worker(self, task: str, subtask: Dict, profile: Dict, budget: SwarmBudget, user_id: str) -> Dict:
+        logger.info(f"Worker {subtask['worker']} executing: {subtask['task']}")
+        started = time.monotonic()
+        result = {"id": subtask["id"], "bot_id": subtask["worker"], "task": subtask["task"],
+                  "model": profile.get("model")}
+        try:
+            prompt = f"Your manager assigned you this subtask:\n\n{subtask['task']}\n\nComplete it and report your findings."
+            result["output"], result["usage"] = self._call(task, profile, subtask["worker"], prompt, profile["prompt"],
+                                                           budget, user_id, tool_names=profile.get("tools"))
+            result["status"] = "ok"
+        except Exception as e:
+            logger.warning(f"Swarm worker {subtask['worker']} failed: {e}")
+            result["output"] = ""
+            result["status"] = "skipped" if isinstance(e, BudgetExceeded) else "error"
+            result["error"] = str(e)
+        result["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+    def _map(self, task: str, plan: List[Dict], profiles: Dict[str, Dict], budget: SwarmBudget, max_parallel: int,
+             user_id: str) -> List[Dict]:
+        """Run every subtask concurrently; results come back in plan order."""
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(plan)), thread_name_prefix="SwarmWorker") as pool:
+            futures = {
+                pool.submit(wrap(self._run_worker), task, subtask, profiles[subtask["worker"]], budget,
+                            user_id): subtask["id"]
+                for subtask in plan
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return [results[subtask["id"]] for subtask in plan]
+
+    def _reduce(self, task: str, manager: Dict, manager_bot_id: str, completed: List[Dict],
+                budget: SwarmBudget, user_id: str) -> str:
+        """Synthesize worker outputs, condensing them in groups of REDUCE_FANIN first when there are many."""
+        def report(items):
+            return "\n\n".join(f"Worker {r['bot_id']} ({r['task']}):\n{r['output']}" for r in items)
+
+        reports = [report(completed)]
+        if len(completed) > REDUCE_FANIN:
+            groups = [completed[i:i + REDUCE_FANIN] for i in range(0, len(completed), REDUCE_FANIN)]
+            prompt = "Condense these worker reports into one summary that keeps every concrete finding:\n\n{}"
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="SwarmReduce") as pool:
+                futures = [pool.submit(wrap(self._call), task, manager, manager_bot_id, prompt.format(report(g)),
+                                       manager["prompt"], budget, user_id, [], False) for g in groups]
+                reports = []
+                for group, future in zip(groups, futures):
+                    try:
+                        reports.append(future.result()[0])
+                    except Exception as e:
+                        logger.warning(f"Swarm reduce step failed ({e}); passing its reports through.")
+                        reports.append(report(group))
+
+        synthesis_prompt = (f"Synthesize these reports into a final answer for the user's task '{task}':\n\n"
+                            + "\n\n---\n\n".join(reports))
+        try:
+            text, _ = self._call(task, manager, manager_bot_id, synthesis_prompt, manager["prompt"], budget,
+                                 user_id, [], enforce=False)
+            return text
+        except Exception as e:
+            logger.warning(f"Swarm synthesis failed: {e}")
+            return f"The manager could not synthesize a final answer ({e}). Worker reports:\n\n" + "\n\n".join(reports)
 
 swarm = SwarmOrchestrator()
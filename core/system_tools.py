@@ -1,5 +1,5 @@
 import logging
-from core.tools import run_terminal_command, run_remote_ssh_command, web_search, read_document, simulate_gui, web_browser
+from core.tools import run_terminal_command, run_remote_ssh_command, run_remote_ssh_fanout, web_search, read_document, simulate_gui, web_browser
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +12,7 @@ class SystemTools:
         self.available_tools = {
             "run_terminal_command": run_terminal_command,
             "run_remote_ssh_command": run_remote_ssh_command,
+            "run_remote_ssh_fanout": run_remote_ssh_fanout,
             "web_search": web_search,
             "read_document": read_document,
             "simulate_gui": simulate_gui,
@@ -0,0 +1,223 @@
+"""
+Bounded execution of scheduled tasks.
+
+Scheduled fires and manual "run now" triggers are queued here and run by a
+fixed pool of worker threads. A queued job starts only when all of its
+limits have room:
+
+  - `max_instances` of the same task (per task, default 1)
+  - `per_workspace` jobs of one workspace
+  - the provider limit of the bot's model (PROVIDER_LIMITS, else
+    `per_provider`), so a burst of cron fires at the top of the hour does
+    not overrun one provider's rate limit
+
+Jobs that cannot start yet wait without blocking jobs of other tasks,
+workspaces or providers. With `coalesce` (the default) a task has at most
+one waiting job: further fires while one is queued merge into it.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_LIMITS = {"ollama": 1}  # local models share one machine
+ENGINE_CACHE_SIZE = 32
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def provider_for_model(model: str) -> str:
+    """Rate-limit bucket of a model name, matching WolfEngine's routing."""
+    model = (model or "").lower()
+    if model.startswith(("nvidia/", "meta/")):
+        return "nvidia"
+    if model.startswith(("gpt", "openai/")):
+        return "openai"
+    if model.startswith(("claude", "anthropic/")):
+        return "anthropic"
+    if model.startswith("gemini"):
+        return "google"
+    if "/" in model:
+        return model.split("/", 1)[0]
+    return model or "default"
+
+
+class _Job:
+    __slots__ = ("task_id", "task", "workspace_id", "provider", "trigger", "enqueued_at")
+
+    def __init__(self, task: Dict, provider: Optional[str], trigger: str):
+        self.task_id = task["id"]
+        self.task = task
+        self.workspace_id = task.get("ws_id")
+        self.provider = provider
+        self.trigger = trigger
+        self.enqueued_at = time.monotonic()
+
+
+class TaskExecutor:
+    def __init__(self, max_workers: int = 4, per_workspace: int = 2, per_provider: int = 2,
+                 max_queue: int = 500):
+        self.max_workers = max_workers
+        self.per_workspace = per_workspace
+        self.per_provider = per_provider
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._running_per_task: Dict[str, int] = {}
+        self._running_per_ws: Dict[str, int] = {}
+        self._running_per_provider: Dict[str, int] = {}
+        self._workers = []
+        self._engines: "OrderedDict[tuple, object]" = OrderedDict()
+        self._engines_lock = threading.Lock()
+        self._stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "started": 0,
+                       "completed": 0, "failed": 0, "wait_ms_total": 0.0}
+
+    # ----------- SUBMISSION -----------
+
+    def submit(self, task: Dict, trigger: str = "schedule") -> bool:
+        """
+        Queue a run of `task` (a scheduled_tasks row). Returns False when the
+        fire was merged into a run of the same task that is already waiting.
+        Raises QueueFullError when the queue is at capacity.
+        """
+        provider = self._provider(task)
+        with self._cond:
+            if task.get("coalesce", 1) and any(job.task_id == task["id"] for job in self._queue):
+                self._stats["coalesced"] += 1
+                return False
+            if len(self._queue) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"Task queue is full ({self.max_queue} runs waiting).")
+            self._queue.append(_Job(task, provider, trigger))
+            self._stats["submitted"] += 1
+            self._ensure_workers()
+            self._cond.notify_all()
+        return True
+
+    @staticmethod
+    def _provider(task: Dict) -> Optional[str]:
+        """Only bot prompts call an LLM directly; flow tasks just enqueue a flow run."""
+        if task.get("action_type") != "bot":
+            return None
+        from core.registry import registry
+        bot = registry.bot(task.get("ws_id"), task.get("action_id"))
+        return provider_for_model(bot.get("model")) if bot else None
+
+    def _ensure_workers(self):
+        # Called under self._cond
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            w = threading.Thread(target=self._worker_loop, name=f"TaskWorker-{len(self._workers)}", daemon=True)
+            w.start()
+            self._workers.append(w)
+
+    # ----------- WORKERS -----------
+
+    def _provider_limit(self, provider: str) -> int:
+        return PROVIDER_LIMITS.get(provider, self.per_provider)
+
+    def _can_start(self, job: _Job) -> bool:
+        max_instances = max(1, int(job.task.get("max_instances") or 1))
+        if self._running_per_task.get(job.task_id, 0) >= max_instances:
+            return False
+        if self._running_per_ws.get(job.workspace_id, 0) >= self.per_workspace:
+            return False
+        if job.provider and self._running_per_provider.get(job.provider, 0) >= self._provider_limit(job.provider):
+            return False
+        return True
+
+    @staticmethod
+    def _adjust(counts: Dict[str, int], key: Optional[str], delta: int):
+        if key is None:
+            return
+        counts[key] = counts.get(key, 0) + delta
+        if not counts[key]:
+            del counts[key]
+
+    def _next_job(self) -> _Job:
+        """Block until a queued job whose limits all have room is available."""
+        with self._cond:
+            while True:
+                for job in self._queue:
+                    if self._can_start(job):
+                        self._queue.remove(job)
+                        self._adjust(self._running_per_task, job.task_id, 1)
+                        self._adjust(self._running_per_ws, job.workspace_id, 1)
+                        self._adjust(self._running_per_provider, job.provider, 1)
+                        self._stats["started"] += 1
+                        self._stats["wait_ms_total"] += (time.monotonic() - job.enqueued_at) * 1000
+                        return job
+                self._cond.wait()
+
+    def _worker_loop(self):
+        from core.task_scheduler import execute_task
+        from core.tracing import span
+        while True:
+            job = self._next_job()
+            ok = False
+            try:
+                with span("task.run", root=True, task_id=job.task_id, trigger=job.trigger):
+                    ok = execute_task(job.task)
+            except Exception as e:
+                logger.error(f"Scheduled task {job.task_id} crashed: {e}")
+            finally:
+                with self._cond:
+                    self._adjust(self._running_per_task, job.task_id, -1)
+                    self._adjust(self._running_per_ws, job.workspace_id, -1)
+                    self._adjust(self._running_per_provider, job.provider, -1)
+                    self._stats["completed" if ok else "failed"] += 1
+                    self._cond.notify_all()
+
+    def engine_for(self, bot: Dict, user_id: str = None):
+        """A WolfEngine per bot configuration, reused across runs (construction may probe Ollama)."""
+        from core.llm_engine import WolfEngine
+        key = (bot.get("model"), tuple(bot.get("fallback_models") or ()), user_id)
+        with self._engines_lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+        engine = WolfEngine(bot["model"], fallback_models=bot.get("fallback_models", []), user_id=user_id)
+        with self._engines_lock:
+            self._engines[key] = engine
+            while len(self._engines) > ENGINE_CACHE_SIZE:
+                self._engines.popitem(last=False)
+        return engine
+
+    # ----------- INTROSPECTION -----------
+
+    def get_metrics(self) -> Dict:
+        now = time.monotonic()
+        with self._cond:
+            started = self._stats["started"]
+            return {
+                "queued": len(self._queue),
+                "running": sum(self._running_per_task.values()),
+                "running_per_task": dict(self._running_per_task),
+                "running_per_workspace": dict(self._running_per_ws),
+                "running_per_provider": dict(self._running_per_provider),
+                "max_workers": self.max_workers,
+                "per_workspace_limit": self.per_workspace,
+                "per_provider_limit": self.per_provider,
+                "provider_limits": dict(PROVIDER_LIMITS),
+                "max_queue": self.max_queue,
+                "submitted": self._stats["submitted"],
+                "coalesced": self._stats["coalesced"],
+                "rejected": self._stats["rejected"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "avg_queue_wait_ms": round(self._stats["wait_ms_total"] / started, 1) if started else 0.0,
+                "waiting": [
+                    {"task_id": job.task_id, "trigger": job.trigger, "provider": job.provider,
+                     "waited_ms": round((now - job.enqueued_at) * 1000, 1)}
+                    for job in list(self._queue)[:20]
+                ],
+            }
+
+# Singleton
+task_executor = TaskExecutor()
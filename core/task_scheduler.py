@@ -1,109 +1,347 @@
 """
 Scheduler — cron-like recurring task execution engine.
-Reads scheduled_tasks from local_db and fires them when due.
+
+Every enabled task in `scheduled_tasks` holds one entry on the shared
+timer heap (core.timers) keyed `scheduled_task:{id}`, so the timer thread
+sleeps exactly until the next due task and thousands of schedules cost
+nothing between fires. local_db calls `refresh()` after any task write,
+which re-arms (or drops) that task's timer at once.
+
+The next fire time is persisted in `next_run`. A fire that arrives more
+than MISFIRE_GRACE seconds late (e.g. the app was closed) follows the
+task's misfire policy: 'skip' drops the missed runs, 'catch_up' runs once
+for all of them. Either way the schedule continues from now.
+
+The timer callback only re-arms and enqueues; one dispatcher thread
+persists next_run and hands due runs to core.task_executor, which applies
+the concurrency limits. The same thread compacts task_results every
+COMPACT_INTERVAL seconds, keeping each task's newest `keep_results` runs
+from the last `keep_days` days and folding older ones into per-day
+summaries.
 """
+import logging
+import queue
 import threading
 import time
-import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from core.cron import IntervalSchedule, parse_schedule
+from core.timers import timers
 
 logger = logging.getLogger(__name__)
 
+MISFIRE_SKIP = "skip"
+MISFIRE_CATCH_UP = "catch_up"
+MISFIRE_POLICIES = (MISFIRE_SKIP, MISFIRE_CATCH_UP)
+MISFIRE_GRACE = 60.0  # seconds a fire may be late and still count as on time
+
+ACTION_TYPES = ("bot", "flow")
+MAX_INSTANCES_LIMIT = 10
+
+DEFAULT_KEEP_RESULTS = 200
+DEFAULT_KEEP_DAYS = 30
+COMPACT_INTERVAL = 3600.0
+COMPACT_KEY = "scheduled_tasks:compact"
+
+
+def validate_task(cron_expr: str, timezone_name: str = None, misfire_policy: str = MISFIRE_SKIP,
+                  action_type: str = None, max_instances: int = 1, keep_results: int = None,
+                  keep_days: int = None):
+    """Raise ValueError if a task definition cannot be scheduled."""
+    schedule = parse_schedule(cron_expr, timezone_name)
+    if schedule.next_after(time.time()) is None:
+        # e.g. "0 0 31 2 *": valid fields, but no such day ever comes
+        raise ValueError(f"Schedule '{cron_expr}' never fires (no match within the next 5 years)")
+    if keep_results is not None and keep_results < 1:
+        raise ValueError("keep_results must be at least 1")
+    if keep_days is not None and keep_days < 1:
+        raise ValueError("keep_days must be at least 1")
+    if not 1 <= max_instances <= MAX_INSTANCES_LIMIT:
+        raise ValueError(f"max_instances must be between 1 and {MAX_INSTANCES_LIMIT}")
+    if misfire_policy not in MISFIRE_POLICIES:
+        raise ValueError(f"misfire_policy must be one of {', '.join(MISFIRE_POLICIES)}")
+    if action_type is not None and action_type not in ACTION_TYPES:
+        raise ValueError(f"action_type must be one of {', '.join(ACTION_TYPES)}")
+
+
+def _parse_last_run(value) -> Optional[float]:
+    """last_run is SQLite CURRENT_TIMESTAMP (UTC) or an ISO string."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class _Entry:
+    __slots__ = ("task_id", "name", "schedule", "misfire_policy", "due")
+
+    def __init__(self, task_id, name, schedule, misfire_policy, due):
+        self.task_id = task_id
+        self.name = name
+        self.schedule = schedule
+        self.misfire_policy = misfire_policy
+        self.due = due
+
+
 class TaskScheduler:
-    """Background daemon that checks scheduled tasks and executes them when due."""
+    """Arms one timer per enabled task and runs the task's action when it fires."""
+
+    def __init__(self, timer_service=None):
+        self._timers = timer_service or timers
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._started = False
+        self._work: "queue.Queue" = queue.Queue()
+        self._dispatcher = None
+        self._stats = {"fired": 0, "missed": 0, "caught_up": 0, "rejected": 0, "results_compacted": 0}
 
-    def __init__(self):
-        self._stop_event = threading.Event()
-        self.thread = None
-        self.check_interval = 60  # Check every 60 seconds
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"scheduled_task:{task_id}"
 
     def start(self):
-        if self.thread and self.thread.is_alive():
-            logger.warning("TaskScheduler already running.")
-            return
-        self._ensure_table()
-        self._stop_event.clear()
-        self.thread = threading.Thread(target=self._run_loop, name="TaskSchedulerThread", daemon=True)
-        self.thread.start()
-        logger.info("TaskScheduler started.")
+        """Arm every enabled task. Safe to call more than once."""
+        from core import local_db
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        tasks = local_db.get_scheduled_tasks(enabled_only=True)
+        for task in tasks:
+            self._arm(task)
+        self._schedule_compaction(time.time() + 60)
+        logger.info(f"TaskScheduler started with {len(self._entries)} scheduled tasks.")
 
     def stop(self):
-        self._stop_event.set()
-        if self.thread:
-            self.thread.join(timeout=5)
-            logger.info("TaskScheduler stopped.")
-
-    def _ensure_table(self):
-        from core.local_db import _get_connection
-        conn = _get_connection()
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS scheduled_tasks (
-                id TEXT PRIMARY KEY,
-                ws_id TEXT,
-                name TEXT NOT NULL,
-                cron_expr TEXT NOT NULL DEFAULT '0 * * * *',
-                action_type TEXT NOT NULL DEFAULT 'flow',
-                action_id TEXT NOT NULL,
-                last_run TEXT,
-                enabled INTEGER DEFAULT 1,
-                created_at TEXT DEFAULT (datetime('now'))
-            )
-        """)
-        conn.commit()
+        with self._lock:
+            self._started = False
+            task_ids = list(self._entries)
+            self._entries.clear()
+        for task_id in task_ids:
+            self._timers.cancel(self._key(task_id))
+        self._timers.cancel(COMPACT_KEY)
+        logger.info("TaskScheduler stopped.")
+
+    def refresh(self, task_id: str):
+        """Re-read a task after it was created, changed or deleted and re-arm its timer."""
+        if not self._started:
+            return
+        from core import local_db
+        task = local_db.get_scheduled_task(task_id)
+        if task and task.get("enabled"):
+            self._arm(task, rearm=True)
+        else:
+            self._disarm(task_id)
+            if task:
+                local_db.set_task_next_run(task_id, None)
+
+    def _disarm(self, task_id: str):
+        with self._lock:
+            self._entries.pop(task_id, None)
+        self._timers.cancel(self._key(task_id))
+
+    def _arm(self, task: Dict, rearm: bool = False):
+        from core import local_db
+        task_id = task["id"]
+        try:
+            schedule = parse_schedule(task["cron_expr"], task.get("timezone"))
+        except ValueError as e:
+            logger.error(f"Scheduled task '{task['name']}' has an invalid schedule: {e}")
+            self._disarm(task_id)
+            return
+
+        now = time.time()
+        due = None if rearm else task.get("next_run")
+        if due is None:
+            last_run = _parse_last_run(task.get("last_run"))
+            if last_run is not None and isinstance(schedule, IntervalSchedule):
+                due = schedule.next_after(last_run)  # intervals keep their cadence across restarts
+            else:
+                due = schedule.next_after(now)
+        if due is None:
+            logger.warning(f"Scheduled task '{task['name']}' never fires; not scheduling it.")
+            self._disarm(task_id)
+            return
+
+        entry = _Entry(task_id, task["name"], schedule, task.get("misfire_policy") or MISFIRE_SKIP, due)
+        with self._lock:
+            self._entries[task_id] = entry
+        local_db.set_task_next_run(task_id, due)
+        self._timers.schedule(due, self._key(task_id), lambda: self._fire(task_id))
+
+    def _fire(self, task_id: str):
+        """Runs on the timer thread: decide whether to run, re-arm, and hand the run off."""
+        with self._lock:
+            entry = self._entries.get(task_id)
+        if entry is None:
+            return
+        now = time.time()
+        late = now - entry.due > MISFIRE_GRACE
+        run = True
+        if late:
+            if entry.misfire_policy == MISFIRE_CATCH_UP:
+                self._count("caught_up")
+                logger.info(f"Scheduled task '{entry.name}' missed its run; catching up once.")
+            else:
+                run = False
+                self._count("missed")
+                logger.info(f"Scheduled task '{entry.name}' missed its run; skipping to the next one.")
+
+        due = entry.schedule.next_after(now if late else entry.due)
+        if due is not None and due <= now:
+            due = entry.schedule.next_after(now)
+        if due is not None:
+            entry.due = due
+            self._timers.schedule(due, self._key(task_id), lambda: self._fire(task_id))
+        else:
+            with self._lock:
+                self._entries.pop(task_id, None)
+
+        self._defer(self._after_fire, task_id, due, run)
+
+    def _defer(self, fn, *args):
+        """Run `fn(*args)` on the dispatcher thread."""
+        self._work.put((fn, args))
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="TaskSchedulerDispatch",
+                                                    daemon=True)
+                self._dispatcher.start()
 
-    def _run_loop(self):
-        while not self._stop_event.is_set():
+    def _dispatch_loop(self):
+        while True:
+            fn, args = self._work.get()
             try:
-                self._check_tasks()
+                fn(*args)
             except Exception as e:
-                logger.error(f"TaskScheduler error: {e}")
-            self._stop_event.wait(self.check_interval)
-
-    def _check_tasks(self):
-        """Check all enabled tasks and see if any are due."""
-        from core.local_db import _get_connection
-        conn = _get_connection()
-        rows = conn.execute(
-            "SELECT id, name, cron_expr, action_type, action_id, last_run FROM scheduled_tasks WHERE enabled = 1"
-        ).fetchall()
-
-        now = datetime.utcnow()
-        for row in rows:
-            if self._is_due(row["cron_expr"], row["last_run"], now):
-                logger.info(f"Scheduler firing task: {row['name']}")
-                self._execute_task(row)
-                conn.execute("UPDATE scheduled_tasks SET last_run = ? WHERE id = ?",
-                             (now.isoformat(), row["id"]))
-                conn.commit()
-
-    def _is_due(self, cron_expr: str, last_run: str, now: datetime) -> bool:
-        """Simple interval-based check. Supports: 'every_Xm' for every X minutes."""
-        if not cron_expr:
-            return False
-
-        # Simple format: "every_60m" means every 60 minutes
-        if cron_expr.startswith("every_") and cron_expr.endswith("m"):
-            try:
-                interval_min = int(cron_expr[6:-1])
-            except ValueError:
-                return False
-            if not last_run:
-                return True
-            try:
-                last = datetime.fromisoformat(last_run)
-                elapsed = (now - last).total_seconds() / 60
-                return elapsed >= interval_min
-            except ValueError:
-                return True
+                logger.error(f"Scheduler {fn.__name__}{args} failed: {e}")
 
-        return False
-
-    def _execute_task(self, task_row):
-        """Execute the scheduled action."""
+    def _after_fire(self, task_id: str, next_run: Optional[float], run: bool):
+        from core import local_db
+        from core.task_executor import task_executor, QueueFullError
+        local_db.set_task_next_run(task_id, next_run)
+        if not run:
+            return
+        task = local_db.get_scheduled_task(task_id)
+        if not task or not task.get("enabled"):
+            self._disarm(task_id)
+            return
+        self._count("fired")
         try:
-            from core.activity_feed import activity_feed
-            activity_feed.log_event("scheduler", f"Scheduled task fired: {task_row['name']}")
-        except Exception:
-            pass
+            task_executor.submit(task)
+        except QueueFullError as e:
+            self._count("rejected")
+            logger.warning(f"Scheduled task '{task['name']}' dropped: {e}")
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def _schedule_compaction(self, when: float):
+        self._timers.schedule(when, COMPACT_KEY, lambda: self._defer(self.compact_results))
+
+    def compact_results(self) -> int:
+        """Apply every task's result retention. Returns the number of rows folded into summaries."""
+        from core import local_db
+        removed = 0
+        for task in local_db.get_scheduled_tasks():
+            removed += local_db.compact_task_results(
+                task["id"],
+                keep=task.get("keep_results") or DEFAULT_KEEP_RESULTS,
+                max_age_days=task.get("keep_days") or DEFAULT_KEEP_DAYS,
+            )
+        if removed:
+            self._count("results_compacted", removed)
+            logger.info(f"Compacted {removed} scheduled task results")
+        if self._started:
+            self._schedule_compaction(time.time() + COMPACT_INTERVAL)
+        return removed
+
+    def run_now(self, task_id: str) -> bool:
+        """
+        Queue a task to run now without touching its schedule. Returns False if
+        it merged into a run that is already waiting. Raises QueueFullError.
+        """
+        from core import local_db
+        from core.task_executor import task_executor
+        task = local_db.get_scheduled_task(task_id)
+        if not task:
+            raise KeyError(task_id)
+        return task_executor.submit(task, trigger="manual")
+
+    def next_run(self, task_id: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            return entry.due if entry else None
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            next_due = min((e.due for e in self._entries.values()), default=None)
+            scheduled = len(self._entries)
+            stats = dict(self._stats)
+        return {
+            "running": self._started,
+            "scheduled": scheduled,
+            "next_due": next_due,
+            **stats,
+        }
+
+
+def execute_task(task: Dict) -> bool:
+    """Run a task's action and record the outcome in task_results. Returns False if it raised."""
+    from core import local_db
+    ok = True
+    try:
+        if task["action_type"] == "flow":
+            result = _run_flow(task)
+        else:
+            result = _run_bot_prompt(task)
+        logger.info(f"Task '{task['name']}' executed successfully.")
+    except Exception as e:
+        ok = False
+        result = f"❌ Execution failed: {str(e)}"
+        logger.error(f"Task execution error: {e}")
+    try:
+        local_db.save_task_result(task["id"], result, status="ok" if ok else "error")
+    except Exception as e:
+        logger.error(f"Failed to save result of task {task['id']}: {e}")
+    try:
+        from core.activity_feed import activity_feed
+        activity_feed.log_event("scheduler", f"Scheduled task fired: {task['name']}")
+    except Exception:
+        pass
+    return ok
+
+
+def _run_bot_prompt(task: Dict) -> str:
+    from core.config import get_current_user_id
+    from core.registry import registry
+    from core.task_executor import task_executor
+
+    bot_id = task["action_id"]
+    bot = registry.bot(task["ws_id"], bot_id)
+    if not bot:
+        raise LookupError(f"Bot {bot_id} not found.")
+    engine = task_executor.engine_for(bot, get_current_user_id())
+    messages = [{"role": "user", "content": task.get("prompt") or ""}]
+    response = engine.chat(messages=messages, system_prompt=bot['prompt'], bot_id=bot_id)
+    return response.choices[0].message.content or "(No response)"
+
+
+def _run_flow(task: Dict) -> str:
+    from core import local_db
+    from core.flow_runner import flow_runner
+
+    flow = local_db.get_flow(task["action_id"])
+    if not flow:
+        raise LookupError(f"Flow {task['action_id']} not found.")
+    run_id = flow_runner.submit(flow["id"], flow.get("workspace_id") or task["ws_id"], flow["flow_data"])
+    return f"Flow run queued: {run_id}"
 
 task_scheduler = TaskScheduler()
@@ -0,0 +1,87 @@
+"""
+Heap-based timer service.
+
+One daemon thread sleeps until the earliest deadline and then runs that
+timer's callback, so thousands of pending timers cost one heap entry each
+and no threads. Timers are keyed: scheduling an existing key replaces it.
+Deadlines are wall-clock (time.time()) so they can be persisted and
+re-scheduled after a restart. Callbacks run on the timer thread and must
+be quick — hand real work to a queue or pool.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_SLEEP = 60.0  # re-check periodically so wall-clock jumps are noticed
+
+
+class TimerService:
+    def __init__(self, name: str = "TimerService"):
+        self.name = name
+        self._heap = []                      # (when, seq, key)
+        self._entries: Dict[str, tuple] = {}  # key -> (when, seq, callback)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, when: float, key: str, callback: Callable[[], None]):
+        """Run `callback` at epoch time `when` (immediately if already past)."""
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (when, seq, callback)
+            heapq.heappush(self._heap, (when, seq, key))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, key: str) -> bool:
+        with self._cond:
+            # The heap entry becomes stale and is discarded when it surfaces.
+            return self._entries.pop(key, None) is not None
+
+    def get(self, key: str) -> Optional[float]:
+        with self._cond:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def next_due(self) -> Optional[float]:
+        with self._cond:
+            return min((e[0] for e in self._entries.values()), default=None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap:
+                        when, seq, key = self._heap[0]
+                        entry = self._entries.get(key)
+                        if entry is not None and entry[1] == seq:
+                            break
+                        heapq.heappop(self._heap)  # cancelled or replaced
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay > 0:
+                        self._cond.wait(min(delay, MAX_SLEEP))
+                        continue
+                    _, _, key = heapq.heappop(self._heap)
+                    _, _, callback = self._entries.pop(key)
+                    break
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Timer {key} callback failed: {e}")
+
+# Singleton
+timers = TimerService()
@@ -1,9 +1,12 @@
+import codecs
+import locale
 import os
+import signal
 import sys
 import subprocess
+import threading
 import time
 from pathlib import Path
-import paramiko
 
 try:
     from core.integrations.google_workspace import read_emails, check_calendar
@@ -26,104 +29,144 @@ SCREENSHOT_DIR.mkdir(exist_ok=True)
 
 # ----------- TOOL IMPLEMENTATIONS -----------
 
-def run_remote_ssh_command(command: str, host: str = "", confidence_score: int = 100) -> str:
-    """Executes a terminal command on an external server using saved SSH credentials."""
-    target_host, port_str, user, password, key_content = host, "22", "ubuntu", "", ""
-    
-    # Ensure confidence_score is an integer
-    try:
-        score = int(confidence_score)
-    except (ValueError, TypeError):
-        score = 100
+REMOTE_COMMAND_TIMEOUT = 120  # wall-clock seconds for one remote command
+LOCAL_COMMAND_TIMEOUT = 60
 
-    if score < 90:
-        return "SAFETY ABORT: Your confidence score is too low. DO NOT GUESS. Ask the user a clarifying question instead."
 
+def _workspace_ssh_servers() -> list:
+    """Saved SSH servers of the active workspace ([] if none or unavailable)."""
     try:
         from core.bot_manager import _get_active_workspace_id
         workspace_id = _get_active_workspace_id()
         if workspace_id and workspace_id != "00000000-0000-0000-0000-000000000000":
             if os.environ.get("WOLFCLAW_ENVIRONMENT") == "desktop":
-                from core import local_db
-                ssh_list = local_db.get_workspace_ssh(workspace_id)
+                from core.registry import registry
+                ssh_list = registry.ssh_servers(workspace_id)
             else:
                 from core.config import get_supabase
                 res = get_supabase().table("workspaces").select("ssh_config").eq("id", workspace_id).execute()
                 ssh_list = res.data[0].get("ssh_config") or []
-            
-            if isinstance(ssh_list, list) and len(ssh_list) > 0:
-                # Find by host or default to first
-                selected = None
-                if target_host:
-                    selected = next((s for s in ssh_list if s.get("host") == target_host), None)
-                
-                if not selected:
-                    selected = ssh_list[0]
-                
-                target_host = selected.get("host", "")
-                port_str = str(selected.get("port", "22"))
-                user = selected.get("user", "ubuntu")
-                password = selected.get("password", "")
-                key_content = selected.get("key_content", "")
+            if isinstance(ssh_list, list):
+                return ssh_list
     except Exception:
         pass
+    return []
+
+
+def _ssh_target(server: dict) -> dict:
+    port_str = str(server.get("port", "22"))
+    return {
+        "name": server.get("name", ""),
+        "host": server.get("host", ""),
+        "port": int(port_str) if port_str.isdigit() else 22,
+        "user": server.get("user", "ubuntu"),
+        "password": server.get("password", ""),
+        "key_content": server.get("key_content", ""),
+    }
+
+
+def _resolve_ssh_target(host: str = "") -> dict:
+    """Connection settings for `host` (or the first saved server), falling back to WOLFCLAW_SSH_* env."""
+    ssh_list = _workspace_ssh_servers()
+    if ssh_list:
+        # Find by host or default to first
+        selected = None
+        if host:
+            selected = next((s for s in ssh_list if s.get("host") == host), None)
+        return _ssh_target(selected or ssh_list[0])
 
     # Fallback to isolated env for isolated subprocess workers
-    if not target_host:
-        target_host = os.environ.get("WOLFCLAW_SSH_HOST", "")
-        port_str = str(os.environ.get("WOLFCLAW_SSH_PORT", "22"))
-        user = os.environ.get("WOLFCLAW_SSH_USER", "ubuntu")
-        password = os.environ.get("WOLFCLAW_SSH_PASSWORD", "")
-        key_content = os.environ.get("WOLFCLAW_SSH_KEY_CONTENT", "")
-
-    if not target_host:
+    return _ssh_target({
+        "host": host or os.environ.get("WOLFCLAW_SSH_HOST", ""),
+        "port": os.environ.get("WOLFCLAW_SSH_PORT", "22"),
+        "user": os.environ.get("WOLFCLAW_SSH_USER", "ubuntu"),
+        "password": os.environ.get("WOLFCLAW_SSH_PASSWORD", ""),
+        "key_content": os.environ.get("WOLFCLAW_SSH_KEY_CONTENT", ""),
+    })
+
+
+def run_remote_ssh_command(command: str, host: str = "", confidence_score: int = 100) -> str:
+    """Executes a terminal command on an external server using saved SSH credentials."""
+    # Ensure confidence_score is an integer
+    try:
+        score = int(confidence_score)
+    except (ValueError, TypeError):
+        score = 100
+
+    if score < 90:
+        return "SAFETY ABORT: Your confidence score is too low. DO NOT GUESS. Ask the user a clarifying question instead."
+
+    target = _resolve_ssh_target(host)
+
+    if not target["host"]:
         return "Error: Remote server host is not configured. The user needs to add their Server IP in the 'Remote Servers' dashboard first."
 
-    if not password and not key_content:
+    if not target["password"] and not target["key_content"]:
          return "Error: No SSH authentication method provided. The user needs to provide either a Password or a PEM key in the 'Remote Servers' dashboard."
 
-    port = int(port_str) if str(port_str).isdigit() else 22
-
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        if key_content:
-            import io
-            key_io = io.StringIO(key_content)
-            # Try multiple key formats to avoid hiccups with modern servers (Ed25519, etc.)
-            pkey = None
-            for key_class in [paramiko.RSAKey, paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.DSSKey]:
-                try:
-                    key_io.seek(0)
-                    pkey = key_class.from_private_key(key_io)
-                    break
-                except:
-                    continue
-            
-            if not pkey:
-                return "Error: Could not parse PEM key. Ensure it is a valid OpenSSH private key."
-                
-            client.connect(hostname=target_host, port=port, username=user, pkey=pkey, timeout=10)
-        else:
-            client.connect(hostname=target_host, port=port, username=user, password=password, timeout=10)
-        
-        stdin, stdout, stderr = client.exec_command(command, timeout=30)
-        
-        output = stdout.read().decode('utf-8')
-        err_output = stderr.read().decode('utf-8')
-        
-        client.close()
-
-        final_output = output
-        if err_output:
-            final_output += f"\nError Output:\n{err_output}"
+        from core.output_capture import OutputCapture
+        from core.ssh_pool import ssh_pool, SSHKeyError
+        capture = OutputCapture("run_remote_ssh_command", label=target["host"])
+        status = None
+        try:
+            status = ssh_pool.stream(
+                target["host"], command, capture.write, port=target["port"], user=target["user"],
+                password=target["password"], key_content=target["key_content"], timeout=REMOTE_COMMAND_TIMEOUT
+            )
+        except SSHKeyError as e:
+            return f"Error: {e}"
+        finally:
+            capture.finish(status)
+
+        final_output = capture.render()
+        if status is None:
+            return final_output + f"\n[Command did not finish within {REMOTE_COMMAND_TIMEOUT}s and was stopped.]"
             
         return final_output if final_output.strip() else "Remote command executed successfully with no output."
         
     except Exception as e:
         return f"Failed to execute command on remote server: {str(e)}"
 
+def run_remote_ssh_fanout(command: str, hosts: str = "all", confidence_score: int = 100) -> str:
+    """Executes the same command on several saved SSH servers concurrently."""
+    try:
+        score = int(confidence_score)
+    except (ValueError, TypeError):
+        score = 100
+
+    if score < 90:
+        return "SAFETY ABORT: Your confidence score is too low. DO NOT GUESS. Ask the user a clarifying question instead."
+
+    servers = _workspace_ssh_servers()
+    if not servers:
+        return "Error: No remote servers are saved. The user needs to add them in the 'Remote Servers' dashboard first."
+
+    try:
+        from core.ssh_fanout import fan_out, format_result, select_servers
+        result = fan_out(command, select_servers(servers, hosts))
+        return format_result(result)
+    except ValueError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Failed to execute command on remote servers: {str(e)}"
+
+
+def read_command_output(output_id: str, offset: int = 0, length: int = 8000) -> str:
+    """Pages through the full output of a command whose reply was truncated."""
+    try:
+        from core.output_capture import read_output
+        part = read_output(output_id, offset, length)
+    except KeyError:
+        return f"Error: No saved output with id '{output_id}'. It may have expired."
+    except (ValueError, TypeError) as e:
+        return f"Error: {e}"
+
+    header = f"[output_id {output_id}, characters {part['offset']}-{part['next_offset']}]\n"
+    footer = "\n[End of output.]" if part["eof"] else f"\n[More output follows; continue with offset={part['next_offset']}.]"
+    return header + part["content"] + footer
+
+
 def web_search(query: str) -> str:
     """Search the web and return top results."""
     try:
@@ -214,22 +257,68 @@ def run_terminal_command(command: str, confidence_score: int = 100) -> str:
         return "SECURITY ABORT: The command contains potentially malicious characters or destructive operations. For your safety, I cannot execute this."
 
     try:
-        if _IS_WINDOWS:
-            result = subprocess.run(["powershell", "-Command", command], capture_output=True, text=True, timeout=60)
-        else:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True, executable="/bin/bash", timeout=60)
-        
-        output = result.stdout
-        err_output = result.stderr
-        
-        final_output = output
-        if err_output:
-            final_output += f"\nError Output:\n{err_output}"
+        from core.output_capture import OutputCapture
+        capture = OutputCapture("run_terminal_command", label=command[:200])
+        status = None
+        try:
+            if _IS_WINDOWS:
+                status = _run_process(["powershell", "-Command", command], capture, LOCAL_COMMAND_TIMEOUT)
+            else:
+                status = _run_process(command, capture, LOCAL_COMMAND_TIMEOUT, shell=True, executable="/bin/bash")
+        finally:
+            capture.finish(status)
+
+        final_output = capture.render()
+        if status is None:
+            return final_output + f"\n[Command did not finish within {LOCAL_COMMAND_TIMEOUT}s and was stopped.]"
             
         return final_output if final_output.strip() else "Command executed successfully with no output."
     except Exception as e:
         return f"Failed to execute command: {str(e)}"
 
+
+def _pump(pipe, stream: str, capture, encoding: str):
+    """Feed a process pipe into the capture as data arrives."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    fd = pipe.fileno()
+    try:
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            capture.write(stream, decoder.decode(data))
+        capture.write(stream, decoder.decode(b"", final=True))
+    finally:
+        pipe.close()
+
+
+def _run_process(args, capture, timeout: float, **popen_kwargs):
+    """Run a process, streaming stdout/stderr into `capture`. Returns its exit code, or None if killed at `timeout`."""
+    if not _IS_WINDOWS:
+        popen_kwargs["start_new_session"] = True  # so a timeout kills the shell's children too
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs)
+    encoding = locale.getpreferredencoding(False)
+    readers = [threading.Thread(target=_pump, args=(pipe, name, capture, encoding), daemon=True)
+               for pipe, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr"))]
+    for reader in readers:
+        reader.start()
+    try:
+        status = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        status = None
+        try:
+            if _IS_WINDOWS:
+                proc.kill()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        proc.wait()
+    for reader in readers:
+        # A detached grandchild can keep a pipe open; don't wait on it forever.
+        reader.join(timeout=5)
+    return status
+
 def capture_screenshot() -> str:
     """Takes a screenshot of the user's screen and saves it."""
     try:
@@ -349,6 +438,56 @@ WOLFCLAW_TOOLS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "run_remote_ssh_fanout",
+            "description": "Run the same command on several of the user's saved remote servers at once (e.g. check disk or uptime across the fleet). Returns per-server status, exit code and output. Prefer this over calling run_remote_ssh_command once per server.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "command": {
+                        "type": "string",
+                        "description": "The exact bash command to execute on every selected server (e.g. 'df -h /', 'uptime')."
+                    },
+                    "hosts": {
+                        "type": "string",
+                        "description": "Which servers to target: 'all' (default), or a comma-separated list of server names, IPs/hostnames or group names."
+                    },
+                    "confidence_score": {
+                        "type": "integer",
+                        "description": "An integer from 1-100 reflecting how confident you are that this is the EXACT correct command and path. If below 90, the system will abort."
+                    }
+                },
+                "required": ["command"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_command_output",
+            "description": "Read more of a command's output that was too long to return in full. Terminal and SSH tool replies that were truncated name an output_id; use it here to page through the complete output.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "output_id": {
+                        "type": "string",
+                        "description": "The output_id given in the truncated tool reply."
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Character offset to start reading from (default 0)."
+                    },
+                    "length": {
+                        "type": "integer",
+                        "description": "Number of characters to read (default 8000, max 65536)."
+                    }
+                },
+                "required": ["output_id"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -546,6 +685,18 @@ def execute_tool(tool_name: str, arguments: dict) -> str:
             host=arguments.get("host", ""),
             confidence_score=arguments.get("confidence_score", 100)
         )
+    elif tool_name == "run_remote_ssh_fanout":
+        return run_remote_ssh_fanout(
+            arguments.get("command", ""),
+            hosts=arguments.get("hosts", "all"),
+            confidence_score=arguments.get("confidence_score", 100)
+        )
+    elif tool_name == "read_command_output":
+        return read_command_output(
+            arguments.get("output_id", ""),
+            offset=arguments.get("offset", 0),
+            length=arguments.get("length", 8000)
+        )
     elif tool_name == "web_search":
         return web_search(arguments.get("query", ""))
     elif tool_name == "read_document":
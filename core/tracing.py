@@ -0,0 +1,232 @@
+"""
+Lightweight in-process tracing.
+
+Records nested spans (request -> prompt assembly -> RAG -> completion ->
+tool -> DB write) using contextvars, so the active span follows the code
+through sync and async calls. Threads do not inherit context on their own:
+hand work to a thread or pool through `wrap()` to keep the trace intact.
+
+Only entry points start a trace: the request middleware, task and flow
+runs and LLM chats open their span with `root=True`. Any other span opened
+outside an active trace (a background DB call, say) is not recorded, so it
+cannot flood the buffer with one-span traces.
+
+A trace belongs to the user_id on its root span (set once auth resolves the
+caller, or by the entry point); /api/debug/traces only serves a user their
+own. Finished traces land in an in-memory ring buffer and are appended,
+one span per line, to a JSONL file whose fields follow the OTLP span layout.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from core.paths import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+TRACES_DIR = get_data_dir() / "traces"
+TRACE_FILE = TRACES_DIR / "traces.jsonl"
+MAX_TRACE_FILE_BYTES = 10 * 1024 * 1024
+MAX_SPANS_PER_TRACE = 500
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("wolfclaw_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start", "end", "status", "error", "_trace")
+
+    def __init__(self, name: str, trace: "_Trace", parent: Optional["Span"], attributes: Dict):
+        self.trace_id = trace.trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+        self._trace = trace
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return round(((self.end or time.time()) - self.start) * 1000, 2)
+
+    def to_dict(self) -> Dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": int(self.start * 1e9),
+            "endTimeUnixNano": int((self.end or time.time()) * 1e9),
+            "durationMs": self.duration_ms,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR" if self.status == "error" else "OK", "message": self.error or ""},
+        }
+
+
+class _Trace:
+    """All spans sharing a trace_id; finalized when its root span ends."""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self.lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+
+
+class Tracer:
+    def __init__(self, buffer_size: int = 200, enabled: bool = True, export_path=TRACE_FILE):
+        self.enabled = enabled
+        self._finished = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._export_path = export_path
+        self._export_queue: "queue.Queue" = queue.Queue(maxsize=10_000)
+        self._writer = None
+
+    # ----------- SPAN API -----------
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes):
+        """Record a span under the active one; with no active trace, start one only if `root`."""
+        parent = _current_span.get() if self.enabled else None
+        if not self.enabled or (parent is None and not root):
+            yield None
+            return
+        trace = parent._trace if parent else _Trace()
+        sp = Span(name, trace, parent, attributes)
+        trace.add(sp)
+        token = _current_span.set(sp)
+        try:
+            yield sp
+        except BaseException as e:
+            sp.status = "error"
+            sp.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            sp.end = time.time()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish(trace, sp)
+
+    def traced(self, name: str = None):
+        """Decorator form of span()."""
+        def decorator(fn: Callable):
+            span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def set_root(self, **attributes):
+        """Set attributes on the root span of the active trace."""
+        sp = _current_span.get()
+        if sp is None:
+            return
+        with sp._trace.lock:
+            root = sp._trace.spans[0] if sp._trace.spans else None
+        if root is not None:
+            root.attributes.update(attributes)
+
+    def current_trace_id(self) -> Optional[str]:
+        sp = _current_span.get()
+        return sp.trace_id if sp else None
+
+    # ----------- BUFFER / EXPORT -----------
+
+    def _finish(self, trace: _Trace, root: Span):
+        with trace.lock:
+            spans = list(trace.spans)
+        record = {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "start": root.start,
+            "duration_ms": root.duration_ms,
+            "status": root.status,
+            "attributes": root.attributes,
+            "span_count": len(spans),
+            "spans": [s.to_dict() for s in spans],
+        }
+        with self._lock:
+            self._finished.append(record)
+        self._export(record["spans"])
+
+    def _export(self, spans: List[Dict]):
+        if not self._export_path:
+            return
+        try:
+            self._export_queue.put_nowait(spans)
+        except queue.Full:
+            return
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="TraceExporter", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            spans = self._export_queue.get()
+            try:
+                self._export_path.parent.mkdir(parents=True, exist_ok=True)
+                if self._export_path.exists() and self._export_path.stat().st_size > MAX_TRACE_FILE_BYTES:
+                    os.replace(self._export_path, self._export_path.with_suffix(".jsonl.1"))
+                with open(self._export_path, "a", encoding="utf-8") as f:
+                    for s in spans:
+                        f.write(json.dumps(s, default=str) + "\n")
+            except Exception as e:
+                logger.debug(f"Trace export failed: {e}")
+
+    def recent(self, limit: int = 20, slowest: bool = True, min_ms: float = 0,
+               user_id: Optional[str] = None) -> List[Dict]:
+        """Summaries of finished traces, slowest first by default; only `user_id`'s if given."""
+        with self._lock:
+            traces = [t for t in self._finished if t["duration_ms"] >= min_ms
+                      and (user_id is None or t["attributes"].get("user_id") == user_id)]
+        if slowest:
+            traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+        else:
+            traces.reverse()
+        return [{k: v for k, v in t.items() if k != "spans"} for t in traces[:limit]]
+
+    def get(self, trace_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        with self._lock:
+            for t in self._finished:
+                if t["trace_id"] == trace_id:
+                    if user_id is not None and t["attributes"].get("user_id") != user_id:
+                        return None
+                    return t
+        return None
+
+
+def wrap(fn: Callable) -> Callable:
+    """Bind `fn` to the caller's trace context so it can run on another thread."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def runner(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return runner
+
+# Singleton
+tracer = Tracer(enabled=os.environ.get("WOLFCLAW_TRACING", "1") != "0")
+span = tracer.span
+traced = tracer.traced
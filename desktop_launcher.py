@@ -21,20 +21,18 @@ def setup_logging():
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, "wolfclaw.log")
     
-    # Simple redirection for packaged exe
-    if getattr(sys, 'frozen', False):
+    # Simple redirection for packaged exe (catches stray prints and tracebacks)
+    frozen = getattr(sys, 'frozen', False)
+    if frozen:
         f = open(log_file, 'a', encoding='utf-8')
         sys.stdout = f
         sys.stderr = f
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    # Records are queued and written by a background listener thread, so
+    # request threads never block on log file I/O.
+    sys.path.insert(0, get_base_dir())
+    from core.logging_config import setup_logging as setup_queued_logging
+    setup_queued_logging(log_file=log_file, console=not frozen)
     return logging.getLogger("WolfclawLauncher")
 
 def find_available_port(start_port=8501, max_attempts=20):
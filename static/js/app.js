@@ -96,6 +96,7 @@ function switchAuthView(viewName) {
 }
 
 function showAuth() {
+    closeEventStream();
     document.getElementById('auth-container').classList.remove('hidden');
     document.getElementById('app-container').classList.add('hidden');
     switchAuthView('login');
@@ -107,6 +108,7 @@ function showApp() {
     document.getElementById('current-user-email').innerText = currentUser.email;
     loadDashboard();
     checkLocalAI();
+    if (document.getElementById('notif-bell')) subscribeEventStream();
 }
 
 function switchView(viewName) {
@@ -789,7 +791,7 @@ function renderSSHServerList() {
         btn.innerHTML = `
             <div style="font-weight:600; font-size:0.95em; color:var(--text-color);">${server.name || 'Unnamed Server'}</div>
             <div style="font-size:0.8em; color:var(--text-muted); margin-top:4px;">
-                <i class="fa-solid fa-server"></i> ${server.host || 'No IP'}
+                <i class="fa-solid fa-server"></i> ${server.host || 'No IP'}${server.group ? ` · ${server.group}` : ''}
             </div>
         `;
         btn.onclick = () => selectSSHServer(server.id);
@@ -810,6 +812,7 @@ function createNewSSHServer() {
     document.getElementById('ssh-host').value = '';
     document.getElementById('ssh-port').value = '22';
     document.getElementById('ssh-user').value = 'ubuntu';
+    document.getElementById('ssh-group').value = '';
     document.getElementById('ssh-password').value = '';
     document.getElementById('ssh-password').placeholder = 'SSH password';
     document.getElementById('ssh-pem-status').innerHTML = '';
@@ -841,6 +844,7 @@ function selectSSHServer(id) {
     document.getElementById('ssh-host').value = server.host || '';
     document.getElementById('ssh-port').value = server.port || '22';
     document.getElementById('ssh-user').value = server.user || 'ubuntu';
+    document.getElementById('ssh-group').value = server.group || '';
 
     document.getElementById('ssh-password').value = '';
     if (server.has_password) {
@@ -871,6 +875,7 @@ async function saveSSHConfig() {
     const port = document.getElementById('ssh-port').value;
     const user = document.getElementById('ssh-user').value;
     const password = document.getElementById('ssh-password').value;
+    const group = document.getElementById('ssh-group').value;
 
     if (!host) return alert("Please enter an IP or hostname!");
     if (!name) return alert("Please enter a sequence name for the server!");
@@ -882,7 +887,7 @@ async function saveSSHConfig() {
                 ...getAuthHeader(),
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ id: id || null, name, host, port, user, password, key_content: sshPemContent })
+            body: JSON.stringify({ id: id || null, name, host, port, user, password, key_content: sshPemContent, group })
         });
         const data = await resp.json();
         if (resp.ok) {
@@ -2798,23 +2803,78 @@ function endWarRoom() {
     document.getElementById('warroom-messages').innerHTML = '';
 }
 
+let warRoomRunId = null;      // run_id of the streaming War Room run, while one is active
+let warRoomAbort = null;      // AbortController of that run's fetch
+
+async function cancelWarRoomRun() {
+    // The server reports the cancellation on the stream and then closes it.
+    if (warRoomRunId) {
+        try {
+            const resp = await fetch(`${API_BASE}/chat/warroom/${warRoomRunId}/cancel`, {
+                method: 'POST',
+                headers: getAuthHeader()
+            });
+            if (resp.ok) return;
+        } catch (err) { /* fall through: dropping the stream cancels the run too */ }
+    }
+    if (warRoomAbort) warRoomAbort.abort();
+}
+
 async function sendWarRoomMessage() {
     const input = document.getElementById('warroom-input');
+    const sendBtn = input.nextElementSibling;
+
+    // While a run is streaming the button is a Stop button.
+    if (warRoomAbort) {
+        sendBtn.disabled = true;
+        await cancelWarRoomRun();
+        return;
+    }
+
     const userMsg = input.value.trim();
     if (!userMsg || !warRoomManagerId) return;
 
     input.value = '';
     appendWarRoomBubble('user', 'You', userMsg);
 
-    const sendBtn = input.nextElementSibling;
-    sendBtn.disabled = true;
-    sendBtn.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> Running...';
+    sendBtn.innerHTML = '<i class="fa-solid fa-stop"></i> Stop';
 
     // We send a single prompt for now; keeping history stateless in UI for MVP
     const messages = [{ role: 'user', content: userMsg }];
+    const liveBubbles = {};  // task_id -> bubble receiving that agent's tokens
+    warRoomAbort = new AbortController();
+
+    const handleEvent = (type, event) => {
+        if (type === 'started') {
+            warRoomRunId = event.run_id;
+        } else if (type === 'token') {
+            let bubble = liveBubbles[event.task_id];
+            if (!bubble) {
+                bubble = liveBubbles[event.task_id] = appendWarRoomBubble('assistant', event.bot_name, '');
+                bubble.appendChild(document.createElement('span'));
+            }
+            bubble.lastChild.textContent += event.content;
+            const container = document.getElementById('warroom-messages');
+            container.scrollTop = container.scrollHeight;
+        } else if (type === 'message') {
+            const bubble = liveBubbles[event.task_id];
+            if (bubble) {
+                bubble.lastChild.textContent = event.content;
+                delete liveBubbles[event.task_id];
+            } else {
+                appendWarRoomBubble('assistant', event.bot_name, event.content);
+            }
+        } else if (type === 'status') {
+            appendWarRoomBubble('status', event.bot_name, event.content);
+        } else if (type === 'error') {
+            appendWarRoomBubble('error', event.bot_name, event.content);
+        } else if (type === 'usage') {
+            appendWarRoomBubble('system', '', event.content);
+        }
+    };
 
     try {
-        const resp = await fetch(`${API_BASE}/chat/warroom/send`, {
+        const resp = await fetch(`${API_BASE}/chat/warroom/stream`, {
             method: 'POST',
             headers: {
                 ...getAuthHeader(),
@@ -2824,27 +2884,46 @@ async function sendWarRoomMessage() {
                 manager_bot_id: warRoomManagerId,
                 sub_bot_ids: warRoomSubBotIds,
                 messages: messages
-            })
+            }),
+            signal: warRoomAbort.signal
         });
 
-        const data = await resp.json();
-
-        if (resp.ok) {
-            data.events.forEach(event => {
-                if (event.type === 'status') {
-                    appendWarRoomBubble('status', event.bot_name, event.content);
-                } else if (event.type === 'message') {
-                    appendWarRoomBubble('assistant', event.bot_name, event.content);
-                } else if (event.type === 'error') {
-                    appendWarRoomBubble('error', event.bot_name, event.content);
-                }
-            });
-        } else {
+        if (!resp.ok) {
+            const data = await resp.json();
             appendWarRoomBubble('error', 'System', `Error: ${data.detail || 'Unknown error'}`);
+            return;
+        }
+
+        // Parse the SSE frames ("event: x\ndata: {...}\n\n") as they arrive.
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                let type = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) type = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (data) handleEvent(type, JSON.parse(data));
+            }
         }
     } catch (err) {
-        appendWarRoomBubble('error', 'System', 'Connection error. Is the backend running?');
+        if (err.name === 'AbortError') {
+            appendWarRoomBubble('system', '', 'War Room cancelled.');
+        } else {
+            appendWarRoomBubble('error', 'System', 'Connection error. Is the backend running?');
+        }
     } finally {
+        warRoomRunId = null;
+        warRoomAbort = null;
         sendBtn.disabled = false;
         sendBtn.innerHTML = '<i class="fa-solid fa-paper-plane"></i> Dispatch';
     }
@@ -2901,6 +2980,7 @@ function appendWarRoomBubble(type, name, content) {
 
     container.appendChild(div);
     container.scrollTop = container.scrollHeight;
+    return div;
 }
 
 
@@ -3214,7 +3294,12 @@ function exportDrawflowToFlowJSON() {
                 for (const conn of output.connections) {
                     const targetNode = homeData[conn.node];
                     const targetId = targetNode?.name || `node_${conn.node}`;
-                    edges.push({ from: nodeId, to: targetId });
+                    const edge = { from: nodeId, to: targetId };
+                    // IF blocks: first port is the "true" branch, second the "false" branch
+                    if (blockType === 'condition') {
+                        edge.branch = outputKey === 'output_2' ? 'false' : 'true';
+                    }
+                    edges.push(edge);
                 }
             }
         }
@@ -3264,7 +3349,8 @@ function importFlowToDrawflow(flowData) {
         const toId = nodeMap[edge.to];
         if (fromId && toId) {
             try {
-                flowEditor.addConnection(fromId, toId, 'output_1', 'input_1');
+                const port = edge.branch === 'false' ? 'output_2' : 'output_1';
+                flowEditor.addConnection(fromId, toId, port, 'input_1');
             } catch (e) { /* connection might fail if ports don't match */ }
         }
     }
@@ -3279,7 +3365,7 @@ async function saveCurrentFlow() {
     const flowData = exportDrawflowToFlowJSON();
 
     try {
-        await fetch(`${API_BASE}/flows/${currentFlowId}`, {
+        const res = await fetch(`${API_BASE}/flows/${currentFlowId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -3288,7 +3374,14 @@ async function saveCurrentFlow() {
                 flow_data: JSON.stringify(flowData)
             })
         });
-        alert('Flow saved!');
+        const saved = await res.json();
+        if (!res.ok) throw new Error(saved.detail || res.statusText);
+        const errors = saved.validation?.errors || [];
+        if (errors.length) {
+            alert('Flow saved, but it cannot run yet:\n\n- ' + errors.join('\n- '));
+        } else {
+            alert('Flow saved!');
+        }
     } catch (e) {
         alert('Failed to save: ' + e.message);
     }
@@ -3306,18 +3399,37 @@ async function runCurrentFlow() {
 
     try {
         const res = await fetch(`${API_BASE}/flows/${currentFlowId}/run`, { method: 'POST' });
-        const result = await res.json();
-        document.getElementById('flow-results-output').textContent = JSON.stringify(result, null, 2);
+        const queued = await res.json();
+        if (!res.ok) throw new Error(queued.detail || res.statusText);
+        const run = await waitForFlowRun(queued.run_id, (r) => {
+            document.getElementById('flow-results-output').textContent = `⏳ Flow run ${r.status}...`;
+        });
+        document.getElementById('flow-results-output').textContent = JSON.stringify(run.result || run, null, 2);
     } catch (e) {
         document.getElementById('flow-results-output').textContent = '❌ Error: ' + e.message;
     }
 }
 
+// Runs execute in the background; poll until the run leaves queued/running.
+async function waitForFlowRun(runId, onProgress) {
+    while (true) {
+        const res = await fetch(`${API_BASE}/flows/runs/${runId}`);
+        const run = await res.json();
+        if (!res.ok) throw new Error(run.detail || res.statusText);
+        if (run.status !== 'queued' && run.status !== 'running') return run;
+        if (onProgress) onProgress(run);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 async function quickRunFlow(flowId) {
     try {
         const res = await fetch(`${API_BASE}/flows/${flowId}/run`, { method: 'POST' });
-        const result = await res.json();
-        alert(`Flow completed in ${result.elapsed_seconds}s\n\n${JSON.stringify(result.results, null, 2).substring(0, 500)}`);
+        const queued = await res.json();
+        if (!res.ok) throw new Error(queued.detail || res.statusText);
+        const run = await waitForFlowRun(queued.run_id);
+        const result = run.result || run;
+        alert(`Flow ${run.status} in ${run.elapsed_seconds}s\n\n${JSON.stringify(result.results || {}, null, 2).substring(0, 500)}`);
     } catch (e) {
         alert('Run failed: ' + e.message);
     }
@@ -3845,8 +3957,13 @@ async function startWarRoom() {
                 logsEl.innerHTML += `<p style="color:var(--success-color);">[SYSTEM] Swarm Task Complete!</p>`;
 
                 result.worker_results.forEach(r => {
-                    logsEl.innerHTML += `<p style="color:var(--text-muted);">> Worker ${r.bot_id} finished execution.</p>`;
+                    logsEl.innerHTML += r.status === 'ok'
+                        ? `<p style="color:var(--text-muted);">> Worker ${r.bot_id} finished execution.</p>`
+                        : `<p style="color:var(--danger-color);">> Worker ${r.bot_id} ${r.status}: ${r.error || ''}</p>`;
                 });
+                if (result.usage) {
+                    logsEl.innerHTML += `<p style="color:var(--text-muted);">> ${result.usage.total_tokens} tokens, ~$${result.usage.estimated_cost}${result.budget_exhausted ? ' (budget exhausted)' : ''}</p>`;
+                }
 
                 logsEl.innerHTML += `<div style="margin-top:20px; padding:15px; border-top:1px solid var(--border-color); background:var(--bg-secondary); border-radius:8px;">
                     <h4 style="margin-top:0;">Manager Final Synthesis:</h4>
@@ -3864,25 +3981,30 @@ async function startWarRoom() {
 // ==========================================
 // PHASE 13: ACTIVITY FEED
 // ==========================================
+const ACTIVITY_FEED_LIMIT = 30;
+
+function activityEntryElement(ev) {
+    const div = document.createElement('div');
+    div.className = 'activity-entry';
+    div.style.cssText = 'padding:8px 12px; border-bottom:1px solid var(--border-color); font-size:0.9em;';
+    const ts = new Date(ev.ts).toLocaleTimeString();
+    const icon = { bot_ping: '🤖', flow: '⚙️', macro: '🎬', swarm: '🐝', plugin: '🧩', webhook: '🔗', clipboard: '📋', scheduler: '🗓️' }[ev.type] || '📌';
+    div.innerHTML = `<span style="color:var(--text-muted);">${ts}</span> ${icon} <strong>${ev.type}</strong> — ${ev.detail}`;
+    return div;
+}
+
 async function loadActivityFeed() {
     const container = document.getElementById('activity-feed-list');
     if (!container) return;
     try {
-        const resp = await fetch(`${API_BASE}/activity?limit=30`, { headers: getAuthHeader() });
+        const resp = await fetch(`${API_BASE}/activity?limit=${ACTIVITY_FEED_LIMIT}`, { headers: getAuthHeader() });
         const data = await resp.json();
         container.innerHTML = '';
         if (!data.events || data.events.length === 0) {
             container.innerHTML = '<p style="color:var(--text-muted);">No recent activity.</p>';
             return;
         }
-        data.events.forEach(ev => {
-            const div = document.createElement('div');
-            div.style.cssText = 'padding:8px 12px; border-bottom:1px solid var(--border-color); font-size:0.9em;';
-            const ts = new Date(ev.ts).toLocaleTimeString();
-            const icon = { bot_ping: '🤖', flow: '⚙️', macro: '🎬', swarm: '🐝', plugin: '🧩', webhook: '🔗', clipboard: '📋', scheduler: '🗓️' }[ev.type] || '📌';
-            div.innerHTML = `<span style="color:var(--text-muted);">${ts}</span> ${icon} <strong>${ev.type}</strong> — ${ev.detail}`;
-            container.appendChild(div);
-        });
+        data.events.forEach(ev => container.appendChild(activityEntryElement(ev)));
     } catch (e) {
         if (container) container.innerHTML = '<p style="color:var(--danger-color);">Failed to load activity.</p>';
     }
@@ -4107,8 +4229,100 @@ function initNotificationBell() {
     bell.innerHTML = '🔔<span id="notif-badge" style="position:absolute;top:-5px;right:-8px;background:var(--danger-color);color:#fff;border-radius:50%;font-size:0.6em;padding:2px 5px;display:none;">0</span>';
     bell.onclick = toggleNotifDrawer;
     header.prepend(bell);
-    setInterval(pollNotifications, 15000);
     pollNotifications();
+    subscribeEventStream();
+}
+
+// Push channel: activity + notifications arrive over SSE; fall back to polling if unsupported.
+// EventSource cannot send an Authorization header, so the session token goes in the query.
+let _eventSource = null;
+let _notifPollTimer = null;
+function closeEventStream() {
+    if (_eventSource) {
+        _eventSource.close();
+        _eventSource = null;
+    }
+}
+
+function subscribeEventStream() {
+    closeEventStream();
+    if (!currentUser || !currentUser.session_id) return;
+    if (!window.EventSource) {
+        _notifPollTimer = _notifPollTimer || setInterval(pollNotifications, 15000);
+        return;
+    }
+    const token = encodeURIComponent(currentUser.session_id);
+    _eventSource = new EventSource(`${API_BASE}/stream?topics=notification.*,activity.*,tool.output.*&token=${token}`);
+    // Pushed events are rendered from their payload; only a resync refetches.
+    _eventSource.addEventListener('notification.created', onNotificationPushed);
+    _eventSource.addEventListener('activity.logged', onActivityPushed);
+    _eventSource.addEventListener('tool.output.started', e => onToolOutputEvent('started', e));
+    _eventSource.addEventListener('tool.output.chunk', e => onToolOutputEvent('chunk', e));
+    _eventSource.addEventListener('tool.output.finished', e => onToolOutputEvent('finished', e));
+    _eventSource.addEventListener('resync', () => { pollNotifications(); loadActivityFeed(); });
+    const source = _eventSource;
+    source.onerror = () => {
+        // EventSource reconnects on its own (sending Last-Event-ID); poll meanwhile.
+        if (source.readyState === EventSource.CLOSED) {
+            _notifPollTimer = _notifPollTimer || setInterval(pollNotifications, 15000);
+        }
+    };
+}
+
+function onNotificationPushed(e) {
+    let notif;
+    try { notif = JSON.parse(e.data).data; } catch (err) { return; }
+    const badge = document.getElementById('notif-badge');
+    if (!notif || notif.read || !badge) return;
+    const shown = badge.style.display === 'none' ? 0 : (parseInt(badge.textContent, 10) || 0);
+    badge.textContent = shown + 1;
+    badge.style.display = 'inline';
+}
+
+function onActivityPushed(e) {
+    let entry;
+    try { entry = JSON.parse(e.data).data; } catch (err) { return; }
+    const container = document.getElementById('activity-feed-list');
+    if (!entry || !container) return;
+    if (!container.querySelector('.activity-entry')) container.innerHTML = '';  // drop the empty/error placeholder
+    container.prepend(activityEntryElement(entry));
+    while (container.children.length > ACTIVITY_FEED_LIMIT) container.lastChild.remove();
+}
+
+// Live output of running terminal/SSH tool calls, shown while the bot is still working.
+const TOOL_LIVE_MAX_CHARS = 20000;
+let _toolLiveHideTimer = null;
+function onToolOutputEvent(kind, e) {
+    let data;
+    try { data = JSON.parse(e.data).data || {}; } catch (err) { return; }
+    let panel = document.getElementById('tool-live-output');
+    if (!panel) {
+        panel = document.createElement('div');
+        panel.id = 'tool-live-output';
+        panel.style.cssText = 'position:fixed;bottom:20px;right:20px;width:480px;max-height:260px;background:var(--card-bg);border:1px solid var(--border-color);border-radius:10px;box-shadow:0 8px 32px rgba(0,0,0,0.3);z-index:9998;display:none;flex-direction:column;';
+        panel.innerHTML = '<div style="padding:6px 10px;font-size:0.8em;border-bottom:1px solid var(--border-color);display:flex;justify-content:space-between;"><span id="tool-live-title"></span><span style="cursor:pointer;" onclick="this.parentElement.parentElement.style.display=\'none\'">✕</span></div><pre id="tool-live-body" style="margin:0;padding:8px 10px;overflow-y:auto;font-size:0.75em;white-space:pre-wrap;flex:1;"></pre>';
+        document.body.appendChild(panel);
+    }
+    const title = document.getElementById('tool-live-title');
+    const body = document.getElementById('tool-live-body');
+    if (kind === 'started') {
+        clearTimeout(_toolLiveHideTimer);
+        panel.dataset.outputId = data.output_id;
+        title.textContent = `⏳ ${data.tool}: ${data.label || ''}`.substring(0, 80);
+        body.textContent = '';
+        panel.style.display = 'flex';
+        return;
+    }
+    if (panel.dataset.outputId !== data.output_id) return;
+    if (kind === 'chunk') {
+        body.textContent += data.skipped ? `\n… ${data.skipped} characters skipped …\n` : data.content;
+        if (body.textContent.length > TOOL_LIVE_MAX_CHARS) body.textContent = body.textContent.slice(-TOOL_LIVE_MAX_CHARS);
+        body.scrollTop = body.scrollHeight;
+    } else {
+        const exit = data.exit_status === null || data.exit_status === undefined ? 'stopped' : `exit ${data.exit_status}`;
+        title.textContent = `✔ ${data.tool} (${exit})`;
+        _toolLiveHideTimer = setTimeout(() => { panel.style.display = 'none'; }, 8000);
+    }
 }
 
 async function pollNotifications() {
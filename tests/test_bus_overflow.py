@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.bus import BLOCK, DROP_OLDEST, SAMPLE, bus
+
+
+@pytest.fixture
+def stalled():
+    """A subscriber whose callback is parked on the first event until `gate` is set."""
+    gate = threading.Event()
+    received = []
+    topic = f"test.overflow.{uuid.uuid4().hex[:8]}"
+    subs = []
+
+    def subscribe(**kwargs):
+        def callback(data):
+            received.append(data["n"])
+            gate.wait(5)
+        sub = bus.subscribe(topic, callback, **kwargs)
+        subs.append(sub)
+        bus.publish(topic, {"n": 0})
+        deadline = time.monotonic() + 2
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert received == [0] and sub.depth == 0
+        return sub
+
+    yield topic, subscribe, gate, received
+    gate.set()
+    for sub in subs:
+        bus.unsubscribe(sub)
+
+
+def drain(sub, gate):
+    gate.set()
+    assert sub.wait_idle(2)
+
+
+def test_drop_oldest_keeps_newest(stalled):
+    topic, subscribe, gate, received = stalled
+    sub = subscribe(max_queue=2, overflow=DROP_OLDEST)
+    for n in (1, 2, 3, 4):
+        bus.publish(topic, {"n": n})
+    assert sub.depth == 2
+    drain(sub, gate)
+    assert received == [0, 3, 4]
+    assert bus.get_metrics()["topics"][topic]["dropped"] == 2
+
+
+def test_sample_keeps_every_nth_overflowing_event(stalled):
+    topic, subscribe, gate, received = stalled
+    sub = subscribe(max_queue=2, overflow=SAMPLE, sample_every=2)
+    for n in (1, 2, 3, 4, 5, 6):
+        bus.publish(topic, {"n": n})
+    drain(sub, gate)
+    # 3 and 5 are dropped; 4 and 6 each replace the oldest queued event.
+    assert received == [0, 4, 6]
+    assert bus.get_metrics()["topics"][topic]["dropped"] == 4
+
+
+def test_block_times_out_then_drops(stalled):
+    topic, subscribe, gate, received = stalled
+    sub = subscribe(max_queue=1, overflow=BLOCK)
+    assert sub.offer(topic, {"n": 1}, 0.5)
+    started = time.monotonic()
+    assert not sub.offer(topic, {"n": 2}, 0.1)
+    assert time.monotonic() - started >= 0.1
+    drain(sub, gate)
+    assert received == [0, 1]
+
+
+def test_block_waits_for_room(stalled):
+    topic, subscribe, gate, received = stalled
+    sub = subscribe(max_queue=1, overflow=BLOCK)
+    assert sub.offer(topic, {"n": 1}, 0.5)
+    threading.Timer(0.1, gate.set).start()
+    assert sub.offer(topic, {"n": 2}, 2)
+    assert sub.wait_idle(2)
+    assert received == [0, 1, 2]
+
+
+def test_publish_never_runs_callbacks_inline():
+    topic = f"test.overflow.{uuid.uuid4().hex[:8]}"
+    threads = []
+    sub = bus.subscribe(topic, lambda data: threads.append(threading.current_thread()))
+    try:
+        bus.publish(topic, {"n": 1})
+        assert sub.wait_idle(2)
+        assert threads and threads[0] is not threading.current_thread()
+    finally:
+        bus.unsubscribe(sub)
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        bus.subscribe("test.overflow.bad", lambda data: None, overflow="explode")
+
+
+def test_publish_rate_counts_every_event_in_the_window():
+    topic = f"test.rate.{uuid.uuid4().hex[:8]}"
+    for n in range(3000):
+        bus.publish(topic, {"n": n})
+    stats = bus.get_metrics()["topics"][topic]
+    assert stats["published"] == 3000
+    assert stats["publish_rate_per_sec"] == 50.0  # 3000 / 60s, not capped by a sample buffer
@@ -0,0 +1,96 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.cron import CronSchedule, parse_schedule
+from core.task_scheduler import validate_task
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def fires(expr, start, count=1, tz="UTC"):
+    schedule = parse_schedule(expr, tz)
+    out, ts = [], start
+    for _ in range(count):
+        ts = schedule.next_after(ts)
+        out.append(datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None))
+    return out
+
+
+def test_dom_and_dow_both_restricted_fire_on_either():
+    # Midnight on the 1st OR on Mondays (June 2026: the 1st and the 29th are Mondays).
+    assert fires("0 0 1 * mon", utc(2026, 6, 2), 3) == [
+        datetime(2026, 6, 8), datetime(2026, 6, 15), datetime(2026, 6, 22)]
+    assert fires("0 0 1 * mon", utc(2026, 6, 29, 12), 2) == [datetime(2026, 7, 1), datetime(2026, 7, 6)]
+
+
+def test_star_field_restricts_with_and():
+    # Day-of-month is '*', so only Mondays match.
+    assert fires("0 0 * * 1", utc(2026, 6, 30), 1) == [datetime(2026, 7, 6)]
+    # Day-of-week is '*', so only the 1st matches.
+    assert fires("0 0 1 * *", utc(2026, 6, 2), 1) == [datetime(2026, 7, 1)]
+
+
+def test_sunday_as_0_or_7_and_names():
+    assert fires("0 12 * * 7", utc(2026, 6, 1), 1) == fires("0 12 * * sun", utc(2026, 6, 1), 1) \
+        == [datetime(2026, 6, 7, 12)]
+
+
+def test_steps_ranges_and_macros():
+    assert fires("*/20 9-10 * * *", utc(2026, 6, 1, 9, 30), 4) == [
+        datetime(2026, 6, 1, 9, 40), datetime(2026, 6, 1, 10), datetime(2026, 6, 1, 10, 20),
+        datetime(2026, 6, 1, 10, 40)]
+    assert fires("@monthly", utc(2026, 6, 15), 1) == [datetime(2026, 7, 1)]
+
+
+def test_timezone_wall_clock_across_dst():
+    # 09:00 in New York is 13:00 UTC in summer and 14:00 UTC in winter.
+    assert fires("0 9 * * *", utc(2026, 7, 1), 1, "America/New_York") == [datetime(2026, 7, 1, 13)]
+    assert fires("0 9 * * *", utc(2026, 12, 1), 1, "America/New_York") == [datetime(2026, 12, 1, 14)]
+
+
+def test_skipped_time_fires_once_at_shifted_instant():
+    # 2026-03-08: 02:00-03:00 does not exist in New York; 02:30 runs at 03:30 EDT.
+    assert fires("30 2 * * *", utc(2026, 3, 7, 12), 2, "America/New_York") == [
+        datetime(2026, 3, 8, 7, 30), datetime(2026, 3, 9, 6, 30)]
+
+
+def test_repeated_time_fires_once():
+    # 2026-11-01: 01:00-02:00 happens twice in New York; 01:30 runs only the first time.
+    assert fires("30 1 * * *", utc(2026, 10, 31, 12), 2, "America/New_York") == [
+        datetime(2026, 11, 1, 5, 30), datetime(2026, 11, 2, 6, 30)]
+
+
+def test_leap_day_is_found():
+    assert fires("0 0 29 2 *", utc(2026, 3, 1), 1) == [datetime(2028, 2, 29)]
+
+
+@pytest.mark.parametrize("expr", ["0 0 31 2 *", "0 0 30 2 *", "0 0 31 4,6,9,11 *"])
+def test_schedule_that_never_fires_is_rejected(expr):
+    assert CronSchedule(expr).next_after(utc(2026, 1, 1)) is None
+    with pytest.raises(ValueError, match="never fires"):
+        validate_task(expr)
+
+
+def test_valid_task_schedules_are_accepted():
+    validate_task("0 0 29 2 *")
+    validate_task("0 9 * * 1-5", "Europe/Berlin")
+    validate_task("every_15m")
+
+
+@pytest.mark.parametrize("expr", ["", "* * * *", "60 * * * *", "0 24 * * *", "0 0 0 * *",
+                                  "0 0 * 13 *", "5-1 * * * *", "*/0 * * * *", "every_0m"])
+def test_bad_expressions_raise(expr):
+    with pytest.raises(ValueError):
+        parse_schedule(expr)
+
+
+def test_unknown_timezone_raises():
+    with pytest.raises(ValueError, match="Unknown timezone"):
+        parse_schedule("0 0 * * *", "Mars/Olympus_Mons")
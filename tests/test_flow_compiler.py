@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.flow_compiler import compile_flow, compile_flow_json
+
+
+def node(block_type, **config):
+    return {"type": block_type, "config": config}
+
+
+def flow(nodes, edges):
+    """edges: (from, to) or (from, to, extra_fields) tuples."""
+    return {"nodes": nodes, "edges": [{"from": e[0], "to": e[1], **(e[2] if len(e) > 2 else {})} for e in edges]}
+
+
+def test_valid_flow_has_order_levels_and_ancestors():
+    plan = compile_flow(flow(
+        {"start": node("manual_trigger"), "search": node("web_search", query="wolves"),
+         "ask": node("ai_prompt", prompt="Summarize {{search.results}}"),
+         "out": node("output", message="{{ask.response}} at {{start.timestamp}}")},
+        [("start", "search"), ("search", "ask"), ("ask", "out")]))
+    assert plan.valid, plan.errors
+    assert plan.warnings == []
+    assert plan.order == ["start", "search", "ask", "out"]
+    assert plan.ancestors["out"] == ["start", "search", "ask"]
+    assert plan.is_upstream("start", "out") and not plan.is_upstream("out", "start")
+    assert set(plan.templates) == {"ask", "out"}
+
+
+def test_independent_blocks_share_a_level():
+    plan = compile_flow(flow(
+        {"a": node("manual_trigger"), "b": node("web_search", query="x"), "c": node("web_search", query="y"),
+         "d": node("output", message="done")},
+        [("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")]))
+    assert plan.valid
+    assert [sorted(level) for level in plan.levels] == [["a"], ["b", "c"], ["d"]]
+
+
+def test_cycle_is_an_error():
+    plan = compile_flow(flow({"a": node("manual_trigger"), "b": node("output"), "c": node("output")},
+                             [("a", "b"), ("b", "c"), ("c", "b")]))
+    assert not plan.valid
+    assert any("Cycle detected involving: b, c" in e for e in plan.errors)
+
+
+def test_dangling_edge_and_bad_branch_are_errors():
+    plan = compile_flow(flow({"a": node("condition", field="x"), "b": node("output")},
+                             [("a", "ghost"), ("a", "b", {"branch": "maybe"})]))
+    assert any("unknown node(s): ghost" in e for e in plan.errors)
+    assert any("invalid branch 'maybe'" in e for e in plan.errors)
+
+
+def test_unknown_block_type_and_missing_required_fields():
+    plan = compile_flow(flow({"a": node("teleport"), "b": node("http_request", url="  "),
+                              "c": node("send_telegram", chat_id="1")}, []))
+    assert "Block 'a' has unknown type 'teleport'" in plan.errors
+    assert "Block 'b' (http_request) is missing required field 'url'" in plan.errors
+    assert "Block 'c' (send_telegram) is missing required field 'message'" in plan.errors
+
+
+def test_template_variable_warnings():
+    plan = compile_flow(flow(
+        {"a": node("manual_trigger"), "b": node("web_search", query="x"),
+         "c": node("output", message="{{b.results}}"),
+         "d": node("output", message="{{c.message}} {{b.body}} {{nothing}}")},
+        [("a", "b"), ("a", "d"), ("b", "c")]))
+    assert plan.valid  # variable problems are warnings, not errors
+    assert "d.message: {{c.message}} refers to 'c', which is not upstream of this block" in plan.warnings
+    assert "d.message: {{b.body}} refers to 'b', which is not upstream of this block" in plan.warnings
+    assert "d.message: {{nothing}} is not produced by any upstream block" in plan.warnings
+    assert not any(w.startswith("c.message") for w in plan.warnings)
+
+
+def test_unknown_output_key_of_upstream_block_warns():
+    plan = compile_flow(flow({"a": node("web_search", query="x"), "b": node("output", message="{{a.body}}")},
+                             [("a", "b")]))
+    assert plan.warnings == ["b.message: {{a.body}} is not an output of 'a'"]
+
+
+def test_non_object_flow_data_is_an_error():
+    assert not compile_flow_json("[1, 2]").valid
+
+
+def test_invalid_json_raises():
+    with pytest.raises(ValueError, match="valid JSON"):
+        compile_flow_json("{not json")
+
+
+def test_plans_are_cached_by_content():
+    data = flow({"a": node("manual_trigger"), "b": node("output", message="hi")}, [("a", "b")])
+    text = json.dumps(data)
+    assert compile_flow_json(text) is compile_flow_json(text)
+    assert compile_flow(data) is compile_flow(json.loads(text))
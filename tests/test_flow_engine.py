@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core import flow_engine
+from core.flow_engine import FlowEngine
+
+
+def node(block_type, **config):
+    return {"type": block_type, "config": config}
+
+
+def flow(nodes, edges, **extra):
+    """edges: (from, to) or (from, to, branch) tuples."""
+    return {"nodes": nodes, "edges": [{"from": e[0], "to": e[1], **({"branch": e[2]} if len(e) > 2 else {})}
+                                      for e in edges], **extra}
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """Stub terminal_command: runs `handlers[command](context)` and records the call order."""
+    calls = []
+    handlers = {}
+
+    def run(config, context, bot_id):
+        command = config["command"]
+        calls.append(command)
+        handler = handlers.get(command)
+        return handler(context) if handler else {"output": command}
+
+    monkeypatch.setitem(flow_engine.BLOCK_EXECUTORS, "terminal_command", run)
+    return calls, handlers
+
+
+def fan_out(width, **extra):
+    """start -> b0..b{width-1} -> out"""
+    branches = {f"b{i}": node("terminal_command", command=f"b{i}") for i in range(width)}
+    return flow({"start": node("manual_trigger"), **branches, "out": node("output", message="done")},
+                [("start", b) for b in branches] + [(b, "out") for b in branches], **extra)
+
+
+def test_independent_branches_run_concurrently(commands):
+    _, handlers = commands
+    barrier = threading.Barrier(3, timeout=5)  # only passes if all three branches are in flight at once
+    for i in range(3):
+        handlers[f"b{i}"] = lambda ctx: {"output": barrier.wait()}
+
+    result = FlowEngine(fan_out(3, max_parallel=3)).execute()
+
+    assert result["status"] == "completed"
+    assert [e["status"] for e in result["log"]] == ["success"] * 5
+    assert result["results"]["out"] == {"message": "done"}
+
+
+def test_max_parallel_bounds_concurrency(commands):
+    _, handlers = commands
+    lock = threading.Lock()
+    active = [0, 0]  # current, peak
+
+    def busy(ctx):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {"output": "ok"}
+
+    for i in range(6):
+        handlers[f"b{i}"] = busy
+
+    result = FlowEngine(fan_out(6, max_parallel=2)).execute()
+
+    assert result["status"] == "completed"
+    assert active[1] == 2
+
+
+def test_block_sees_only_upstream_results(commands):
+    _, handlers = commands
+    seen = {}
+    handlers["left"] = lambda ctx: {"side": "left"}
+    handlers["right"] = lambda ctx: (time.sleep(0.05), {"side": "right"})[1]
+    handlers["after_left"] = lambda ctx: seen.setdefault("after_left", dict(ctx))
+
+    FlowEngine(flow({"start": node("manual_trigger"), "left": node("terminal_command", command="left"),
+                     "right": node("terminal_command", command="right"),
+                     "after_left": node("terminal_command", command="after_left")},
+                    [("start", "left"), ("start", "right"), ("left", "after_left")])).execute()
+
+    assert seen["after_left"]["left.side"] == "left"
+    assert not any(k.startswith("right.") for k in seen["after_left"])
+
+
+def branching_flow(value):
+    """check (IF ready == yes) -> yes / no; both sides join at out; no_tail hangs off no only."""
+    return flow({"start": node("manual_trigger"), "seed": node("terminal_command", command="seed"),
+                 "check": node("condition", field="ready", operator="==", value=value),
+                 "yes": node("terminal_command", command="yes"), "no": node("terminal_command", command="no"),
+                 "no_tail": node("terminal_command", command="no_tail"),
+                 "out": node("output", message="done")},
+                [("start", "seed"), ("seed", "check"), ("check", "yes", "true"), ("check", "no", "false"),
+                 ("no", "no_tail"), ("yes", "out"), ("no", "out")])
+
+
+@pytest.mark.parametrize("value, taken, dead", [("yes", "yes", ["no", "no_tail"]),
+                                                ("nope", "no", ["yes"])])
+def test_if_runs_only_the_selected_branch(commands, value, taken, dead):
+    calls, handlers = commands
+    handlers["seed"] = lambda ctx: {"ready": "yes"}
+
+    result = FlowEngine(branching_flow(value)).execute()
+
+    status = {e["node_id"]: e["status"] for e in result["log"]}
+    assert result["status"] == "completed"
+    assert taken in calls and not set(dead) & set(calls)
+    assert all(status[nid] == "skipped" for nid in dead)
+    assert status["out"] == "success"  # an OR-join runs if any branch reached it
+
+
+def test_skipped_subgraph_is_checkpointed(commands):
+    _, handlers = commands
+    handlers["seed"] = lambda ctx: {"ready": "yes"}
+    steps = []
+
+    FlowEngine(branching_flow("yes"),
+               on_step=lambda entry, result: steps.append((entry["node_id"], entry["status"]))).execute()
+
+    assert ("no", "skipped") in steps and ("no_tail", "skipped") in steps
+    assert steps.index(("no", "skipped")) < steps.index(("no_tail", "skipped"))
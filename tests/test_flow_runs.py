@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core import flow_engine, flow_runs, local_db
+from core.flow_runner import FlowRunner
+
+
+FLOW = {"nodes": {"start": {"type": "manual_trigger", "config": {}},
+                  "fetch": {"type": "terminal_command", "config": {"command": "fetch"}},
+                  "build": {"type": "terminal_command", "config": {"command": "build"}},
+                  "ship": {"type": "terminal_command", "config": {"command": "ship"}}},
+        "edges": [{"from": "start", "to": "fetch"}, {"from": "fetch", "to": "build"},
+                  {"from": "build", "to": "ship"}]}
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_db, "DB_PATH", str(tmp_path / "wolfclaw_local.db"))
+    local_db.init_db()
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """Stub terminal_command: `failing` commands return an error; every call is recorded."""
+    calls = []
+    failing = set()
+
+    def run(config, context, bot_id):
+        command = config["command"]
+        calls.append(command)
+        if command in failing:
+            return {"error": f"{command} broke"}
+        return {"output": command}
+
+    monkeypatch.setitem(flow_engine.BLOCK_EXECUTORS, "terminal_command", run)
+    return calls, failing
+
+
+def test_failed_run_resumes_from_its_checkpoints(commands):
+    calls, failing = commands
+    failing.add("build")
+    run_id = flow_runs.create_run("f1", "ws", FLOW)
+
+    first = flow_runs.execute_run(run_id)
+
+    assert first["status"] == "failed"
+    assert calls == ["fetch", "build", "ship"]
+    steps = {s["node_id"]: s["status"] for s in local_db.get_flow_steps(run_id)}
+    assert steps == {"start": "success", "fetch": "success", "build": "error", "ship": "success"}
+
+    failing.clear()
+    del calls[:]
+    flow_runs.check_resumable(local_db.get_flow_run(run_id))
+    second = flow_runs.execute_run(run_id, resume=True)
+
+    assert second["status"] == "completed" and second["attempt"] == 2
+    # fetch is restored, not executed (and paid for) again; ship reruns because build did.
+    assert calls == ["build", "ship"]
+    status = {e["node_id"]: e["status"] for e in second["log"]}
+    assert status["start"] == status["fetch"] == "restored"
+    assert local_db.get_flow_run(run_id)["status"] == "completed"
+
+
+def test_completed_run_is_not_resumable(commands):
+    run_id = flow_runs.create_run("f1", "ws", FLOW)
+    flow_runs.execute_run(run_id)
+
+    with pytest.raises(ValueError):
+        flow_runs.check_resumable(local_db.get_flow_run(run_id))
+
+
+def test_checkpoint_is_ignored_when_an_upstream_step_reruns(commands):
+    calls, _ = commands
+    # fetch has no checkpoint, so build's saved result is stale and it runs again.
+    engine = flow_engine.FlowEngine(FLOW, completed={"start": {"triggered": True}, "build": {"output": "old"}})
+
+    result = engine.execute()
+
+    assert calls == ["fetch", "build", "ship"]
+    assert result["results"]["build"] == {"output": "build"}
+
+
+def delayed(seconds):
+    """start -> fetch -> wait(seconds) -> ship, with notify as an independent branch."""
+    return {"nodes": {"start": {"type": "manual_trigger", "config": {}},
+                      "fetch": {"type": "terminal_command", "config": {"command": "fetch"}},
+                      "wait": {"type": "delay", "config": {"seconds": seconds}},
+                      "ship": {"type": "terminal_command", "config": {"command": "ship"}},
+                      "notify": {"type": "terminal_command", "config": {"command": "notify"}}},
+            "edges": [{"from": "start", "to": "fetch"}, {"from": "fetch", "to": "wait"},
+                      {"from": "wait", "to": "ship"}, {"from": "start", "to": "notify"}]}
+
+
+def test_delay_parks_the_run_instead_of_sleeping(commands):
+    calls, _ = commands
+    run_id = flow_runs.create_run("f1", "ws", delayed(3600))
+
+    started = time.time()
+    result = flow_runs.execute_run(run_id, park_delays=True)
+
+    assert time.time() - started < 5
+    assert result["status"] == "parked"
+    assert sorted(calls) == ["fetch", "notify"]  # the independent branch still ran
+    assert started + 3600 <= result["resume_at"] <= time.time() + 3600
+    run = local_db.get_flow_run(run_id)
+    assert run["status"] == "parked" and run["resume_at"] == result["resume_at"]
+    assert local_db.get_waiting_flow_steps(run_id) == {"wait": result["resume_at"]}
+    with pytest.raises(ValueError):
+        flow_runs.check_resumable(run)
+
+
+def test_parked_run_continues_after_its_deadline(commands):
+    calls, _ = commands
+    run_id = flow_runs.create_run("f1", "ws", delayed(0.05))
+    assert flow_runs.execute_run(run_id, park_delays=True)["status"] == "parked"
+
+    del calls[:]
+    time.sleep(0.1)
+    result = flow_runs.execute_run(run_id, park_delays=True)
+
+    assert result["status"] == "completed" and result["attempt"] == 1
+    assert calls == ["ship"]
+    steps = {s["node_id"]: s["status"] for s in local_db.get_flow_steps(run_id)}
+    assert steps["wait"] == "success" and steps["ship"] == "success"
+
+
+def test_runner_continues_a_parked_run_from_its_timer(commands):
+    calls, _ = commands
+    runner = FlowRunner(max_workers=1)
+    run_id = runner.submit("f1", "ws", delayed(0.2))
+
+    deadline = time.time() + 5
+    while local_db.get_flow_run(run_id)["status"] != "completed" and time.time() < deadline:
+        time.sleep(0.02)
+
+    assert local_db.get_flow_run(run_id)["status"] == "completed"
+    assert sorted(calls) == ["fetch", "notify", "ship"]
+    assert runner.get_metrics()["parked_total"] == 1
@@ -0,0 +1,184 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+pytest.importorskip("paramiko")
+
+from core import ssh_pool as ssh_pool_module
+from core.ssh_pool import SSHPool
+
+_READ_FD, _WRITE_FD = os.pipe()  # never written: select() on it just times out
+
+
+class FakeChannel:
+    """Scripted exec channel: `chunks` are (seconds_after_exec, stream, bytes)."""
+
+    def __init__(self, chunks=(), exit_after=None, eof_after=None, endless=False):
+        self.chunks = list(chunks)
+        self.exit_after = exit_after
+        self.eof_after = eof_after if eof_after is not None else exit_after
+        self.endless = endless
+        self.closed = False
+        self.started = None
+
+    def _elapsed(self):
+        return time.monotonic() - self.started
+
+    def _due(self, stream):
+        return [c for c in self.chunks if c[1] == stream and self._elapsed() >= c[0]]
+
+    def exec_command(self, command):
+        self.started = time.monotonic()
+
+    def recv_ready(self):
+        return self.endless or bool(self._due("stdout"))
+
+    def recv(self, n):
+        if self.endless:
+            return b"y\n" * 64
+        chunk = self._due("stdout")[0]
+        self.chunks.remove(chunk)
+        return chunk[2]
+
+    def recv_stderr_ready(self):
+        return bool(self._due("stderr"))
+
+    def recv_stderr(self, n):
+        chunk = self._due("stderr")[0]
+        self.chunks.remove(chunk)
+        return chunk[2]
+
+    def exit_status_ready(self):
+        return self.exit_after is not None and self._elapsed() >= self.exit_after
+
+    @property
+    def eof_received(self):
+        return self.eof_after is not None and self._elapsed() >= self.eof_after
+
+    def recv_exit_status(self):
+        return 0
+
+    def fileno(self):
+        return _READ_FD
+
+
+def pool_with(channel):
+    pool = SSHPool()
+
+    @contextmanager
+    def session(*args, **kwargs):
+        yield channel
+    pool.session = session
+    return pool
+
+
+def collect(pool, **kwargs):
+    out = {"stdout": [], "stderr": []}
+    status = pool.stream("host", "cmd", lambda name, text: out[name].append(text), password="pw", **kwargs)
+    return status, "".join(out["stdout"]), "".join(out["stderr"])
+
+
+def test_endless_output_still_hits_the_deadline():
+    pool = pool_with(FakeChannel(endless=True))
+    started = time.monotonic()
+    status, stdout, _ = collect(pool, timeout=1)
+    assert status is None
+    assert time.monotonic() - started < 2
+    assert stdout.startswith("y\n")
+
+
+def test_endless_output_honors_cancel():
+    pool = pool_with(FakeChannel(endless=True))
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.monotonic()
+    status, _, _ = collect(pool, timeout=30, cancel_event=cancel)
+    assert status is None
+    assert time.monotonic() - started < 1.5
+
+
+def test_output_after_exit_status_is_drained_until_eof():
+    channel = FakeChannel(chunks=[(0.0, "stdout", b"a"), (0.3, "stdout", b"late \xe2\x82"),
+                                  (0.4, "stdout", b"\xac end"), (0.35, "stderr", b"warn")],
+                          exit_after=0.1, eof_after=0.5)
+    status, stdout, stderr = collect(pool_with(channel), timeout=5)
+    assert status == 0
+    assert stdout == "alate € end"  # multibyte character split across chunks
+    assert stderr == "warn"
+
+
+def test_silent_command_times_out():
+    status, _, _ = collect(pool_with(FakeChannel()), timeout=0.5)
+    assert status is None
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def is_authenticated(self):
+        return True
+
+    def send_ignore(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SSHPool(idle_timeout=0.05)
+    connects = []
+
+    def connect(key, *args):
+        time.sleep(0.05)  # long enough for concurrent callers to pile up
+        connects.append(key)
+        return ssh_pool_module._Connection(key, FakeClient())
+    monkeypatch.setattr(pool, "_connect", connect)
+    monkeypatch.setattr(pool, "_schedule_reap", lambda: None)
+    pool.connects = connects
+    yield pool
+    pool.close_all()
+
+
+def test_concurrent_callers_share_one_connection(pool):
+    conns = []
+    threads = [threading.Thread(target=lambda: conns.append(pool._acquire("h", 22, "u", "pw", "", 5)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(pool.connects) == 1
+    assert len({id(c) for c in conns}) == 1 and conns[0].active == 8
+
+
+def test_dead_connection_is_replaced_and_gates_are_dropped(pool):
+    conn = pool._acquire("h", 22, "u", "pw", "", 5)
+    pool._release(conn)
+    conn.transport.active = False
+    replacement = pool._acquire("h", 22, "u", "pw", "", 5)
+    assert replacement is not conn and len(pool.connects) == 2
+    pool._release(replacement)
+    assert len(pool._connecting) == 1  # kept while the connection is pooled
+    time.sleep(0.1)
+    assert pool.reap() == 1
+    assert not pool._conns and not pool._connecting
@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+orchestrator = pytest.importorskip("core.orchestrator")
+
+
+def reply(text):
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+class FakeEngine:
+    """Stands in for WolfEngine; `behaviours[bot_id](prompt, on_token, cancel_event)` returns the reply text."""
+
+    def __init__(self, behaviours, log):
+        self.behaviours = behaviours
+        self.log = log
+
+    def chat(self, messages, system_prompt=None, bot_id=None, on_token=None, cancel_event=None,
+             shared_context=None):
+        prompt = messages[-1]["content"]
+        self.log.append(("start", bot_id, time.monotonic()))
+        try:
+            return reply(self.behaviours[bot_id](prompt, on_token, cancel_event))
+        finally:
+            self.log.append(("end", bot_id, time.monotonic()))
+
+
+@pytest.fixture
+def war_room(monkeypatch):
+    """Builds an orchestrator over bots a, b, c whose engines run `behaviours`; returns (run_plan, log)."""
+    bots = {bid: {"name": bid.upper(), "model": "stub", "prompt": f"You are {bid}."} for bid in ("mgr", "a", "b", "c")}
+    monkeypatch.setattr(orchestrator, "get_bots", lambda user_id=None: bots)
+    log = []
+
+    def run_plan(plan, behaviours, on_token=None, cancel_event=None, **options):
+        room = orchestrator.MultiAgentOrchestrator("mgr", ["a", "b", "c"], **options)
+        room._engine = lambda profile: FakeEngine(behaviours, log)
+        events = []
+        plan = [dict(item, depends_on=item.get("depends_on", [])) for item in plan]
+        results, failures = room._execute_plan(plan, "shared", events.append, [], on_token=on_token,
+                                               cancel_event=cancel_event)
+        return results, failures, events
+
+    return run_plan, log
+
+
+def started(log, bot_id):
+    return next(t for kind, b, t in log if kind == "start" and b == bot_id)
+
+
+def ended(log, bot_id):
+    return next(t for kind, b, t in log if kind == "end" and b == bot_id)
+
+
+def test_dependent_task_waits_for_and_receives_its_dependency(war_room):
+    run_plan, log = war_room
+    barrier = threading.Barrier(2, timeout=5)  # a and c must be in flight together
+    prompts = {}
+
+    def a(prompt, on_token, cancel):
+        barrier.wait()
+        return "42 wolves"
+
+    def b(prompt, on_token, cancel):
+        prompts["b"] = prompt
+        return "counted"
+
+    def c(prompt, on_token, cancel):
+        barrier.wait()
+        return "mapped"
+
+    results, failures, _ = run_plan([{"id": "t1", "agent_id": "a", "task": "count"},
+                                     {"id": "t2", "agent_id": "b", "task": "report", "depends_on": ["t1"]},
+                                     {"id": "t3", "agent_id": "c", "task": "map"}],
+                                    {"a": a, "b": b, "c": c})
+
+    assert failures == []
+    assert [r["result"] for r in results] == ["42 wolves", "counted", "mapped"]
+    assert started(log, "b") >= ended(log, "a")
+    assert "42 wolves" in prompts["b"]
+
+
+def test_failed_dependency_skips_its_dependents(war_room):
+    run_plan, log = war_room
+
+    def a(prompt, on_token, cancel):
+        raise RuntimeError("provider down")
+
+    results, failures, _ = run_plan([{"id": "t1", "agent_id": "a", "task": "count"},
+                                     {"id": "t2", "agent_id": "b", "task": "report", "depends_on": ["t1"]},
+                                     {"id": "t3", "agent_id": "c", "task": "map"}],
+                                    {"a": a, "b": lambda *args: "unreachable", "c": lambda *args: "mapped"})
+
+    assert [r["agent"] for r in results] == ["C"]
+    errors = {f["agent"]: f["error"] for f in failures}
+    assert "provider down" in errors["A"]
+    assert errors["B"].startswith("Skipped: depends on failed task(s) t1")
+    assert not any(b == "b" for _, b, _ in log)
+
+
+def test_timed_out_agent_is_stopped_and_its_tokens_dropped(war_room):
+    run_plan, _ = war_room
+    tokens = []
+    saw_cancel = threading.Event()
+
+    def slow(prompt, on_token, cancel):
+        on_token("thinking")
+        while not cancel.is_set():
+            time.sleep(0.01)
+        saw_cancel.set()
+        on_token("too late")
+        raise orchestrator.ChatCancelled("Chat cancelled.")
+
+    begin = time.monotonic()
+    results, failures, events = run_plan([{"id": "t1", "agent_id": "a", "task": "ponder"},
+                                          {"id": "t2", "agent_id": "b", "task": "answer"}],
+                                         {"a": slow, "b": lambda *args: "done"},
+                                         on_token=lambda task_id, name: tokens.append, agent_timeout=0.2)
+
+    assert time.monotonic() - begin < 2
+    assert [r["result"] for r in results] == ["done"]
+    assert failures[0]["agent"] == "A" and failures[0]["error"].startswith("Timed out")
+    assert saw_cancel.wait(2)
+    assert tokens == ["thinking"]
+    assert any(e["type"] == "error" and e["task_id"] == "t1" for e in events)
+
+
+def test_circular_dependencies_fail_instead_of_hanging(war_room):
+    run_plan, log = war_room
+
+    results, failures, _ = run_plan([{"id": "t1", "agent_id": "a", "task": "x", "depends_on": ["t2"]},
+                                     {"id": "t2", "agent_id": "b", "task": "y", "depends_on": ["t1"]}],
+                                    {"a": lambda *args: "x", "b": lambda *args: "y"})
+
+    assert results == [] and log == []
+    assert all("circular" in f["error"] for f in failures)